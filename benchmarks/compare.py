@@ -0,0 +1,56 @@
+"""
+Compare two benchmark results written by benchmarks/run.py.
+
+    py ./benchmarks/compare.py benchmarks/results/old.json benchmarks/results/new.json
+
+Prints the median of each case in both, and how many times slower the new one is.
+With --stages, each stage gets a line of its own. Exits with 1 if any case got
+slower than --threshold times its old median.
+"""
+import argparse
+import json
+import sys
+
+
+def load(path: str) -> dict:
+    with open(path, encoding="utf_8") as f:
+        report = json.load(f)
+    return {case["name"]: case for case in report["cases"]}
+
+
+def ratio(old: float, new: float) -> float:
+    return new / old if old else float("inf")
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Compare two pytago benchmark results")
+    parser.add_argument("old")
+    parser.add_argument("new")
+    parser.add_argument("--stages", action="store_true", help="compare each stage as well")
+    parser.add_argument("--threshold", type=float, default=1.25, help="ratio above which a case has regressed")
+    args = parser.parse_args()
+
+    old, new = load(args.old), load(args.new)
+    regressions = []
+    print(f"{'case':<48} {'old (s)':>9} {'new (s)':>9} {'ratio':>7}")
+    for name, case in new.items():
+        before = old.get(name)
+        if before is None or "median" not in before or "median" not in case:
+            continue
+        r = ratio(before["median"], case["median"])
+        flag = "  <-- slower" if r > args.threshold else ""
+        print(f"{name:<48} {before['median']:>9.3f} {case['median']:>9.3f} {r:>7.2f}{flag}")
+        if flag:
+            regressions.append(name)
+        if args.stages:
+            for stage, seconds in case["stages"].items():
+                if stage in before["stages"]:
+                    print(f"  {stage:<46} {before['stages'][stage]:>9.3f} {seconds:>9.3f} "
+                          f"{ratio(before['stages'][stage], seconds):>7.2f}")
+    if regressions:
+        print(f"{len(regressions)} case(s) slower than {args.threshold}x: {', '.join(regressions)}")
+        sys.exit(1)
+
+
+if __name__ == '__main__':
+    main()
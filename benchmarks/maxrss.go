@@ -0,0 +1,37 @@
+// Runs a command and writes its peak memory and wall-clock time to a file, for runtime.py:
+//
+//	maxrss OUTFILE COMMAND [ARG...]
+//
+// OUTFILE gets "<ru_maxrss> <nanoseconds>". A program started straight from Python
+// inherits Python's resident set size as its ru_maxrss, since that's what it had when
+// it called exec; started from here, it only inherits this program's couple of megabytes.
+package main
+
+import (
+	"fmt"
+	"os"
+	"os/exec"
+	"syscall"
+	"time"
+)
+
+func main() {
+	cmd := exec.Command(os.Args[2], os.Args[3:]...)
+	cmd.Stdin, cmd.Stdout, cmd.Stderr = os.Stdin, os.Stdout, os.Stderr
+	start := time.Now()
+	err := cmd.Run()
+	elapsed := time.Since(start)
+	if cmd.ProcessState == nil {
+		fmt.Fprintln(os.Stderr, err)
+		os.Exit(127)
+	}
+	usage := cmd.ProcessState.SysUsage().(*syscall.Rusage)
+	if err := os.WriteFile(os.Args[1], []byte(fmt.Sprintf("%d %d", usage.Maxrss, elapsed.Nanoseconds())), 0o644); err != nil {
+		fmt.Fprintln(os.Stderr, err)
+		os.Exit(127)
+	}
+	if status, ok := cmd.ProcessState.Sys().(syscall.WaitStatus); ok && status.Signaled() {
+		os.Exit(128 + int(status.Signal()))
+	}
+	os.Exit(cmd.ProcessState.ExitCode())
+}
@@ -0,0 +1,151 @@
+"""
+Time python_to_go on every example and on modules of a few sizes from pytago.synthetic.
+
+    py ./benchmarks/run.py                        # everything, written to benchmarks/results/
+    py ./benchmarks/run.py --compile-only         # stop short of the go toolchain
+    py ./benchmarks/run.py -k fstrings -k lines_1000 -o out.json
+
+Each case is transpiled --repeat times (--synthetic-repeat for the generated ones,
+which take much longer), and the median is kept along with how long each stage
+took in that run. Results are written as JSON, which benchmarks/compare.py can
+diff against an earlier run.
+"""
+import argparse
+import datetime
+import fnmatch
+import glob
+import json
+import os
+import platform
+import statistics
+import subprocess
+import sys
+import time
+import warnings
+
+ROOT = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+sys.path.insert(0, ROOT)
+
+import pytago
+from pytago.core import python_to_compilation_code, python_to_go
+from pytago.metrics import recording_stages
+from pytago.synthetic import generate_lines
+
+EXAMPLES_PATH = os.path.join(ROOT, "examples")
+RESULTS_PATH = os.path.join(ROOT, "benchmarks", "results")
+DEFAULT_SIZES = (1000, 10000, 100000)
+
+def cases(sizes, **shape) -> list[tuple[str, str, bool]]:
+    """(name, source, synthetic) for every benchmark, with the generated ones of the given shape"""
+    found = []
+    for path in sorted(glob.glob(os.path.join(EXAMPLES_PATH, "*.py"))):
+        with open(path, encoding="utf_8") as f:
+            found.append((f"examples/{os.path.basename(path)[:-3]}", f.read(), False))
+    for size in sizes:
+        found.append((f"synthetic/lines_{size}", generate_lines(size, **shape), True))
+    return found
+
+
+def measure(python: str, compile_only: bool, jobs=None) -> tuple[float, dict[str, float]]:
+    transpile = python_to_compilation_code if compile_only else python_to_go
+    with recording_stages() as stages:
+        start = time.perf_counter()
+        transpile(python, jobs=jobs)
+        seconds = time.perf_counter() - start
+    return seconds, stages
+
+
+def run_case(name: str, python: str, repeat: int, compile_only: bool, jobs=None) -> dict:
+    result = {"name": name, "lines": python.count("\n") + 1, "runs": [], "stages": {}, "error": None}
+    stage_runs = []
+    for _ in range(repeat):
+        try:
+            seconds, stages = measure(python, compile_only, jobs)
+        except Exception as e:
+            result["error"] = f"{type(e).__name__}: {e}"
+            break
+        result["runs"].append(seconds)
+        stage_runs.append(stages)
+    if result["runs"]:
+        result["min"] = min(result["runs"])
+        result["median"] = statistics.median(result["runs"])
+        # The stages of the median run, so that they add up to about the median
+        median_run = sorted(range(len(result["runs"])), key=result["runs"].__getitem__)[len(result["runs"]) // 2]
+        result["stages"] = stage_runs[median_run]
+    return result
+
+
+def git_commit() -> tuple[str, bool]:
+    try:
+        commit = subprocess.check_output(["git", "rev-parse", "HEAD"], cwd=ROOT, text=True,
+                                         stderr=subprocess.DEVNULL).strip()
+        dirty = bool(subprocess.check_output(["git", "status", "--porcelain", "--untracked-files=no"], cwd=ROOT,
+                                             text=True, stderr=subprocess.DEVNULL).strip())
+    except (OSError, subprocess.CalledProcessError):
+        return "unknown", False
+    return commit, dirty
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Benchmark pytago on its examples and on generated modules")
+    parser.add_argument("-k", dest="patterns", action="append", default=[],
+                        help="only run cases whose name matches this glob (may be repeated)")
+    parser.add_argument("-r", "--repeat", type=int, default=5, help="runs of each example")
+    parser.add_argument("--synthetic-repeat", type=int, default=1, help="runs of each generated module")
+    parser.add_argument("--sizes", type=lambda s: [int(x) for x in s.split(",") if x],
+                        default=list(DEFAULT_SIZES), help="lines in each generated module, comma separated")
+    parser.add_argument("--depth", type=int, default=2, help="how deeply blocks nest in generated functions")
+    parser.add_argument("--locals", type=int, default=4, help="locals in each generated function")
+    parser.add_argument("--call-density", type=float, default=0.2,
+                        help="the chance of each generated statement being a call")
+    parser.add_argument("--seed", type=int, default=0, help="seed for the generated modules")
+    parser.add_argument("--compile-only", action="store_true",
+                        help="time up to the Go program that prints the code, without the go toolchain")
+    parser.add_argument("-j", "--jobs", type=int, default=None, help="transform in this many processes")
+    parser.add_argument("-o", "--output", help="where to write the results (default: benchmarks/results/)")
+    args = parser.parse_args()
+    # The transpiler warns about everything it can't infer a type for, which would drown out the results
+    warnings.simplefilter("ignore")
+
+    commit, dirty = git_commit()
+    started = datetime.datetime.now(datetime.timezone.utc)
+    report = {
+        "commit": commit,
+        "dirty": dirty,
+        "version": pytago.__version__,
+        "python": platform.python_version(),
+        "platform": platform.platform(),
+        "started": started.isoformat(timespec="seconds"),
+        "compile_only": args.compile_only,
+        "jobs": args.jobs,
+        "shape": {"depth": args.depth, "locals": args.locals, "call_density": args.call_density, "seed": args.seed},
+        "cases": [],
+    }
+    try:
+        for name, python, synthetic in cases(args.sizes, depth=args.depth, locals_per_function=args.locals,
+                                             call_density=args.call_density, seed=args.seed):
+            if args.patterns and not any(fnmatch.fnmatch(name, "*" + p + "*") for p in args.patterns):
+                continue
+            result = run_case(name, python, args.synthetic_repeat if synthetic else args.repeat, args.compile_only,
+                              args.jobs)
+            report["cases"].append(result)
+            if result["error"]:
+                print(f"{name:<40} {result['error']}", flush=True)
+            else:
+                stages = "  ".join(f"{stage}={seconds:.3f}" for stage, seconds in result["stages"].items())
+                print(f"{name:<40} {result['median']:>9.3f}s  {stages}", flush=True)
+    except KeyboardInterrupt:
+        # Keep what's been measured so far
+        report["interrupted"] = True
+
+    output = args.output
+    if output is None:
+        os.makedirs(RESULTS_PATH, exist_ok=True)
+        output = os.path.join(RESULTS_PATH, f"{started:%Y%m%dT%H%M%S}-{commit[:12]}.json")
+    with open(output, "w", encoding="utf_8") as f:
+        json.dump(report, f, indent=2)
+    print(f"wrote {output}")
+
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,241 @@
+"""
+Run every example both ways, as Python and as its Go in examples/*.go, and compare.
+
+    py ./benchmarks/runtime.py                    # everything, written to benchmarks/results/
+    py ./benchmarks/runtime.py -k loops -k fstrings -o out.json
+
+Examples whose output isn't the same on every run (randomness, timecode, input, ...)
+are skipped, as are ones that fail under Python. The rest are run --repeat times
+each way, in a scratch directory with nothing on stdin, and their stdout has to
+match. For each one the median wall-clock time and the peak memory of both are
+kept, along with Go's as a ratio of Python's.
+
+To tell which snippets from py_snippets.py and ast_snippets.py make for slow Go, every
+example is also transpiled to see which snippets it expands. Each snippet is then
+reported with the geometric mean of the time ratios of the examples that use it.
+
+Needs the go toolchain on the PATH. Peak memory is the ru_maxrss of each run, which
+is only measured on POSIX systems. Runs are started by a small Go program,
+benchmarks/maxrss.go, since anything started straight from here would count this
+process's memory as its own. Its couple of megabytes are the least any run is
+reported to use.
+"""
+import argparse
+import datetime
+import fnmatch
+import glob
+import json
+import math
+import os
+import platform
+import shutil
+import signal
+import statistics
+import subprocess
+import sys
+import tempfile
+import time
+import warnings
+from typing import Optional
+
+ROOT = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+sys.path.insert(0, ROOT)
+
+import pytago
+from pytago.core import python_to_compilation_code
+from pytago.metrics import recording_snippets
+from run import EXAMPLES_PATH, RESULTS_PATH, git_commit
+
+# ru_maxrss is in bytes on macOS and kilobytes everywhere else
+MAXRSS_UNIT = 1 if sys.platform == "darwin" else 1024
+
+
+class Run:
+    def __init__(self, stdout: bytes, returncode: int, seconds: float, peak_memory: Optional[int]):
+        self.stdout = stdout
+        self.returncode = returncode
+        self.seconds = seconds
+        self.peak_memory = peak_memory
+
+
+def run(command: list[str], timeout: float, helper: Optional[str] = None) -> Run:
+    """
+    Run command in a scratch directory of its own, with nothing on stdin. Its peak memory is
+    only measured when it's run through helper, maxrss.go built.
+    """
+    with tempfile.TemporaryDirectory() as cwd, tempfile.TemporaryDirectory() as measurements:
+        usage_path = os.path.join(measurements, "usage")
+        if helper is not None:
+            command = [helper, usage_path, *command]
+        start = time.perf_counter()
+        # In a session of its own, so that timing out kills what the helper started too
+        process = subprocess.Popen(command, cwd=cwd, stdin=subprocess.DEVNULL, stdout=subprocess.PIPE,
+                                   stderr=subprocess.DEVNULL, start_new_session=helper is not None)
+        try:
+            stdout, _ = process.communicate(timeout=timeout)
+        except subprocess.TimeoutExpired:
+            if helper is not None:
+                os.killpg(process.pid, signal.SIGKILL)
+            else:
+                process.kill()
+            process.communicate()
+            raise
+        seconds = time.perf_counter() - start
+        if helper is None or not os.path.exists(usage_path):
+            return Run(stdout, process.returncode, seconds, None)
+        with open(usage_path, encoding="utf_8") as f:
+            maxrss, nanoseconds = map(int, f.read().split())
+        # Timed by the helper, so that starting it isn't counted
+        return Run(stdout, process.returncode, nanoseconds / 1e9, maxrss * MAXRSS_UNIT)
+
+
+def build_helper(build_dir: str) -> Optional[str]:
+    """maxrss.go built into build_dir, or None where there's no ru_maxrss to report"""
+    if os.name != "posix":
+        return None
+    helper = os.path.join(build_dir, "maxrss")
+    subprocess.run(["go", "build", "-o", helper, os.path.join(os.path.dirname(__file__), "maxrss.go")],
+                   cwd=build_dir, check=True)
+    return helper
+
+
+def snippets_used(python: str) -> dict[str, int]:
+    """How many times transpiling python expands each snippet"""
+    with recording_snippets() as snippets:
+        try:
+            python_to_compilation_code(python)
+        except Exception:  # The Go in examples/ is what's measured, so a failure here only costs the attribution
+            pass
+    return snippets
+
+
+def measure(python_path: str, binary: str, repeat: int, timeout: float, helper: Optional[str]) -> dict:
+    result = {"python": {"runs": []}, "go": {"runs": []}, "skipped": None}
+    python_command, go_command = [sys.executable, python_path], [binary]
+
+    first, second = run(python_command, timeout, helper), run(python_command, timeout, helper)
+    if first.returncode:
+        result["skipped"] = f"python exited with {first.returncode}"
+        return result
+    if first.stdout != second.stdout:
+        result["skipped"] = "python's output changes from run to run"
+        return result
+    go = run(go_command, timeout, helper)
+    if go.returncode:
+        result["skipped"] = f"go exited with {go.returncode}"
+        return result
+    if go.stdout != first.stdout:
+        result["skipped"] = "go's output doesn't match python's"
+        result["mismatch"] = {"python": first.stdout.decode(errors="replace"),
+                              "go": go.stdout.decode(errors="replace")}
+        return result
+
+    for language, command in (("python", python_command), ("go", go_command)):
+        runs = [run(command, timeout, helper) for _ in range(repeat)]
+        side = result[language]
+        side["runs"] = [r.seconds for r in runs]
+        side["median"] = statistics.median(side["runs"])
+        memory = [r.peak_memory for r in runs if r.peak_memory is not None]
+        side["peak_memory"] = max(memory) if memory else None
+    result["time_ratio"] = result["go"]["median"] / result["python"]["median"]
+    if result["python"]["peak_memory"] and result["go"]["peak_memory"] is not None:
+        result["memory_ratio"] = result["go"]["peak_memory"] / result["python"]["peak_memory"]
+    return result
+
+
+def run_example(name: str, build_dir: str, repeat: int, timeout: float, helper: Optional[str]) -> dict:
+    python_path = os.path.join(EXAMPLES_PATH, name + ".py")
+    go_path = os.path.join(EXAMPLES_PATH, name + ".go")
+    with open(python_path, encoding="utf_8") as f:
+        result = {"name": name, "snippets": snippets_used(f.read())}
+    if not os.path.exists(go_path):
+        return {**result, "skipped": "no .go to compare with"}
+    binary = os.path.join(build_dir, name)
+    build = subprocess.run(["go", "build", "-o", binary, go_path], cwd=build_dir, capture_output=True, text=True)
+    if build.returncode:
+        return {**result, "skipped": f"go build failed: {build.stderr.strip()}"}
+    try:
+        return {**result, **measure(python_path, binary, repeat, timeout, helper)}
+    except subprocess.TimeoutExpired:
+        return {**result, "skipped": f"took longer than {timeout} seconds"}
+
+
+def by_snippet(examples: list[dict]) -> list[dict]:
+    """Every snippet the measured examples use, with the geometric mean of their time ratios, slowest first"""
+    ratios, users = {}, {}
+    for example in examples:
+        if "time_ratio" not in example:
+            continue
+        for name in example["snippets"]:
+            ratios.setdefault(name, []).append(example["time_ratio"])
+            users.setdefault(name, []).append(example["name"])
+    snippets = [{"name": name, "time_ratio": math.exp(statistics.fmean(map(math.log, ratios[name]))),
+                 "examples": users[name]} for name in ratios]
+    return sorted(snippets, key=lambda s: s["time_ratio"], reverse=True)
+
+
+def _megabytes(n: Optional[int]) -> str:
+    return f"{n / 2 ** 20:.1f}MB" if n is not None else "?"
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Compare the examples' Go with their Python at runtime")
+    parser.add_argument("-k", dest="patterns", action="append", default=[],
+                        help="only run examples whose name matches this glob (may be repeated)")
+    parser.add_argument("-r", "--repeat", type=int, default=5, help="runs of each example, each way")
+    parser.add_argument("-t", "--timeout", type=float, default=60, help="seconds each run may take")
+    parser.add_argument("-o", "--output", help="where to write the results (default: benchmarks/results/)")
+    args = parser.parse_args()
+    if shutil.which("go") is None:
+        parser.error("the go toolchain isn't on the PATH")
+    warnings.simplefilter("ignore")
+
+    commit, dirty = git_commit()
+    started = datetime.datetime.now(datetime.timezone.utc)
+    report = {
+        "commit": commit,
+        "dirty": dirty,
+        "version": pytago.__version__,
+        "python": platform.python_version(),
+        "go": subprocess.run(["go", "version"], capture_output=True, text=True).stdout.strip(),
+        "platform": platform.platform(),
+        "started": started.isoformat(timespec="seconds"),
+        "examples": [],
+    }
+    names = sorted(os.path.basename(path)[:-3] for path in glob.glob(os.path.join(EXAMPLES_PATH, "*.py")))
+    print(f"{'example':<36} {'python (s)':>10} {'go (s)':>9} {'time':>6} {'python':>9} {'go':>9} {'memory':>6}")
+    with tempfile.TemporaryDirectory() as build_dir:
+        helper = build_helper(build_dir)
+        try:
+            for name in names:
+                if args.patterns and not any(fnmatch.fnmatch(name, "*" + p + "*") for p in args.patterns):
+                    continue
+                result = run_example(name, build_dir, args.repeat, args.timeout, helper)
+                report["examples"].append(result)
+                if result["skipped"]:
+                    print(f"{name:<36} skipped: {result['skipped'].splitlines()[0]}", flush=True)
+                    continue
+                py, go = result["python"], result["go"]
+                memory_ratio = f"{result['memory_ratio']:>6.2f}" if "memory_ratio" in result else f"{'?':>6}"
+                print(f"{name:<36} {py['median']:>10.4f} {go['median']:>9.4f} {result['time_ratio']:>6.2f} "
+                      f"{_megabytes(py['peak_memory']):>9} {_megabytes(go['peak_memory']):>9} {memory_ratio}",
+                      flush=True)
+        except KeyboardInterrupt:
+            report["interrupted"] = True
+    report["snippets"] = by_snippet(report["examples"])
+    if report["snippets"]:
+        print(f"\n{'snippet':<48} {'time':>6}  examples")
+        for s in report["snippets"]:
+            print(f"{s['name']:<48} {s['time_ratio']:>6.2f}  {', '.join(s['examples'])}")
+
+    output = args.output
+    if output is None:
+        os.makedirs(RESULTS_PATH, exist_ok=True)
+        output = os.path.join(RESULTS_PATH, f"runtime-{started:%Y%m%dT%H%M%S}-{commit[:12]}.json")
+    with open(output, "w", encoding="utf_8") as f:
+        json.dump(report, f, indent=2)
+    print(f"wrote {output}")
+
+
+if __name__ == '__main__':
+    main()
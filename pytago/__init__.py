@@ -1 +1,3 @@
+__version__ = '0.0.12'
+
 from pytago.core import *
@@ -1,48 +1,152 @@
+import json
 import os
+import threading
+from concurrent.futures import ThreadPoolExecutor, as_completed
+from typing import Callable, Optional
 
-from flask import Flask, request
+from flask import Flask, Response, request
 from flask_cors import CORS
-from pytago.core import python_to_go
+from pytago import service
+from pytago.cache import source_key
+from pytago.metrics import Registry
+from pytago.service import BAD_BATCH_ITEM, PAGE_CACHE_CONTROL, RESULT_CACHE_CONTROL, Representation, batch_item, \
+    batch_limit, errors, failure_response, metrics, observe_stages, port, queue_limit, request_seconds, \
+    requests_in_flight, results, session_turn, syntax_errors, timeout, warmup_corpus, workers
+from pytago.workers import TranspileCancelled, WorkerPool
 
 app = Flask(__name__)
 cors = CORS(app)
-html = None
-port = os.environ.get("PORT", 8080)
+pool = None
+pool_lock = threading.Lock()
+# Batch items wait for the pool here rather than in its queue, so batches can't fill it up by themselves
+batch_executor = ThreadPoolExecutor(max_workers=workers or os.cpu_count() or 1, thread_name_prefix="pytago-batch")
 print(f"localhost link: http://127.0.0.1:{port}")
 
 
 @app.route("/", methods=["GET", "POST"])
 def index():
     if request.method == "GET":
-        global html
-        if html is None:
-            try:
-                # Local
-                with open(os.path.join(app.instance_path.removesuffix("instance"), 'static', 'index.html')) as f:
-                    html = f.read()
-            except FileNotFoundError:
-                # Docker
-                with open(os.path.join(app.instance_path.removesuffix("instance"), 'pytago', 'static', 'index.html')) as f:
-                    html = f.read()
-        return html
-
-    py = (request.get_json() or {}).get("py")
+        return respond(service.page_tag(), PAGE_CACHE_CONTROL, service.index_html)
+
+    body = request.get_json() or {}
+    py = body.get("py")
     if not py:
         return "Bad request", 400
+    with requests_in_flight.track_in_progress(), request_seconds.time(), \
+            session_turn(body.get("session"), body.get("seq")) as cancel:
+        try:
+            key = source_key(py)
+            return respond(service.result_key_tag(key), RESULT_CACHE_CONTROL, lambda: cached_transpile(py, cancel),
+                           service.result_location(key))
+        except Exception as e:
+            errors.inc(error=type(e).__name__)
+            if (failure := failure_response(e)) is None:
+                raise
+            message, status = failure
+            return message, status, {"Retry-After": "1"} if status == 429 else {}
+
+
+@app.route("/result/<key>")
+def result(key):
+    """The result for a source with this source_key, for as long as it's cached"""
+    if not service.is_result_key(key):
+        return "Not found", 404
+    return respond(service.result_key_tag(key), RESULT_CACHE_CONTROL, lambda: results.get(key))
+
+
+@app.route("/batch", methods=["POST"])
+def batch():
+    """
+    Transpile a list of sources, streaming back one JSON object per line as each one finishes:
+    {"index": i, "go": ...} or {"index": i, "error": {"type": ..., "message": ..., "status": ...}}
+    """
+    sources = (request.get_json(silent=True) or {}).get("sources")
+    if not isinstance(sources, list):
+        return "Bad request", 400
+    if len(sources) > batch_limit:
+        return f"At most {batch_limit} sources can be sent at once", 413
+
+    def one(py):
+        if not isinstance(py, str) or not py:
+            return BAD_BATCH_ITEM
+        try:
+            return batch_item(cached_transpile(py))
+        except Exception as e:
+            return batch_item(error=e)
+
+    def stream():
+        with requests_in_flight.track_in_progress(), request_seconds.time():
+            futures = {batch_executor.submit(one, py): i for i, py in enumerate(sources)}
+            for future in as_completed(futures):
+                yield json.dumps({"index": futures[future], **future.result()}) + "\n"
+
+    return Response(stream(), mimetype="application/x-ndjson")
+
+
+def respond(tag: str, cache_control: str, make_body: Callable[[], Optional[str]],
+            location: Optional[str] = None) -> Response:
+    """Answer with make_body()'s result unless the client already has it, or with a 404 if it's None"""
+    representation = Representation(tag, cache_control, request.headers.get("Accept-Encoding"),
+                                     request.headers.get("If-None-Match"), request.method, location)
+    if representation.not_modified:
+        return Response(status=304, headers=representation.headers)
+    if representation.precondition_failed:
+        return Response(status=412, headers=representation.headers)
+    body = make_body()
+    if body is None:
+        return Response("Not found", status=404)
+    data, headers = representation.encode(body)
+    return Response(data, headers=headers, mimetype="text/html")
+
+
+def cached_transpile(py: str, cancel: Optional[threading.Event] = None) -> str:
+    while True:
+        try:
+            return results.get_or_compute(source_key(py), lambda: transpile(py, cancel))
+        except TranspileCancelled:
+            if cancel is not None and cancel.is_set():
+                raise
+            # It was another request's transpilation that got cancelled, so start our own
+
+
+@app.route("/metrics")
+def prometheus_metrics():
+    return metrics.render(), 200, {"Content-Type": Registry.CONTENT_TYPE}
+
+
+@app.route("/healthz")
+def healthz():
+    if not service.is_ready():
+        return "Warming up", 503
+    return "OK"
+
+
+@app.route("/stats")
+def stats():
+    get_pool()
+    return service.stats()
+
+
+def get_pool() -> WorkerPool:
+    global pool
+    with pool_lock:
+        if pool is None:
+            pool = service.backend = WorkerPool(workers, max_queue=queue_limit, on_stages=observe_stages,
+                                                warmup=warmup_corpus())
+        return pool
+
+
+def warm_up():
+    """Start the worker pool and wait for it to finish warming up"""
+    get_pool().wait_ready()
+
+
+def transpile(py: str, cancel: Optional[threading.Event] = None) -> str:
     try:
-        go = python_to_go(py, app.debug)
-        return go
+        return get_pool().transpile(py, app.debug, timeout=timeout, cancel=cancel)
     except SyntaxError as e:
-        import traceback
-        tb = traceback.format_exc()
-        lines = []
-        seen_unknown = False
-        for line in tb.splitlines():
-            if '<unknown>' in line:
-                seen_unknown = True
-            if seen_unknown:
-                lines.append(line)
-        return '\n'.join(lines) or str(e)
+        return service.syntax_error_report(e)
 
 if __name__ == "__main__":
+    get_pool()
     app.run(debug=True, host="0.0.0.0", port=int(port))
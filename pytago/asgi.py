@@ -0,0 +1,368 @@
+"""
+The web app as an ASGI application, for serving with uvicorn:
+
+    uvicorn --workers 1 pytago.asgi:app
+
+It has the same routes, page, configuration and metrics as pytago.app, but answers
+requests on an event loop rather than a thread each, so one process can hold many
+more connections open at once. Transpilations go through python_to_go_async:
+parsing and transforming run in a pool of processes and the go toolchain runs as
+asyncio subprocesses, with PYTAGO_WORKERS of them at a time.
+
+Unlike with pytago.app, a transpilation that times out or gets cancelled only has
+its go toolchain killed; the transforming it was doing runs to completion in its
+worker. Stage timings aren't recorded either.
+"""
+import asyncio
+import inspect
+import json
+import logging
+import multiprocessing
+import os
+import threading
+from concurrent.futures import ProcessPoolExecutor
+from concurrent.futures.process import BrokenProcessPool
+from contextlib import asynccontextmanager
+from typing import Callable, Optional, Sequence
+
+from starlette.applications import Starlette
+from starlette.concurrency import run_in_threadpool
+from starlette.middleware import Middleware
+from starlette.middleware.cors import CORSMiddleware
+from starlette.requests import Request
+from starlette.responses import JSONResponse, PlainTextResponse, Response, StreamingResponse
+from starlette.routing import Route
+
+from pytago import service
+from pytago.cache import SharedCache, source_key
+from pytago.core import python_to_compilation_code, python_to_go_async
+from pytago.metrics import Registry
+from pytago.service import BAD_BATCH_ITEM, PAGE_CACHE_CONTROL, RESULT_CACHE_CONTROL, Representation, batch_item, \
+    batch_limit, errors, failure_response, metrics, queue_limit, request_seconds, requests_in_flight, results, \
+    session_turn, timeout, warmup_corpus, workers
+from pytago.workers import PoolSaturated, TranspileCancelled, TranspileTimeout, WorkerCrashed
+
+logger = logging.getLogger("pytago")
+
+
+def _warm_up_worker(warmup: tuple[str, ...]):
+    for python in warmup:
+        try:
+            python_to_compilation_code(python)
+        except Exception:
+            # They're reported when the same programs are transpiled in full by AsyncTranspiler.start
+            pass
+
+
+class AsyncTranspiler:
+    """
+    python_to_go_async with the same admission control, counters and warm-up as a WorkerPool.
+    At most size transpilations run at once, and at most max_queue more may wait for a turn.
+    """
+    def __init__(self, size: Optional[int] = None, max_queue: Optional[int] = None, warmup: Sequence[str] = ()):
+        self.size = size or os.cpu_count() or 1
+        self.max_queue = max_queue
+        self.warmup = tuple(warmup)
+        # Set once every worker has finished warming up
+        self.ready = threading.Event()
+        self.timeouts = 0
+        self.crashes = 0
+        self.rejections = 0
+        self.cancellations = 0
+        self._admitted = 0
+        self._semaphore = asyncio.Semaphore(self.size)
+        self._executor = self._new_executor()
+
+    def _new_executor(self) -> ProcessPoolExecutor:
+        return ProcessPoolExecutor(self.size, mp_context=multiprocessing.get_context("spawn"),
+                                   initializer=_warm_up_worker, initargs=(self.warmup,))
+
+    async def start(self):
+        """Start every worker, then put the warm-up corpus through the go toolchain too"""
+        loop = asyncio.get_running_loop()
+        # Workers are only started when there's nothing idle to take a task, so this starts all of them
+        await asyncio.gather(*(loop.run_in_executor(self._executor, os.getpid) for _ in range(self.size)))
+        for python in self.warmup:
+            try:
+                await python_to_go_async(python, executor=self._executor, semaphore=self._semaphore)
+            except Exception as e:
+                logger.warning("Warm-up transpilation failed: %s", f"{type(e).__name__}: {e}")
+        self.ready.set()
+
+    async def transpile(self, python: str, debug=False, timeout: Optional[float] = None) -> str:
+        """
+        Exceptions raised by python_to_go are raised here. Raises PoolSaturated if the queue
+        is full and TranspileTimeout if it takes longer than timeout seconds, waiting included.
+        """
+        if self.max_queue is not None and self.queue_depth >= self.max_queue:
+            self.rejections += 1
+            raise PoolSaturated(f"{self.queue_depth} transpilations are already waiting for a worker")
+        self._admitted += 1
+        try:
+            return await asyncio.wait_for(
+                python_to_go_async(python, debug, executor=self._executor, semaphore=self._semaphore), timeout)
+        except asyncio.TimeoutError:
+            self.timeouts += 1
+            raise TranspileTimeout(f"transpilation took longer than {timeout} seconds")
+        except BrokenProcessPool as e:
+            self.crashes += 1
+            self._executor.shutdown(wait=False, cancel_futures=True)
+            self._executor = self._new_executor()
+            raise WorkerCrashed(f"worker exited unexpectedly: {e!r}")
+        finally:
+            self._admitted -= 1
+
+    @property
+    def idle(self) -> int:
+        return max(0, self.size - self._admitted)
+
+    def counters(self) -> dict[str, int]:
+        """The rejections, timeouts, crashes and cancellations so far, like WorkerPool.counters"""
+        return {"rejections": self.rejections, "timeouts": self.timeouts, "crashes": self.crashes,
+                "cancellations": self.cancellations}
+
+    @property
+    def queue_depth(self) -> int:
+        """The number of callers waiting for a worker"""
+        return max(0, self._admitted - self.size)
+
+    def close(self):
+        self._executor.shutdown(wait=False, cancel_futures=True)
+
+
+class _Flight:
+    """A transpilation that every request for the same source waits on"""
+    def __init__(self, task: asyncio.Task):
+        self.task = task
+        self.waiters = 0
+
+
+class _TaskCancel:
+    """A session_turn cancel event that cancels a task when it's set"""
+    def __init__(self, task: asyncio.Task):
+        self.task = task
+        self._set = False
+
+    def set(self):
+        self._set = True
+        self.task.get_loop().call_soon_threadsafe(self.task.cancel)
+
+    def is_set(self) -> bool:
+        return self._set
+
+
+transpiler: Optional[AsyncTranspiler] = None
+flights: dict[str, _Flight] = {}
+
+
+def get_transpiler() -> AsyncTranspiler:
+    global transpiler
+    if transpiler is None:
+        transpiler = service.backend = AsyncTranspiler(workers, max_queue=queue_limit, warmup=warmup_corpus())
+    return transpiler
+
+
+async def transpile(py: str) -> str:
+    try:
+        return await get_transpiler().transpile(py, app.debug, timeout=timeout)
+    except SyntaxError as e:
+        return service.syntax_error_report(e)
+
+
+async def cached_transpile(py: str) -> str:
+    """
+    Like pytago.app's cached_transpile, but when every request waiting on a transpilation
+    has been cancelled, so is the transpilation.
+    """
+    key = source_key(py)
+    if (flight := flights.get(key)) is None or flight.task.done():
+        if (go := await cache_get(key)) is not None:
+            return go
+        # Another request may have started transpiling it while the cache was being read
+        flight = flights.get(key)
+    if flight is not None and not flight.task.done():
+        results.coalesce()
+    else:
+        flight = flights[key] = _Flight(asyncio.ensure_future(_transpile_into_cache(key, py)))
+        flight.task.add_done_callback(lambda _, flight=flight: _land(key, flight))
+    flight.waiters += 1
+    try:
+        return await asyncio.shield(flight.task)
+    finally:
+        flight.waiters -= 1
+        if not flight.waiters:
+            flight.task.cancel()
+
+
+async def _transpile_into_cache(key: str, py: str) -> str:
+    go = await transpile(py)
+    await cache_put(key, go)
+    return go
+
+
+async def cache_get(key: str) -> Optional[str]:
+    """results.get, in a thread if it might have to read the shared cache's database"""
+    if isinstance(results, SharedCache):
+        return await run_in_threadpool(results.get, key)
+    return results.get(key)
+
+
+async def cache_put(key: str, go: str):
+    """results.put, in a thread if it writes to the shared cache's database too"""
+    if isinstance(results, SharedCache):
+        await run_in_threadpool(results.put, key, go)
+    else:
+        results.put(key, go)
+
+
+def _land(key: str, flight: _Flight):
+    if flights.get(key) is flight:
+        del flights[key]
+
+
+async def index(request: Request) -> Response:
+    if request.method == "GET":
+        return await respond(request, service.page_tag(), PAGE_CACHE_CONTROL, service.index_html)
+
+    try:
+        body = await request.json() or {}
+    except ValueError:
+        body = {}
+    py = body.get("py") if isinstance(body, dict) else None
+    if not py:
+        return PlainTextResponse("Bad request", 400)
+    with requests_in_flight.track_in_progress(), request_seconds.time():
+        task = asyncio.ensure_future(cached_transpile(py))
+        with session_turn(body.get("session"), body.get("seq"), _TaskCancel(task)) as cancel:
+            try:
+                try:
+                    key = source_key(py)
+                    return await respond(request, service.result_key_tag(key), RESULT_CACHE_CONTROL, lambda: task,
+                                         service.result_location(key))
+                except asyncio.CancelledError:
+                    if cancel is None or not cancel.is_set() or not task.cancelled():
+                        raise
+                    get_transpiler().cancellations += 1
+                    raise TranspileCancelled("transpilation was cancelled")
+            except Exception as e:
+                errors.inc(error=type(e).__name__)
+                if (failure := failure_response(e)) is None:
+                    raise
+                message, status = failure
+                return PlainTextResponse(message, status, {"Retry-After": "1"} if status == 429 else None)
+            finally:
+                # Only still pending if the client already had the result
+                task.cancel()
+
+
+async def result(request: Request) -> Response:
+    """The result for a source with this source_key, for as long as it's cached"""
+    key = request.path_params["key"]
+    if not service.is_result_key(key):
+        return PlainTextResponse("Not found", 404)
+    return await respond(request, service.result_key_tag(key), RESULT_CACHE_CONTROL, lambda: cache_get(key))
+
+
+async def respond(request: Request, tag: str, cache_control: str, make_body: Callable,
+                  location: Optional[str] = None) -> Response:
+    """
+    Answer with make_body()'s result, awaiting it if need be, unless the client already has it,
+    or with a 404 if it's None
+    """
+    representation = Representation(tag, cache_control, request.headers.get("Accept-Encoding"),
+                                     request.headers.get("If-None-Match"), request.method, location)
+    if representation.not_modified:
+        return Response(status_code=304, headers=representation.headers)
+    if representation.precondition_failed:
+        return Response(status_code=412, headers=representation.headers)
+    body = make_body()
+    if inspect.isawaitable(body):
+        body = await body
+    if body is None:
+        return PlainTextResponse("Not found", 404)
+    data, headers = representation.encode(body)
+    return Response(data, headers=headers, media_type="text/html")
+
+
+async def batch(request: Request) -> Response:
+    """
+    Transpile a list of sources, streaming back one JSON object per line as each one finishes:
+    {"index": i, "go": ...} or {"index": i, "error": {"type": ..., "message": ..., "status": ...}}
+    """
+    try:
+        body = await request.json()
+    except ValueError:
+        body = None
+    sources = body.get("sources") if isinstance(body, dict) else None
+    if not isinstance(sources, list):
+        return PlainTextResponse("Bad request", 400)
+    if len(sources) > batch_limit:
+        return PlainTextResponse(f"At most {batch_limit} sources can be sent at once", 413)
+
+    # Batch items take turns here rather than in the transpiler's queue, so batches can't fill it up by themselves
+    turns = asyncio.Semaphore(get_transpiler().size)
+
+    async def one(i, py):
+        if not isinstance(py, str) or not py:
+            return i, BAD_BATCH_ITEM
+        async with turns:
+            try:
+                return i, batch_item(await cached_transpile(py))
+            except Exception as e:
+                return i, batch_item(error=e)
+
+    async def stream():
+        with requests_in_flight.track_in_progress(), request_seconds.time():
+            tasks = [asyncio.ensure_future(one(i, py)) for i, py in enumerate(sources)]
+            try:
+                for next_done in asyncio.as_completed(tasks):
+                    i, item = await next_done
+                    yield json.dumps({"index": i, **item}) + "\n"
+            finally:
+                for task in tasks:
+                    task.cancel()
+
+    return StreamingResponse(stream(), media_type="application/x-ndjson")
+
+
+async def prometheus_metrics(request: Request) -> Response:
+    return Response(metrics.render(), headers={"Content-Type": Registry.CONTENT_TYPE})
+
+
+async def healthz(request: Request) -> Response:
+    if not service.is_ready():
+        return PlainTextResponse("Warming up", 503)
+    return PlainTextResponse("OK")
+
+
+async def stats(request: Request) -> Response:
+    get_transpiler()
+    return JSONResponse(service.stats())
+
+
+@asynccontextmanager
+async def lifespan(app: Starlette):
+    global transpiler
+    # Warm up in the background, so that /healthz can answer while it happens
+    warming = asyncio.ensure_future(get_transpiler().start())
+    try:
+        yield
+    finally:
+        warming.cancel()
+        transpiler.close()
+        transpiler = service.backend = None
+
+
+app = Starlette(
+    debug=bool(os.environ.get("PYTAGO_DEBUG")),
+    routes=[
+        Route("/", index, methods=["GET", "POST"]),
+        Route("/result/{key}", result),
+        Route("/batch", batch, methods=["POST"]),
+        Route("/metrics", prometheus_metrics),
+        Route("/healthz", healthz),
+        Route("/stats", stats),
+    ],
+    middleware=[Middleware(CORSMiddleware, allow_origins=["*"])],
+    lifespan=lifespan,
+)
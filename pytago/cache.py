@@ -0,0 +1,245 @@
+import hashlib
+import logging
+import os
+import pickle
+import sqlite3
+import threading
+import time
+from collections import OrderedDict
+from concurrent.futures import Future
+from typing import Callable, Hashable, Optional
+
+logger = logging.getLogger("pytago")
+
+_MISSING = object()
+
+
+def source_key(python: str) -> str:
+    return hashlib.sha256(python.encode("utf_8", "surrogatepass")).hexdigest()
+
+
+class LRUCache:
+    """
+    A thread-safe mapping that holds on to at most maxsize items, evicting the
+    least recently used one when it's full.
+    """
+    def __init__(self, maxsize: int = 1024):
+        self.maxsize = maxsize
+        self.hits = 0
+        self.misses = 0
+        self.coalesced = 0
+        self._items = OrderedDict()
+        self._pending = {}
+        self._lock = threading.Lock()
+
+    def get(self, key: Hashable, default=None):
+        with self._lock:
+            try:
+                self._items.move_to_end(key)
+            except KeyError:
+                pass
+            else:
+                self.hits += 1
+                return self._items[key]
+        value = self._load(key)
+        with self._lock:
+            if value is _MISSING:
+                self.misses += 1
+                return default
+            self.hits += 1
+            self._put(key, value)
+        return value
+
+    def put(self, key: Hashable, value):
+        with self._lock:
+            self._put(key, value)
+        self._save(key, value)
+
+    def _put(self, key: Hashable, value):
+        if self.maxsize <= 0:
+            return
+        self._items[key] = value
+        self._items.move_to_end(key)
+        while len(self._items) > self.maxsize:
+            self._items.popitem(last=False)
+
+    def get_or_compute(self, key: Hashable, compute: Callable):
+        """
+        Return the value for key, calling compute() to make it if it isn't cached. If another
+        thread is already computing the same key, wait for its result (or exception) instead.
+        Exceptions aren't cached.
+        """
+        with self._lock:
+            try:
+                self._items.move_to_end(key)
+            except KeyError:
+                pass
+            else:
+                self.hits += 1
+                return self._items[key]
+            future = self._pending.get(key)
+            if future is None:
+                future = self._pending[key] = Future()
+                computing = True
+            else:
+                self.coalesced += 1
+                computing = False
+
+        if not computing:
+            return future.result()
+        try:
+            if (value := self._load(key)) is not _MISSING:
+                with self._lock:
+                    self.hits += 1
+            else:
+                with self._lock:
+                    self.misses += 1
+                value = compute()
+                self._save(key, value)
+        except BaseException as e:
+            with self._lock:
+                del self._pending[key]
+            future.set_exception(e)
+            raise
+        with self._lock:
+            self._put(key, value)
+            del self._pending[key]
+        future.set_result(value)
+        return value
+
+    def coalesce(self):
+        """Count a request for a value that's already being computed elsewhere"""
+        with self._lock:
+            self.coalesced += 1
+
+    def _load(self, key: Hashable):
+        """Look key up in whatever's behind this cache, returning _MISSING if it isn't there"""
+        return _MISSING
+
+    def _save(self, key: Hashable, value):
+        """Store value in whatever's behind this cache"""
+
+    def clear(self):
+        with self._lock:
+            self._items.clear()
+
+    def __len__(self):
+        return len(self._items)
+
+    def __contains__(self, key: Hashable):
+        return key in self._items
+
+
+class SharedCache(LRUCache):
+    """
+    An LRUCache in front of a SQLite database that every process on the host can share,
+    so that what one gunicorn worker has transpiled, the others don't have to.
+
+    Entries expire ttl seconds after they're stored, and once the database holds more
+    than shared_maxsize of them the least recently used are deleted. The database is in
+    WAL mode, so readers don't wait for writers. If it can't be opened, the cache goes on
+    as a plain LRUCache; failed reads count as misses and failed writes are dropped.
+
+    Values are pickled, so only point it at a file that nothing else can write to.
+    """
+    # Stores between deletions of expired and excess entries
+    PRUNE_INTERVAL = 64
+
+    def __init__(self, path: str, maxsize: int = 1024, shared_maxsize: int = 100_000,
+                 ttl: Optional[float] = None):
+        super().__init__(maxsize)
+        self.path = path
+        self.shared_maxsize = shared_maxsize
+        self.ttl = ttl
+        self.shared_hits = 0
+        self.shared_errors = 0
+        self.available = True
+        self._local = threading.local()
+        self._saves = 0
+        try:
+            self._connection().executescript("""
+                CREATE TABLE IF NOT EXISTS results (
+                    key TEXT PRIMARY KEY,
+                    value BLOB NOT NULL,
+                    expires REAL,
+                    accessed REAL NOT NULL
+                );
+                CREATE INDEX IF NOT EXISTS results_accessed ON results (accessed);
+            """)
+        except sqlite3.Error as e:
+            logger.warning("Couldn't open the shared cache at %s, only caching in memory: %s", path, e)
+            self.available = False
+
+    def _connection(self) -> sqlite3.Connection:
+        # Connections can't be shared between threads, or survive a fork
+        conn = getattr(self._local, "conn", None)
+        if conn is None or self._local.pid != os.getpid():
+            conn = sqlite3.connect(self.path, timeout=1, isolation_level=None)
+            conn.execute("PRAGMA journal_mode=WAL")
+            conn.execute("PRAGMA synchronous=NORMAL")
+            self._local.conn, self._local.pid = conn, os.getpid()
+        return conn
+
+    def _failed(self, operation: str, e: sqlite3.Error):
+        with self._lock:
+            self.shared_errors += 1
+        logger.debug("Shared cache %s failed: %s", operation, e)
+
+    def _load(self, key: Hashable):
+        if not self.available:
+            return _MISSING
+        now = time.time()
+        try:
+            conn = self._connection()
+            row = conn.execute("SELECT value FROM results WHERE key = ? AND (expires IS NULL OR expires > ?)",
+                               (str(key), now)).fetchone()
+            if row is None:
+                return _MISSING
+            conn.execute("UPDATE results SET accessed = ? WHERE key = ?", (now, str(key)))
+        except sqlite3.Error as e:
+            self._failed("read", e)
+            return _MISSING
+        with self._lock:
+            self.shared_hits += 1
+        return pickle.loads(row[0])
+
+    def _save(self, key: Hashable, value):
+        if not self.available:
+            return
+        now = time.time()
+        with self._lock:
+            self._saves += 1
+            prune = self._saves % self.PRUNE_INTERVAL == 0
+        try:
+            conn = self._connection()
+            conn.execute("INSERT OR REPLACE INTO results (key, value, expires, accessed) VALUES (?, ?, ?, ?)",
+                         (str(key), pickle.dumps(value), None if self.ttl is None else now + self.ttl, now))
+            if prune:
+                self.prune()
+        except sqlite3.Error as e:
+            self._failed("write", e)
+
+    def prune(self):
+        """Delete expired entries, and then the least recently used ones beyond shared_maxsize"""
+        conn = self._connection()
+        conn.execute("DELETE FROM results WHERE expires <= ?", (time.time(),))
+        conn.execute("DELETE FROM results WHERE key IN "
+                     "(SELECT key FROM results ORDER BY accessed DESC LIMIT -1 OFFSET ?)", (self.shared_maxsize,))
+
+    @property
+    def shared_size(self) -> int:
+        if not self.available:
+            return 0
+        try:
+            return self._connection().execute("SELECT COUNT(*) FROM results").fetchone()[0]
+        except sqlite3.Error as e:
+            self._failed("count", e)
+            return 0
+
+    def clear(self):
+        super().clear()
+        if self.available:
+            try:
+                self._connection().execute("DELETE FROM results")
+            except sqlite3.Error as e:
+                self._failed("clear", e)
@@ -1,17 +1,58 @@
+import logging
+import sys
 from argparse import ArgumentParser
+from contextlib import ExitStack
 
 from pytago import python_to_go
 
-parser = ArgumentParser(prog='Pytago')
+parser = ArgumentParser(prog='Pytago', epilog="run 'pytago serve -h' to see how to run pytago as a server")
 parser.add_argument("-o", "--out", dest="outfile", help="write go code to OUTFILE", metavar="OUTFILE")
+parser.add_argument("-j", "--jobs", dest="jobs", type=int, metavar="JOBS",
+                    help="transform independent functions in up to JOBS processes at once")
+parser.add_argument("--debug", dest="debug", action="store_true",
+                    help="log the intermediate programs to stderr")
+parser.add_argument("--memprofile", dest="memprofile", action="store_true",
+                    help="report peak memory, the biggest allocation sites and GoAST node counts of each stage to stderr")
+parser.add_argument("--sample-profile", dest="sample_profile", metavar="OUTFILE",
+                    help="sample where the time goes into OUTFILE, as folded stacks for flame graphs")
 parser.add_argument('infile', help='read python code from INFILE', metavar="INFILE")
 
+serve_parser = ArgumentParser(prog='Pytago serve',
+                              description="answer line-delimited JSON-RPC transpile requests until shutdown")
+serve_parser.add_argument("--socket", dest="socket", metavar="PATH",
+                          help="listen on the unix socket at PATH instead of stdin/stdout")
+serve_parser.add_argument("-w", "--workers", dest="workers", type=int, metavar="WORKERS",
+                          help="number of transpiler processes (default: number of CPUs)")
+serve_parser.add_argument("-t", "--timeout", dest="timeout", type=float, metavar="SECONDS",
+                          help="default per-request timeout")
+serve_parser.add_argument("--cache-size", dest="cache_size", type=int, default=1024, metavar="N",
+                          help="number of results to keep in memory")
+
 
 def main():
+    if sys.argv[1:2] == ["serve"]:
+        from pytago.server import serve
+        args = serve_parser.parse_args(sys.argv[2:])
+        serve(socket=args.socket, workers=args.workers, timeout=args.timeout, cache_size=args.cache_size)
+        return
     args = parser.parse_args()
+    if args.debug:
+        logging.basicConfig(format="%(message)s")
+        logging.getLogger("pytago").setLevel(logging.DEBUG)
     if args.infile:
         with open(args.infile, "r") as f:
-            go = python_to_go(f.read(), debug=False)
+            with ExitStack() as stack:
+                if args.memprofile:
+                    from pytago.memprofile import profiling_memory
+                    memory_profile = stack.enter_context(profiling_memory())
+                if args.sample_profile:
+                    from pytago.sampleprofile import sampling_profile
+                    sample_profile = stack.enter_context(sampling_profile())
+                go = python_to_go(f.read(), debug=args.debug, jobs=args.jobs)
+            if args.memprofile:
+                print(memory_profile.report(), file=sys.stderr)
+            if args.sample_profile:
+                sample_profile.write(args.sample_profile)
             if args.outfile:
                 with open(args.outfile, "w", encoding='utf8') as f:
                     f.write(go)
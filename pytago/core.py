@@ -1,4 +1,8 @@
 import ast
+import asyncio
+import logging
+import os
+import weakref
 
 
 # Hack to stop astroid from using lazy objects which causes inconsistent failures when deepcopying
@@ -23,12 +27,77 @@ lazy_object_proxy.Proxy = NoProxy
 
 import astroid
 
+from pytago.metrics import stage
 
-def python_to_go(python: str, debug=True) -> str:
+
+def python_to_go(python: str, debug=False, jobs=None) -> str:
+    """
+    Transpile python into Go. With debug, the intermediate programs are logged to the
+    "pytago" logger at DEBUG level, if it's enabled for it.
+    """
+    return _python_to_go(python, debug=debug, jobs=jobs)
+
+
+def python_to_go_debug(python: str, jobs=None):
+    """Transpile python into Go, returning a DebugArtifacts with the result and the intermediate programs"""
     from pytago import go_ast
-    py_tree = build_source_tree(python)
-    go_tree = go_ast.File.from_Module(py_tree)
-    return go_ast.unparse(go_tree, debug=debug)
+    artifacts = go_ast.DebugArtifacts()
+    _python_to_go(python, jobs=jobs, artifacts=artifacts)
+    return artifacts
+
+
+def _python_to_go(python: str, debug=False, jobs=None, artifacts=None) -> str:
+    from pytago import go_ast
+    with stage("parse"):
+        py_tree = build_source_tree(python)
+    with stage("from_Module"):
+        go_tree = go_ast.File.from_Module(py_tree)
+    return go_ast.unparse(go_tree, debug=debug, jobs=jobs, artifacts=artifacts)
+
+
+async def python_to_go_async(python: str, debug=False, jobs=None, timeout=None, executor=None,
+                             semaphore: asyncio.Semaphore = None) -> str:
+    """
+    Like python_to_go, but without blocking the event loop. Parsing and transforming happen
+    in executor (the loop's default one if it's None), and the go toolchain runs as asyncio
+    subprocesses. At most semaphore's worth of transpilations run at once, which is one
+    per CPU for each event loop unless another semaphore is given.
+
+    Raises asyncio.TimeoutError if it takes longer than timeout seconds altogether. The go
+    toolchain is killed on timeouts and cancellation; transforming can't be interrupted,
+    so it runs to completion in the background.
+    """
+    from pytago import go_ast
+    loop = asyncio.get_running_loop()
+    deadline = None if timeout is None else loop.time() + timeout
+    async with semaphore or _default_semaphore(loop):
+        code = await asyncio.wait_for(loop.run_in_executor(executor, python_to_compilation_code, python, debug, jobs),
+                                      None if deadline is None else max(0.0, deadline - loop.time()))
+        return await go_ast.unparse_compilation_code_async(
+            code, debug=debug, timeout=None if deadline is None else max(0.0, deadline - loop.time()))
+
+
+def python_to_compilation_code(python: str, debug=False, jobs=None) -> str:
+    """The Go program that prints python as Go source code, before formatting"""
+    from pytago import go_ast
+    with stage("parse"):
+        py_tree = build_source_tree(python)
+    with stage("from_Module"):
+        go_tree = go_ast.File.from_Module(py_tree)
+    with stage("clean_go_tree"):
+        go_ast.clean_go_tree(go_tree, jobs=jobs)
+    indent = '   ' if debug and go_ast.logger.isEnabledFor(logging.DEBUG) else None
+    with stage("dump"):
+        return go_ast.compilation_code(go_tree, indent=indent)
+
+
+_semaphores = weakref.WeakKeyDictionary()
+
+
+def _default_semaphore(loop: asyncio.AbstractEventLoop) -> asyncio.Semaphore:
+    if (semaphore := _semaphores.get(loop)) is None:
+        semaphore = _semaphores[loop] = asyncio.Semaphore(os.cpu_count() or 1)
+    return semaphore
 
 
 def dump_python_to_go_ast_as_json(python: str):  # pragma: no cover
@@ -49,8 +118,34 @@ def build_source_tree(source, *args, **kwargs) -> ast.Module:
     tree = ast.parse(source, *args, **kwargs)
     astroid_tree = astroid.parse(source, *args, **kwargs)
 
-    class SimultaneousTreeVisitor(ast.NodeVisitor):
-        def generic_visit(self, node1, node2):
+    class TreeLinker:
+        """
+        Walks the ast and astroid trees side by side, pointing each node at its counterpart
+        via attr. Uses an explicit stack so deep trees don't hit the recursion limit.
+        """
+        def __init__(self, attr, fn = None):
+            self.attr = attr
+            self.fn = fn or (lambda x: x)
+
+        def visit(self, node1, node2):
+            stack = [(node1, node2, True)]
+            while stack:
+                node1, node2, entering = stack.pop()
+                if not entering:
+                    self.link(node1, node2)
+                    continue
+                stack.append((node1, node2, False))
+                stack += reversed(list(self.iter_child_pairs(node1, node2)))
+
+        def link(self, node1, node2):
+            setattr(node1, self.attr, self.fn(node2))
+            try:
+                setattr(node2, self.attr, node1)
+            except AttributeError:
+                pass
+
+        @staticmethod
+        def iter_child_pairs(node1, node2):
             if hasattr(node1, "_fields"):
                 try:
                     node2._fields = node1._fields
@@ -65,49 +160,9 @@ def build_source_tree(source, *args, **kwargs) -> ast.Module:
                         value2 = [value2]
                     for item, item2 in zip(value, value2):
                         if isinstance(item, ast.AST):
-                            self.visit(item, item2)
+                            yield item, item2, True
                 elif isinstance(value, ast.AST):
-                    self.visit(value, value2)
-
-        def visit(self, node1, node2):
-            """Visit a node."""
-            method = 'visit_' + node1.__class__.__name__
-            visitor = getattr(self, method, self.generic_visit)
-            return visitor(node1, node2)
-
-        def visit_Constant(self, node1, node2):
-            value = node1.value
-            type_name = ast._const_node_type_names.get(type(value))
-            if type_name is None:
-                for cls, name in ast._const_node_type_names.items():
-                    if isinstance(value, cls):
-                        type_name = name
-                        break
-            if type_name is not None:
-                method = 'visit_' + type_name
-                try:
-                    visitor = getattr(self, method)
-                except AttributeError:
-                    pass
-                else:
-                    import warnings
-                    warnings.warn(f"{method} is deprecated; add visit_Constant",
-                                  DeprecationWarning, 2)
-                    return visitor(node1, node2)
-            return self.generic_visit(node1, node2)
-
-    class TreeLinker(SimultaneousTreeVisitor):
-        def __init__(self, attr, fn = None):
-            self.attr = attr
-            self.fn = fn or (lambda x: x)
-
-        def generic_visit(self, node1, node2):
-            super().generic_visit(node1, node2)
-            setattr(node1, self.attr, self.fn(node2))
-            try:
-                setattr(node2, self.attr, node1)
-            except AttributeError:
-                pass
+                    yield value, value2, True
 
 
     def build_linked_node(_node):
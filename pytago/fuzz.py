@@ -0,0 +1,265 @@
+"""
+Differential fuzzing: transpile generated programs through the reference pipeline and
+through each of the faster ones, and complain about any program they disagree on.
+
+    python -m pytago.fuzz --iterations 200 --seed 0 -o fuzz-failures/
+
+Programs come from pytago.synthetic, with a random shape for every iteration. The
+reference is the plain serial pipeline, and the others are:
+
+- parallel: stage 1 transforms run in forked processes (jobs=2) for every split of the
+  declarations, however uneven. Both sides get the program without its
+  `if __name__ == '__main__'` guard, whose init would tie every function to main, and main
+  calls either every function or only the first, leaving the rest as units of their own
+- indented: the compilation code dumped with an indent, as the debug artifacts are,
+  compared with the reference without any whitespace outside of string literals
+- async: python_to_go_async, compared with python_to_go (only with the go toolchain)
+
+Pipelines agree if they give the same code, or fail with the same exception type.
+A pipeline that can't run here (an OSError, such as a go tool that's missing) is an
+error rather than an outcome to compare, since both sides would fail the same way.
+Before compilation code is compared, its imports are sorted and deduplicated, as
+goimports would do to the Go code anyway. A program they disagree on is shrunk to
+the fewest statements that still make them disagree before it's reported.
+"""
+import argparse
+import ast
+import asyncio
+import os
+import random
+import re
+import shutil
+import warnings
+from typing import TYPE_CHECKING, Callable, Optional
+
+from pytago.synthetic import CONSTRUCTS, generate
+
+if TYPE_CHECKING:  # pragma: no cover
+    from pytago import go_ast
+
+
+def _cleaned(python: str, jobs=None) -> "go_ast.File":
+    from pytago import go_ast
+    from pytago.core import build_source_tree
+    go_tree = go_ast.File.from_Module(build_source_tree(python))
+    go_ast.clean_go_tree(go_tree, jobs=jobs)
+    _sort_imports(go_tree)
+    return go_tree
+
+
+def _sort_imports(go_tree: "go_ast.File"):
+    """
+    Put the imports first, in order and without duplicates. goimports does the same to the
+    Go code, so pipelines don't have to agree on them.
+    """
+    from pytago.go_ast import dump
+    from pytago.go_ast.parallel import _is_import
+    imports = {dump(decl): decl for decl in go_tree.Decls if _is_import(decl)}
+    go_tree.Decls[:] = [imports[key] for key in sorted(imports)] + [d for d in go_tree.Decls if not _is_import(d)]
+    specs = {dump(spec): spec for spec in go_tree.Imports}
+    go_tree.Imports[:] = [specs[key] for key in sorted(specs)]
+
+
+def reference(python: str) -> str:
+    from pytago.go_ast import compilation_code
+    return compilation_code(_cleaned(python))
+
+
+def parallel(python: str) -> str:
+    from pytago.go_ast import compilation_code, parallel as go_parallel
+    max_unit_share = go_parallel.MAX_UNIT_SHARE
+    go_parallel.MAX_UNIT_SHARE = 1.0
+    try:
+        return compilation_code(_cleaned(_without_main_guard(python), jobs=2))
+    finally:
+        go_parallel.MAX_UNIT_SHARE = max_unit_share
+
+
+def library_reference(python: str) -> str:
+    return reference(_without_main_guard(python))
+
+
+def _without_main_guard(python: str) -> str:
+    tree = ast.parse(python)
+    tree.body = [stmt for stmt in tree.body
+                 if not (isinstance(stmt, ast.If) and ast.unparse(stmt.test) == "__name__ == '__main__'")]
+    return ast.unparse(tree) + "\n"
+
+
+def indented(python: str) -> str:
+    from pytago.go_ast import compilation_code
+    return _without_layout(compilation_code(_cleaned(python), indent='   '))
+
+
+def unindented_reference(python: str) -> str:
+    return _without_layout(reference(python))
+
+
+# Go string literals, which are kept as they are, or whitespace, which isn't
+_LAYOUT = re.compile(r'"(?:[^"\\\n]|\\.)*"|`[^`]*`|\s+')
+
+
+def _without_layout(code: str) -> str:
+    return _LAYOUT.sub(lambda m: "" if m.group().isspace() else m.group(), code)
+
+
+def go_reference(python: str) -> str:
+    from pytago import python_to_go
+    return python_to_go(python)
+
+
+def go_async(python: str) -> str:
+    from pytago.core import python_to_go_async
+    return asyncio.run(python_to_go_async(python))
+
+
+# Each pipeline, and the reference it has to agree with
+PIPELINES: dict[str, tuple[Callable[[str], str], Callable[[str], str]]] = {
+    "parallel": (parallel, library_reference),
+    "indented": (indented, unindented_reference),
+    "async": (go_async, go_reference),
+}
+# Those that need the go toolchain
+GO_PIPELINES = {"async"}
+# Everything python_to_go runs
+GO_TOOLS = ("go", "goimports", "gofumpt", "golines")
+
+
+class PipelineUnavailable(RuntimeError):
+    """A pipeline couldn't run here at all"""
+
+
+def available_pipelines() -> list[str]:
+    have_go = all(shutil.which(tool) for tool in GO_TOOLS)
+    return [name for name in PIPELINES if have_go or name not in GO_PIPELINES]
+
+
+def outcome(pipeline: Callable[[str], str], python: str) -> tuple[str, str]:
+    """("ok", code) or ("error", the exception's type). Raises PipelineUnavailable on an OSError."""
+    try:
+        return "ok", pipeline(python)
+    except OSError as e:
+        raise PipelineUnavailable(f"{pipeline.__name__} couldn't run: {e!r}") from e
+    except Exception as e:
+        return "error", type(e).__name__
+
+
+def disagreement(python: str, pipeline: str) -> Optional[tuple[tuple[str, str], tuple[str, str]]]:
+    """The reference's outcome and the pipeline's, if they differ"""
+    optimized, reference_pipeline = PIPELINES[pipeline]
+    with warnings.catch_warnings():
+        warnings.simplefilter("ignore")
+        expected = outcome(reference_pipeline, python)
+        actual = outcome(optimized, python)
+    return None if expected == actual else (expected, actual)
+
+
+def random_program(rng: random.Random) -> str:
+    """A small program of a random shape"""
+    return generate(functions=rng.randint(1, 4), depth=rng.randint(0, 3), locals_per_function=rng.randint(1, 5),
+                    call_density=rng.random(), classes=rng.randint(0, 2), statements_per_block=rng.randint(1, 3),
+                    constructs=tuple(rng.sample(CONSTRUCTS, rng.randint(1, len(CONSTRUCTS)))),
+                    seed=rng.randrange(2 ** 32), main_calls=rng.choice([None, 1]))
+
+
+def _statement_lists(tree: ast.AST) -> list[list[ast.stmt]]:
+    """Every list of statements in tree, outermost first"""
+    lists = []
+    for node in ast.walk(tree):
+        for field in ("body", "orelse", "finalbody"):
+            value = getattr(node, field, None)
+            if isinstance(value, list) and value and isinstance(value[0], ast.stmt):
+                lists.append(value)
+    return lists
+
+
+def minimize(python: str, fails: Callable[[str], bool], max_checks: int = 1000) -> str:
+    """
+    Remove as many statements from python as possible while fails still holds for it. Runs of
+    statements are removed at once first, halving the run length until single statements
+    are tried, and blocks left empty get a pass.
+    """
+    tree = ast.parse(python)
+    checks = 0
+    changed = True
+    while changed and checks < max_checks:
+        changed = False
+        for statements in _statement_lists(tree):
+            if not any(statements is s for s in _statement_lists(tree)):
+                # Went with a statement that's been removed
+                continue
+            run = len(statements)
+            while run and checks < max_checks:
+                i = 0
+                while i < len(statements) and checks < max_checks:
+                    removed = statements[i:i + run]
+                    if all(isinstance(s, ast.Pass) for s in removed):
+                        i += run
+                        continue
+                    del statements[i:i + run]
+                    emptied = not statements
+                    if emptied:
+                        statements.append(ast.Pass())
+                    checks += 1
+                    if fails(ast.unparse(tree)):
+                        changed = True
+                        if emptied:
+                            break
+                    else:
+                        if emptied:
+                            statements.pop()
+                        statements[i:i] = removed
+                        i += run
+                run //= 2
+    return ast.unparse(tree) + "\n"
+
+
+def fuzz(iterations: int, seed: int = 0, pipelines: Optional[list[str]] = None,
+         report: Callable[[int, str, str, tuple], None] = lambda *args: None) -> list[dict]:
+    """
+    Try iterations programs on each of pipelines (all of the available ones by default).
+    Every disagreement is minimized, passed to report(iteration, pipeline, program,
+    outcomes) and returned. Raises PipelineUnavailable if one of them can't run here.
+    """
+    rng = random.Random(seed)
+    failures = []
+    for iteration in range(iterations):
+        python = random_program(rng)
+        for pipeline in pipelines or available_pipelines():
+            if disagreement(python, pipeline) is None:
+                continue
+            minimized = minimize(python, lambda p: disagreement(p, pipeline) is not None)
+            outcomes = disagreement(minimized, pipeline)
+            failures.append({"iteration": iteration, "pipeline": pipeline, "program": minimized,
+                             "original": python, "outcomes": outcomes})
+            report(iteration, pipeline, minimized, outcomes)
+    return failures
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Compare pytago's optimized pipelines with the reference one")
+    parser.add_argument("-n", "--iterations", type=int, default=100)
+    parser.add_argument("-s", "--seed", type=int, default=0)
+    parser.add_argument("-p", "--pipelines", type=lambda s: s.split(","), default=None,
+                        help=f"comma separated, out of {','.join(PIPELINES)} (default: all that can run here)")
+    parser.add_argument("-o", "--output", help="write each minimized program that fails into this directory")
+    args = parser.parse_args()
+
+    def report(iteration, pipeline, program, outcomes):
+        print(f"iteration {iteration}: {pipeline} disagrees with the reference on\n{program}")
+        if args.output:
+            os.makedirs(args.output, exist_ok=True)
+            with open(os.path.join(args.output, f"{pipeline}-{args.seed}-{iteration}.py"), "w",
+                      encoding="utf_8") as f:
+                f.write(program)
+
+    try:
+        failures = fuzz(args.iterations, args.seed, args.pipelines, report)
+    except PipelineUnavailable as e:
+        raise SystemExit(f"error: {e}")
+    print(f"{len(failures)} disagreement(s) in {args.iterations} programs")
+    raise SystemExit(1 if failures else 0)
+
+
+if __name__ == '__main__':
+    main()
@@ -1,8 +1,20 @@
+import functools
 from typing import Optional
 
 import pytago.go_ast.core as ast
+from pytago.metrics import snippet
 
 
+def _counted(f):
+    """Counts each expansion for pytago.metrics.recording_snippets"""
+    @functools.wraps(f)
+    def wrapper(*args, **kwargs):
+        snippet(f"ast_snippets.{f.__name__}")
+        return f(*args, **kwargs)
+    return wrapper
+
+
+@_counted
 def fstring(template_str: str, key_value_elements=list['ast.KeyValueExpr']) -> 'ast.CallExpr':
     """
     func() string {
@@ -177,6 +189,7 @@ def fstring(template_str: str, key_value_elements=list['ast.KeyValueExpr']) -> '
     )
 
 
+@_counted
 def wrap_err(err: 'ast.Expr'):
     token = ast.token
     return ast.CallExpr(
@@ -230,6 +243,7 @@ def wrap_err(err: 'ast.Expr'):
     )
 
 
+@_counted
 def index(iterable: 'ast.Expr', element: 'ast.Expr'):
     token = ast.token
     return ast.CallExpr(
@@ -298,6 +312,7 @@ def index(iterable: 'ast.Expr', element: 'ast.Expr'):
         ),
     )
 
+@_counted
 def handler_name_to_cond(name: str) -> 'ast.Expr':
     token = ast.token
     cond = ast.CallExpr(
@@ -335,6 +350,7 @@ def handler_name_to_cond(name: str) -> 'ast.Expr':
         cond = cond.or_(handler_name_to_cond("unexpected EOF"))
     return cond
 
+@_counted
 def exceptions(conditional: list[tuple['ast.Expr', list['ast.Stmt']]], base: list['ast.Stmt'],
                conditional_names: list[Optional['ast.Ident']], base_name: Optional['ast.Ident']):
     token = ast.token
@@ -471,6 +487,7 @@ def exceptions(conditional: list[tuple['ast.Expr', list['ast.Stmt']]], base: lis
     )
 
 
+@_counted
 def file_loop(line, file_obj, file_body, is_text: bool):
     token = ast.token
     attr = "Text" if is_text else "Bytes"
@@ -656,6 +673,7 @@ def file_loop(line, file_obj, file_body, is_text: bool):
           )
 
 
+@_counted
 def slice_multiply(elts, elt_type, n_repeats):
     token = ast.token
     return ast.CallExpr(
@@ -1,6 +1,7 @@
 import ast
 import inspect
 import json
+import threading
 import traceback
 import warnings
 from enum import Enum
@@ -9,6 +10,7 @@ from typing import List, Dict, Optional, Any, TypeVar, Type, Callable
 
 from pytago.go_ast import ast_snippets
 from pytago.go_ast.py_snippets import find_call_funclit
+from pytago.go_ast.traversal import walk, walk_with_exit
 
 
 class ObjKind(Enum):
@@ -299,14 +301,9 @@ def _only_truthy(elts):
 
 def _find_nodes(node: ast.AST, finder: callable, skipper: callable=None):
     results = []
-    class Explorer(ast.NodeVisitor):
-        def generic_visit(self, node: ast.AST) -> Any:
-            if skipper and skipper(node):
-                return node
-            if result := finder(node):
-                results.append(result)
-            return super().generic_visit(node)
-    Explorer().visit(node)
+    for x in walk(node, skipper=skipper):
+        if result := finder(x):
+            results.append(result)
     return results
 
 def _replace_nodes(node: ast.AST, replacer: callable, skipper: callable=None):
@@ -459,7 +456,8 @@ def exception_with_traceback():
 
 class GoAST(ast.AST):
     # _py_module = None
-    _go_module = None
+    # The File that this thread is transpiling, which every node made on it belongs to
+    _current = threading.local()
     CONVERSION_ORDER = {}
     STORY = []
 
@@ -470,7 +468,7 @@ class GoAST(ast.AST):
         self._py_context = _py_context or {}
         self.parents = parents or []
         # self.py_module = self._py_module
-        self.go_module = self._go_module
+        self.go_module = getattr(self._current, "go_module", None)
         for field_name in self._fields:
             field = getattr(self, field_name, None)
             if isinstance(field, GoAST):
@@ -493,56 +491,42 @@ class GoAST(ast.AST):
         return True
 
     def __contains__(self, item):
-        class Visitor(ast.NodeVisitor):
-            def __init__(self):
-                self.contains = False
-
-            def generic_visit(self, node):
-                if node == item:
-                    self.contains = True
-                if self.contains:
-                    return node
-                return super().generic_visit(node)
-        visitor = Visitor()
-        visitor.visit(self)
-        return visitor.contains
+        return any(node == item for node in walk(self))
 
     def search(self, item):
-        class Visitor(ast.NodeVisitor):
-            def __init__(self):
-                self.hits = []
-
-            def generic_visit(self, node):
-                if node == item:
-                    self.hits.append(node)
-                return super().generic_visit(node)
-
-        visitor = Visitor()
-        visitor.visit(self)
-        return visitor.hits
+        return [node for node in walk(self) if node == item]
 
     def outermost_scope_search(self, item, skip=0):
-        class Visitor(ast.NodeVisitor):
-            def __init__(self):
-                self.hits = []
-                self.skip = skip
-                self.scope = None
-
-            def generic_visit(self, node):
-                previous_scope = self.scope
-                if self.scope is None and isinstance(node, BlockStmt):
-                    if self.skip:
-                        self.skip -= 1
-                    else:
-                        self.scope = node
-                if node == item:
-                    self.hits.append((self.scope, node))
-                super().generic_visit(node)
-                self.scope = previous_scope
+        return self.outermost_scope_search_many([item], skip=skip)[0]
 
-        visitor = Visitor()
-        visitor.visit(self)
-        return visitor.hits
+    def outermost_scope_search_many(self, items, skip=0):
+        """
+        Like outermost_scope_search, but finds the hits for every one of items
+        in a single walk of the tree
+        """
+        def key(x):
+            return type(x), x.Name if isinstance(x, Ident) else None
+
+        hits = [[] for _ in items]
+        candidates = {}
+        for i, item in enumerate(items):
+            candidates.setdefault(key(item), []).append(i)
+        scope = None
+        previous_scopes = []
+        for node, entering in walk_with_exit(self):
+            if not entering:
+                scope = previous_scopes.pop()
+                continue
+            previous_scopes.append(scope)
+            if scope is None and isinstance(node, BlockStmt):
+                if skip:
+                    skip -= 1
+                else:
+                    scope = node
+            for i in candidates.get(key(node), ()):
+                if node == items[i]:
+                    hits[i].append((scope, node))
+        return hits
 
     def __repr__(self):
         from pytago.go_ast import parsing
@@ -2513,21 +2497,21 @@ class File(GoAST):
 
     @classmethod
     def from_Module(cls, node: ast.Module, **kwargs):
-        # prev_py_module = GoAST._py_module
-        prev_go_module = GoAST._go_module
         GoAST._py_module = node
         go_module = cls([], [], None, [], Ident("main"), 1, None, [], **kwargs)
-        GoAST._go_module = go_module
+        # Nodes made by the transformers later on belong to it too, so it stays current until
+        # this thread starts on another module
+        GoAST._current.go_module = go_module
         go_module.Decls[:] = build_decl_list(node.body)
-        # if prev_py_module is not None:
-        #     GoAST._py_module = prev_py_module
-        if prev_go_module is not None:
-            GoAST._go_module = prev_go_module
         return go_module
 
     def add_import(self, node: ImportSpec):
+        """Import node, unless the file already has a declaration that imports just that"""
+        decl = GenDecl.from_ImportSpec(node)
+        if decl in self.Decls:
+            return
         self.Imports.append(node)
-        self.Decls.insert(0, GenDecl.from_ImportSpec(node))
+        self.Decls.insert(0, decl)
 
 
 class ForStmt(Stmt):
@@ -3652,8 +3636,6 @@ class TypeSwitchStmt(Stmt):
 
     @classmethod
     def from_If(cls, node: ast.If):
-        body = from_this(BlockStmt, node.body)
-
         match node.test:
             case ast.Call(func=ast.Name(id="isinstance"), args=[__expr, __types]):
                 _expr = build_expr_list([__expr])[0]
@@ -3662,8 +3644,11 @@ class TypeSwitchStmt(Stmt):
                 except AttributeError:
                     _types = [_type_annotation_to_go_type(__types)]
             case _:
+                # Before the body is built, or IfStmt.from_If would build it all over again
                 raise NotImplementedError()
 
+        body = from_this(BlockStmt, node.body)
+
         _else = build_stmt_list(node.orelse)
         if len(_else) == 0:
             _else = None
@@ -0,0 +1,297 @@
+"""
+Transforming independent top-level declarations in parallel.
+
+A file's declarations are partitioned into units that don't refer to each other by
+name, so passes run over one unit can't see (or change) anything in another. Each
+unit is transformed as its own File in a forked worker process, which inherits the
+tree rather than unpickling it, with every pass of every round run in the same order
+as it would be on the whole file. The results are pickled back and spliced into the
+original file in their original positions, so the file ends up exactly as it would
+have without any workers.
+
+So a main that calls every other function shares a unit with all of them, since passes
+over a call read the type of the function called and write to its parameters, and so
+does anything an init function refers to. Forking only pays off when the work is spread
+over several units of about the same size, as in a module of independent functions;
+worth_forking tells.
+"""
+import io
+import multiprocessing
+import pickle
+import traceback
+from enum import Enum
+from typing import Callable
+
+from pytago.go_ast.core import File, FuncDecl, GenDecl, GoAST, ImportSpec, Ident, TypeSpec, ValueSpec, \
+    get_list_type, set_list_type
+from pytago.go_ast.traversal import walk
+
+
+# The most of a file's nodes that a unit can have for worth_forking
+MAX_UNIT_SHARE = 0.5
+
+
+def can_fork() -> bool:
+    return "fork" in multiprocessing.get_all_start_methods()
+
+
+def _is_import(decl) -> bool:
+    return isinstance(decl, GenDecl) and bool(decl.Specs) and all(isinstance(s, ImportSpec) for s in decl.Specs)
+
+
+def _declared_names(decl) -> set[str]:
+    names = set()
+    match decl:
+        case FuncDecl(Recv=None, Name=Ident(Name=name)):
+            # Methods are tied to their receiver's type declaration instead
+            names.add(name)
+        case GenDecl(Specs=specs):
+            for spec in specs:
+                match spec:
+                    case TypeSpec(Name=Ident(Name=name)):
+                        names.add(name)
+                    case ValueSpec(Names=idents):
+                        names.update(x.Name for x in idents if isinstance(x, Ident))
+    return names
+
+
+def _is_init(decl) -> bool:
+    return isinstance(decl, FuncDecl) and isinstance(decl.Name, Ident) and decl.Name.Name == "init"
+
+
+def partition_decls(go_tree: File) -> list[list[int]]:
+    """
+    Group the indexes of go_tree.Decls into units that don't share any names. A reference
+    to X also ties in the declaration of NewX, which UseConstructorIfAvailable calls instead
+    of X. Files with an init function are a single unit, since MergeAdjacentInits works on
+    declarations that are next to each other in the whole file. Imports aren't part of any
+    unit. Units are ordered by their first declaration.
+    """
+    decls = go_tree.Decls
+    if any(_is_init(decl) for decl in decls):
+        return [[i for i, decl in enumerate(decls) if not _is_import(decl)]]
+    parent = list(range(len(decls)))
+
+    def find(i):
+        while parent[i] != i:
+            parent[i] = parent[parent[i]]
+            i = parent[i]
+        return i
+
+    declared_by = {}
+    for i, decl in enumerate(decls):
+        if _is_import(decl):
+            continue
+        for name in _declared_names(decl):
+            if name in declared_by:
+                parent[find(i)] = find(declared_by[name])
+            else:
+                declared_by[name] = i
+
+    for i, decl in enumerate(decls):
+        if _is_import(decl):
+            continue
+        for node in walk(decl):
+            if isinstance(node, Ident):
+                for name in (node.Name, "New" + node.Name):
+                    if (j := declared_by.get(name)) is not None:
+                        parent[find(i)] = find(j)
+
+    units = {}
+    for i, decl in enumerate(decls):
+        if not _is_import(decl):
+            units.setdefault(find(i), []).append(i)
+    return list(units.values())
+
+
+def _list_fields(nodes):
+    for decl in nodes:
+        for node in walk(decl):
+            for field in node._fields:
+                if isinstance(value := getattr(node, field, None), list):
+                    yield value
+
+
+class _DetachingPickler(pickle.Pickler):
+    """
+    Pickles GoAST nodes without any of the back-references (parents, go_module, Python
+    sources, type hints, ...) that would otherwise drag the rest of the tree along with
+    them. Only the Go syntax tree and plain data attributes survive.
+    """
+    def reducer_override(self, obj):
+        if not isinstance(obj, GoAST):
+            return NotImplemented
+        state = {attr: value for attr, value in vars(obj).items()
+                 if attr in obj._fields or isinstance(value, (str, int, float, Enum, type(None)))}
+        return type(obj), (), state
+
+
+def _detach(decls: list) -> bytes:
+    list_types = [get_list_type(x) for x in _list_fields(decls)]
+    out = io.BytesIO()
+    _DetachingPickler(out).dump((decls, list_types))
+    return out.getvalue()
+
+
+def _attach(data: bytes, go_tree: File) -> list:
+    decls, list_types = pickle.loads(data)
+    for li, list_type in zip(_list_fields(decls), list_types):
+        set_list_type(li, list_type)
+    for decl in decls:
+        for node in walk(decl):
+            node.parents = []
+            node.go_module = go_tree
+            node._py_context = {}
+            if not hasattr(node, "_type_help"):
+                node._type_help = None
+    return decls
+
+
+def _unit_tree(go_tree: File, unit: list[int]) -> File:
+    decls = []
+    for i in unit:
+        decl = go_tree.Decls[i]
+        decl._decl_index = i
+        decls.append(decl)
+    return File(Decls=decls, Name=Ident("main"))
+
+
+def _worker(conn, go_tree: File, units: list[list[int]], apply_round: Callable, count: Callable):
+    try:
+        trees = [_unit_tree(go_tree, unit) for unit in units]
+        while (repeats := conn.recv()) is not None:
+            before = sum(count(tree) for tree in trees)
+            for tree in trees:
+                apply_round(tree, repeats)
+            conn.send((before, sum(count(tree) for tree in trees)))
+        conn.send([_detach(tree.Decls) for tree in trees])
+    except BaseException:
+        conn.send(RuntimeError(traceback.format_exc()))
+    finally:
+        conn.close()
+
+
+def _receive(conn):
+    result = conn.recv()
+    if isinstance(result, Exception):
+        raise result
+    return result
+
+
+def _unit_sizes(go_tree: File, units: list[list[int]]) -> list[int]:
+    return [sum(sum(1 for _ in walk(go_tree.Decls[i])) for i in unit) for unit in units]
+
+
+def worth_forking(go_tree: File, units: list[list[int]]) -> bool:
+    """
+    Whether no unit has more than MAX_UNIT_SHARE of the nodes. Otherwise, waiting for that
+    unit takes about as long as transforming the whole file would, on top of forking.
+    """
+    sizes = _unit_sizes(go_tree, units)
+    return len(units) > 1 and max(sizes) <= MAX_UNIT_SHARE * sum(sizes)
+
+
+def _assign(go_tree: File, units: list[list[int]], jobs: int) -> list[list[int]]:
+    """Spread units over jobs workers, biggest first, so that each worker has about as many nodes"""
+    sizes = _unit_sizes(go_tree, units)
+    assignments = [[] for _ in range(min(jobs, len(units)))]
+    loads = [0] * len(assignments)
+    for u in sorted(range(len(units)), key=lambda u: -sizes[u]):
+        least_loaded = loads.index(min(loads))
+        assignments[least_loaded].append(u)
+        loads[least_loaded] += sizes[u]
+    return assignments
+
+
+def transform_units(go_tree: File, units: list[list[int]], jobs: int, apply_round: Callable, count: Callable):
+    """
+    Transform each unit as its own File in up to jobs forked processes, then replace go_tree's
+    declarations with the transformed ones.
+
+    The rounds are run in lockstep: apply_round(tree, repeats) is applied to every unit, and
+    another round follows for as long as the sum of count(tree) over all units goes down, just
+    as if the rounds were applied to the whole file. The imports go through the same rounds
+    as a File of their own, in this process. Imports the units add go to the top of the file,
+    once each, as File.add_import would put them.
+    """
+    ctx = multiprocessing.get_context("fork")
+    assignments = _assign(go_tree, units, jobs)
+    import_decls = []
+    for i, decl in enumerate(go_tree.Decls):
+        if _is_import(decl):
+            decl._decl_index = i
+            import_decls.append(decl)
+    imports_tree = File(Decls=list(import_decls), Name=Ident("main"))
+    workers = []
+    try:
+        for assigned in assignments:
+            conn, child_conn = ctx.Pipe()
+            process = ctx.Process(target=_worker, daemon=True,
+                                  args=(child_conn, go_tree, [units[u] for u in assigned], apply_round, count))
+            process.start()
+            child_conn.close()
+            workers.append((process, conn))
+
+        start_count = 0
+        end_count = -1
+        repeats = -1
+        while (end_count < start_count):
+            repeats += 1
+            for _, conn in workers:
+                conn.send(repeats)
+            imports_before = count(imports_tree)
+            apply_round(imports_tree, repeats)
+            counts = [(imports_before, count(imports_tree))] + [_receive(conn) for _, conn in workers]
+            start_count = sum(before for before, _ in counts)
+            end_count = sum(after for _, after in counts)
+
+        results = [None] * len(units)
+        for assigned, (_, conn) in zip(assignments, workers):
+            conn.send(None)
+            for u, data in zip(assigned, _receive(conn)):
+                results[u] = data
+    finally:
+        for process, conn in workers:
+            conn.close()
+            process.join(timeout=1)
+            if process.is_alive():
+                process.terminate()
+
+    imports = []
+    placed = {}
+    for decl in imports_tree.Decls:
+        if (j := getattr(decl, "_decl_index", None)) is not None:
+            del decl._decl_index
+            placed[j] = [decl]
+        else:
+            imports.append(decl)
+    for decl in import_decls:
+        if hasattr(decl, "_decl_index"):
+            # Removed from imports_tree
+            del decl._decl_index
+    kept = [decl for decls in placed.values() for decl in decls]
+    for unit, data in zip(units, results):
+        slot = unit[0]
+        before_first = []
+        for decl in _attach(data, go_tree):
+            if (j := getattr(decl, "_decl_index", None)) is not None:
+                del decl._decl_index
+                slot = j
+                placed[slot] = [*before_first, decl]
+                before_first = []
+            elif _is_import(decl):
+                # Every unit adds the imports it needs, so the same import tends to come back many times
+                if decl not in imports and decl not in kept:
+                    imports.append(decl)
+                    go_tree.Imports += decl.Specs
+            elif slot in placed:
+                placed[slot].append(decl)
+            else:
+                before_first.append(decl)
+        if before_first:
+            placed.setdefault(unit[0], []).extend(before_first)
+
+    decls = [*imports]
+    for i in range(len(go_tree.Decls)):
+        decls += placed.get(i, [])
+    go_tree.Decls[:] = decls
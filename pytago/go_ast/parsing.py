@@ -1,18 +1,23 @@
+import asyncio
+import io
 import json
+import logging
 import os
+import signal
 import tempfile
 from collections import defaultdict
 from subprocess import Popen, PIPE
+from typing import Optional, TextIO
 
 from pytago.go_ast import GoAST, ALL_TRANSFORMS, File, get_list_type, token
+from pytago.go_ast import parallel
+from pytago.go_ast.traversal import trampoline, walk
+from pytago.metrics import count, recording_rewrites_active, rewrites, stage
 
+logger = logging.getLogger("pytago")
 
-def unparse(go_tree: GoAST, apply_transformations=True, debug=True):
-    if apply_transformations:
-        clean_go_tree(go_tree)
-    # XXX: I can't promise this isn't vulnerable to RCE if you put this on a server.
-    go_tree_string = dump(go_tree, indent='   ' if debug else None)
-    compilation_code = """\
+
+_COMPILATION_CODE_HEAD, _COMPILATION_CODE_TAIL = """\
     package main
 
     import (
@@ -30,33 +35,70 @@ def unparse(go_tree: GoAST, apply_transformations=True, debug=True):
     		panic(err)
     	}
     }
-    """ % go_tree_string
-    if debug:
-        compilation_code = _gofumpt(compilation_code)
+    """.split("%s")
+
+
+class DebugArtifacts:
+    """
+    The intermediate programs of a transpilation: the Go program that prints the tree
+    (formatted with gofumpt), what it printed, and the externally formatted end result.
+    """
+    def __init__(self):
+        self.compilation_code: Optional[str] = None
+        self.code: Optional[str] = None
+        self.go: Optional[str] = None
+
+    def capture(self, name: str, value: str, log=False):
+        setattr(self, name, value)
+        if log:
+            if name == "compilation_code":
+                lines = value.splitlines()
+                max_i_size = len(str(len(lines) + 1))
+                value = "\n".join(str(i).rjust(max_i_size) + " " + line for i, line in enumerate(lines, start=1))
+            logger.debug("=== %s ===\n%s", _ARTIFACT_TITLES[name], value)
+
+
+_ARTIFACT_TITLES = {
+    "compilation_code": "Compilation Code",
+    "code": "Code",
+    "go": "Externally Formatted Code",
+}
+
+
+def unparse(go_tree: GoAST, apply_transformations=True, debug=False, jobs: Optional[int] = None,
+            artifacts: Optional[DebugArtifacts] = None):
+    """
+    Turn go_tree into formatted Go source code. If artifacts is given, the intermediate
+    programs are captured into it. If debug is true and the "pytago" logger is enabled
+    for DEBUG, they're also logged. Otherwise, none of that extra work is done.
+    """
+    log = debug and logger.isEnabledFor(logging.DEBUG)
+    if log and artifacts is None:
+        artifacts = DebugArtifacts()
+    if apply_transformations:
+        with stage("clean_go_tree"):
+            clean_go_tree(go_tree, jobs=jobs)
+    # XXX: I can't promise this isn't vulnerable to RCE if you put this on a server.
     tmp_file = tempfile.NamedTemporaryFile(suffix=".go", delete=False)
     try:
         tmp_file.close()
-        if debug:
-            print(f"=== Start Compilation Code ===")
-            lines = compilation_code.splitlines()
-            max_i_size = len(str(len(lines) + 1))
-            for i, line in enumerate(lines, start=1):
-                print(str(i).rjust(max_i_size), line)
-            print(f"=== End Compilation Code ===")
-        with open(tmp_file.name, "w", encoding="utf_8") as f:
-            f.write(compilation_code)
+        with stage("dump"), open(tmp_file.name, "w", encoding="utf_8") as f:
+            if artifacts is not None:
+                artifacts.capture("compilation_code", _gofumpt(compilation_code(go_tree, indent='   ')), log)
+                f.write(artifacts.compilation_code)
+            else:
+                # Stream the tree straight into the file rather than building the program in memory
+                f.write(_COMPILATION_CODE_HEAD)
+                dump_to(go_tree, f)
+                f.write(_COMPILATION_CODE_TAIL)
         code = _gorun(tmp_file.name)
     finally:
         os.remove(tmp_file.name)
-    if debug:
-        print(f"=== Start Code ===")
-        print(code)
-        print(f"=== End Code ===")
+    if artifacts is not None:
+        artifacts.capture("code", code, log)
     externally_formatted_code = _golines(_gofumpt(_goimport(code)))
-    if debug:
-        print(f"=== Start Externally Formatted Code ===")
-        print(externally_formatted_code)
-        print(f"=== End Externally Formatted Code ===")
+    if artifacts is not None:
+        artifacts.capture("go", externally_formatted_code, log)
     return externally_formatted_code
 
 
@@ -71,70 +113,98 @@ def dump(node, annotate_fields=True, include_attributes=False, *, indent=None):
     integer or string, then the tree will be pretty-printed with that indent
     level. None (the default) selects the single line representation.
     """
+    out = io.StringIO()
+    dump_to(node, out, annotate_fields, include_attributes, indent=indent)
+    return out.getvalue()
 
-    def _format(node, level=0):
-        if indent is not None:
-            level += 1
-            prefix = '\n' + indent * level
-            sep = ',\n' + indent * level
-        else:
-            prefix = ''
-            sep = ', '
-        class_name = getattr(node, "_prefix", "") + node.__class__.__name__
 
-        if isinstance(node, GoAST):
-            node.remove_falsy_fields()
+def dump_to(node, out: TextIO, annotate_fields=True, include_attributes=False, *, indent=None):
+    """
+    Like dump, but writes the dump to out as it goes instead of building it up in memory.
+    out can be anything with a write method, e.g. a file, a pipe or a subprocess's stdin.
+    The tree is not modified.
+    """
+    if not isinstance(node, GoAST):
+        raise TypeError('expected GoAST, got %r' % node.__class__.__name__)
+    if indent is not None and not isinstance(indent, str):
+        indent = ' ' * indent
+
+    def items(node):
+        # Only truthy fields are dumped. Attributes follow the same rules as ast.dump.
+        result = []
+        for name in node._fields:
+            if value := getattr(node, name, None):
+                result.append(('%s: ' % name if annotate_fields else '', value))
+        if include_attributes and node._attributes:
             cls = type(node)
-            args = []
-            allsimple = True
-            keywords = annotate_fields
-            for name in node._fields:
+            for name in node._attributes:
                 try:
                     value = getattr(node, name)
                 except AttributeError:
-                    keywords = True
                     continue
                 if value is None and getattr(cls, name, ...) is None:
-                    keywords = True
                     continue
-                value, simple = _format(value, level)
-                allsimple = allsimple and simple
-                if keywords:
-                    args.append('%s: %s' % (name, value))
-                else:
-                    args.append(value)
-            if include_attributes and node._attributes:
-                for name in node._attributes:
-                    try:
-                        value = getattr(node, name)
-                    except AttributeError:
-                        continue
-                    if value is None and getattr(cls, name, ...) is None:
-                        continue
-                    value, simple = _format(value, level)
-                    allsimple = allsimple and simple
-                    args.append('%s=%s' % (name, value))
-            if allsimple and len(args) <= 3:
-                return '%s { %s }' % ("&" + class_name, ', '.join(args)), not args
-            return '%s { %s%s }' % ("&" + class_name, prefix, sep.join(args)), False
+                result.append(('%s=' % name, value))
+        return result
+
+    def is_simple(value):
+        if isinstance(value, GoAST):
+            return not items(value)
+        if isinstance(value, list):
+            return not value
+        return True
+
+    pending = []
+    # Writes are batched since out might be unbuffered
+    stack = [(node, 0)]
+    while stack:
+        node = stack.pop()
+        if isinstance(node, str):
+            pending.append(node)
+            if len(pending) >= 4096:
+                out.write(''.join(pending))
+                pending.clear()
+            continue
+        node, level = node
+        if indent is not None:
+            level += 1
+            prefix = '\n' + indent * level
+            sep = ',\n' + indent * level
+        else:
+            prefix = ''
+            sep = ', '
+        if isinstance(node, GoAST):
+            class_name = getattr(node, "_prefix", "") + node.__class__.__name__
+            args = items(node)
+            # Without an indent both layouts are the same, so there's no need to look ahead
+            if indent is not None and len(args) <= 3 and all(is_simple(value) for _, value in args):
+                prefix = ''
+                sep = ', '
+            parts = ['&%s { %s' % (class_name, prefix)]
+            for i, (label, value) in enumerate(args):
+                parts.append((sep if i else '') + label)
+                parts.append((value, level))
+            parts.append(' }')
         elif isinstance(node, list):
             list_type = get_list_type(node)
-            if not node:
-                return f'[]{list_type} {{}}', True
-            return f'[]{list_type} {{%s%s}}' % (prefix, sep.join(_format(x, level)[0] for x in node)), False
+            parts = ['[]%s {%s' % (list_type, prefix if node else '')]
+            for i, value in enumerate(node):
+                if i:
+                    parts.append(sep)
+                parts.append((value, level))
+            parts.append('}')
         elif isinstance(node, token):
-            return f"token.{node.name}", True
-        # Prefer json.dumps over repr
-        try:
-            return json.dumps(node, ensure_ascii=False), True
-        except:
-            return repr(node), True
+            parts = ["token.%s" % node.name]
+        else:
+            # Prefer json.dumps over repr
+            try:
+                parts = [json.dumps(node, ensure_ascii=False)]
+            except:
+                parts = [repr(node)]
+        parts.reverse()
+        stack += parts
+    out.write(''.join(pending))
 
-    if not isinstance(node, GoAST):
-        raise TypeError('expected GoAST, got %r' % node.__class__.__name__)
-    if indent is not None and not isinstance(indent, str):
-        indent = ' ' * indent
-    return _format(node)[0]
 
 def dump_json(node, annotate_fields=True, include_attributes=False, *, indent=None):  # pragma: no cover
     """
@@ -154,12 +224,11 @@ def dump_json(node, annotate_fields=True, include_attributes=False, *, indent=No
         class_name = getattr(node, "_prefix", "") + node.__class__.__name__
 
         if isinstance(node, GoAST):
-            node.remove_falsy_fields()
             cls = type(node)
             args = []
             allsimple = True
             keywords = annotate_fields
-            for name in node._fields:
+            for name in [f for f in node._fields if getattr(node, f, None)]:
                 try:
                     value = getattr(node, name)
                 except AttributeError:
@@ -168,7 +237,7 @@ def dump_json(node, annotate_fields=True, include_attributes=False, *, indent=No
                 if value is None and getattr(cls, name, ...) is None:
                     keywords = True
                     continue
-                value, simple = _format(value, level)
+                value, simple = yield _format(value, level)
                 allsimple = allsimple and simple
                 if keywords:
                     try:
@@ -190,7 +259,7 @@ def dump_json(node, annotate_fields=True, include_attributes=False, *, indent=No
                         continue
                     if value is None and getattr(cls, name, ...) is None:
                         continue
-                    value, simple = _format(value, level)
+                    value, simple = yield _format(value, level)
                     allsimple = allsimple and simple
                     try:
                         json.dumps(value)
@@ -204,61 +273,251 @@ def dump_json(node, annotate_fields=True, include_attributes=False, *, indent=No
             list_type = get_list_type(node)
             if not node:
                 return {f'[]{list_type}': []}, True
-            return {f"[]{list_type}": [_format(x, level)[0] for x in node]}, False
+            items = []
+            for x in node:
+                items.append((yield _format(x, level))[0])
+            return {f"[]{list_type}": items}, False
         return node, True
 
     if not isinstance(node, GoAST):
         raise TypeError('expected GoAST, got %r' % node.__class__.__name__)
     if indent is not None and not isinstance(indent, str):
         indent = ' ' * indent
-    return json.dumps(_format(node)[0])
-
-def clean_go_tree(go_tree: File):
-    from pytago.go_ast import InterfaceTypeCounter
+    return json.dumps(trampoline(_format(node))[0])
 
+def clean_go_tree(go_tree: File, jobs: Optional[int] = None):
+    """
+    Apply ALL_TRANSFORMS to go_tree, one stage at a time. If jobs is more than 1, stage 1
+    is applied to independent groups of declarations in that many processes at once, if
+    they're worth forking for. Either way, go_tree ends up the same.
+    """
     tsfms_by_stage = defaultdict(list)
     for tsfm in ALL_TRANSFORMS:
         tsfms_by_stage[tsfm.STAGE].append(tsfm)
 
     for stage in sorted(tsfms_by_stage):
-        start_count = 0
-        end_count = -1
-        repeats = -1
-        while (end_count < start_count):
-            repeats += 1
-            start_count = InterfaceTypeCounter.get_interface_count(go_tree)
-            for tsfm in tsfms_by_stage[stage]:
-                if repeats == 0 or tsfm.REPEATABLE:
-                    tsfm().visit(go_tree)
-            end_count = InterfaceTypeCounter.get_interface_count(go_tree)
+        if stage == 1 and jobs and jobs > 1 and parallel.can_fork():
+            _apply_stage_in_parallel(go_tree, tsfms_by_stage[stage], jobs)
+        else:
+            _apply_stage(go_tree, tsfms_by_stage[stage])
+
+
+def _apply_stage(go_tree: File, tsfms: list):
+    start_count = 0
+    end_count = -1
+    repeats = -1
+    while (end_count < start_count):
+        repeats += 1
+        count("fixed_point_rounds")
+        start_count = _interface_count(go_tree)
+        _apply_round(go_tree, tsfms, repeats)
+        end_count = _interface_count(go_tree)
+
+
+def _apply_round(go_tree: File, tsfms: list, repeats: int):
+    # Only snapshotted when asked for, since it takes about as long as a transformer does
+    recording = recording_rewrites_active()
+    for tsfm in tsfms:
+        if repeats == 0 or tsfm.REPEATABLE:
+            transformer = tsfm()
+            before = _fields_by_node(go_tree) if recording else None
+            transformer.visit(go_tree)
+            count("transformer_invocations")
+            count("nodes_visited", transformer.nodes_visited)
+            if recording:
+                rewrites(tsfm.__name__, repeats, _rewrites_made(before, go_tree))
+
+
+def _fields_by_node(go_tree: GoAST) -> dict[int, tuple[GoAST, list]]:
+    """Every node in go_tree by id, along with its fields (lists copied), for _rewrites_made"""
+    return {id(node): (node, [tuple(value) if isinstance(value, list) else value
+                              for value in _field_values(node)])
+            for node in walk(go_tree)}
+
+
+def _field_values(node: GoAST) -> list:
+    return [getattr(node, field, None) for field in node._fields]
+
+
+def _rewrites_made(before: dict[int, tuple[GoAST, list]], go_tree: GoAST) -> int:
+    """
+    How many fields of the nodes go_tree had when before was taken have been set to something
+    else since, or had nodes spliced into or out of them. A node that's been replaced counts
+    once, in the field it was replaced in, however much of it is new.
+    """
+    made = 0
+    for node in walk(go_tree):
+        # before holds on to every node in it, so an id in it can't have been reused
+        old_fields = before.get(id(node), (None, None))[1]
+        if old_fields is None:
+            continue
+        for old, new in zip(old_fields, _field_values(node)):
+            if isinstance(new, list):
+                new = tuple(new)
+                if type(old) is not tuple or len(old) != len(new) or any(x is not y for x, y in zip(old, new)):
+                    made += 1
+            elif old is not new and (isinstance(new, GoAST) or old != new):
+                made += 1
+    return made
+
+
+def _interface_count(go_tree: File) -> int:
+    from pytago.go_ast import InterfaceTypeCounter
+    return InterfaceTypeCounter.get_interface_count(go_tree)
+
+
+def _apply_stage_in_parallel(go_tree: File, tsfms: list, jobs: int):
+    """
+    Apply tsfms to each independent unit of go_tree's declarations in parallel, round for
+    round and in the same order as _apply_stage would, if there are units worth forking for.
+    """
+    units = parallel.partition_decls(go_tree)
+    if parallel.worth_forking(go_tree, units):
+        parallel.transform_units(go_tree, units, jobs,
+                                  lambda tree, repeats: _apply_round(tree, tsfms, repeats), _interface_count)
+    else:
+        _apply_stage(go_tree, tsfms)
 
 
 def _gorun(filename: str) -> str:
-    p = Popen(["go", "run", "-gcflags=-N -l", filename], stdout=PIPE, stderr=PIPE, stdin=PIPE)
-    out, err = p.communicate()
-    if err:
-        return "\n".join("// " + x for x in err.decode().strip().splitlines())
-    return out.decode()
+    with stage("gorun"):
+        count("subprocess_spawns")
+        p = Popen(_GORUN_ARGS + [filename], stdout=PIPE, stderr=PIPE, stdin=PIPE)
+        out, err = p.communicate()
+        return _gorun_output(out, err)
 
 
 def _gofumpt(code: str) -> str:
-    p = Popen(["gofumpt"], stdout=PIPE, stderr=PIPE, stdin=PIPE)
-    out, err = p.communicate(code.encode())
-    if err:
-        return code + "\n" + "\n".join("// " + x for x in err.decode().strip().splitlines())
-    return out.decode()
+    with stage("gofumpt"):
+        count("subprocess_spawns")
+        p = Popen(["gofumpt"], stdout=PIPE, stderr=PIPE, stdin=PIPE)
+        out, err = p.communicate(code.encode())
+        return _formatter_output(code, out, err)
 
 
 def _goimport(code: str) -> str:
-    p = Popen(["goimports"], stdout=PIPE, stderr=PIPE, stdin=PIPE)
-    out, err = p.communicate(code.encode())
+    with stage("goimports"):
+        count("subprocess_spawns")
+        p = Popen(["goimports"], stdout=PIPE, stderr=PIPE, stdin=PIPE)
+        out, err = p.communicate(code.encode())
+        return _formatter_output(code, out, err)
+
+def _golines(code: str) -> str:
+    with stage("golines"):
+        count("subprocess_spawns")
+        p = Popen(["golines"], stdout=PIPE, stderr=PIPE, stdin=PIPE)
+        out, err = p.communicate(code.encode())
+        return _formatter_output(code, out, err)
+
+
+_GORUN_ARGS = ["go", "run", "-gcflags=-N -l"]
+
+
+def _as_comments(err: bytes) -> str:
+    return "\n".join("// " + x for x in err.decode().strip().splitlines())
+
+
+def _gorun_output(out: bytes, err: bytes) -> str:
     if err:
-        return code + "\n" + "\n".join("// " + x for x in err.decode().strip().splitlines())
+        return _as_comments(err)
     return out.decode()
 
-def _golines(code: str) -> str:
-    p = Popen(["golines"], stdout=PIPE, stderr=PIPE, stdin=PIPE)
-    out, err = p.communicate(code.encode())
+
+def _formatter_output(code: str, out: bytes, err: bytes) -> str:
     if err:
-        return code + "\n" + "\n".join("// " + x for x in err.decode().strip().splitlines())
+        return code + "\n" + _as_comments(err)
     return out.decode()
+
+
+def compilation_code(go_tree: GoAST, indent=None) -> str:
+    """The Go program that prints go_tree as source code"""
+    out = io.StringIO()
+    out.write(_COMPILATION_CODE_HEAD)
+    dump_to(go_tree, out, indent=indent)
+    out.write(_COMPILATION_CODE_TAIL)
+    return out.getvalue()
+
+
+async def unparse_async(go_tree: GoAST, apply_transformations=True, debug=False, jobs: Optional[int] = None,
+                        timeout: Optional[float] = None) -> str:
+    """
+    Like unparse, but the go toolchain runs without blocking the event loop. Transforming
+    the tree still happens on the calling thread; see python_to_go_async for running that
+    part in an executor. Raises asyncio.TimeoutError if the go toolchain takes more than
+    timeout seconds altogether.
+    """
+    if apply_transformations:
+        clean_go_tree(go_tree, jobs=jobs)
+    indent = '   ' if debug and logger.isEnabledFor(logging.DEBUG) else None
+    return await unparse_compilation_code_async(compilation_code(go_tree, indent=indent), debug=debug,
+                                                timeout=timeout)
+
+
+async def unparse_compilation_code_async(code: str, debug=False, timeout: Optional[float] = None) -> str:
+    """
+    Run the program made by compilation_code and format its output. Cancelling the
+    task or running out of time kills whatever go toolchain process is running.
+    """
+    loop = asyncio.get_running_loop()
+    deadline = None if timeout is None else loop.time() + timeout
+
+    def remaining():
+        return None if deadline is None else max(0.0, deadline - loop.time())
+
+    artifacts = DebugArtifacts() if debug and logger.isEnabledFor(logging.DEBUG) else None
+    tmp_file = tempfile.NamedTemporaryFile(suffix=".go", delete=False)
+    try:
+        tmp_file.close()
+        if artifacts is not None:
+            code = await _gofumpt_async(code, remaining())
+            artifacts.capture("compilation_code", code, log=True)
+        with open(tmp_file.name, "w", encoding="utf_8") as f:
+            f.write(code)
+        code = await _gorun_async(tmp_file.name, remaining())
+    finally:
+        os.remove(tmp_file.name)
+    if artifacts is not None:
+        artifacts.capture("code", code, log=True)
+    code = await _goimport_async(code, remaining())
+    code = await _gofumpt_async(code, remaining())
+    externally_formatted_code = await _golines_async(code, remaining())
+    if artifacts is not None:
+        artifacts.capture("go", externally_formatted_code, log=True)
+    return externally_formatted_code
+
+
+async def _communicate_async(args: list[str], input: Optional[bytes] = None,
+                             timeout: Optional[float] = None) -> tuple[bytes, bytes]:
+    # A session of its own, so that killing it also kills what `go run` started
+    count("subprocess_spawns")
+    p = await asyncio.create_subprocess_exec(*args, stdin=PIPE, stdout=PIPE, stderr=PIPE,
+                                             start_new_session=hasattr(os, "killpg"))
+    try:
+        return await asyncio.wait_for(p.communicate(input), timeout)
+    except BaseException:
+        if p.returncode is None:
+            if hasattr(os, "killpg"):
+                try:
+                    os.killpg(p.pid, signal.SIGKILL)
+                except ProcessLookupError:
+                    pass
+            else:
+                p.kill()
+            await p.wait()
+        raise
+
+
+async def _gorun_async(filename: str, timeout: Optional[float] = None) -> str:
+    return _gorun_output(*await _communicate_async(_GORUN_ARGS + [filename], timeout=timeout))
+
+
+async def _gofumpt_async(code: str, timeout: Optional[float] = None) -> str:
+    return _formatter_output(code, *await _communicate_async(["gofumpt"], code.encode(), timeout))
+
+
+async def _goimport_async(code: str, timeout: Optional[float] = None) -> str:
+    return _formatter_output(code, *await _communicate_async(["goimports"], code.encode(), timeout))
+
+
+async def _golines_async(code: str, timeout: Optional[float] = None) -> str:
+    return _formatter_output(code, *await _communicate_async(["golines"], code.encode(), timeout))
@@ -6,6 +6,8 @@ from collections import defaultdict
 from enum import Enum
 from typing import TYPE_CHECKING, TypeVar, List, Optional
 
+from pytago.metrics import snippet
+
 if TYPE_CHECKING:  # pragma: no cover
     from pytago import go_ast
 
@@ -130,6 +132,7 @@ class Bindable:
         return binded
 
     def binded_go_ast(self, binding):
+        snippet(f"py_snippets.{self.f.__name__}")
         binded_ast = self.binded_ast(binding)
 
         match self.bind_type:
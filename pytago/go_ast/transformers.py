@@ -1,6 +1,7 @@
 import ast
 import warnings
 from _ast import AST
+from types import GeneratorType
 from typing import Optional
 
 import dill
@@ -13,6 +14,7 @@ from pytago.go_ast import CallExpr, Ident, SelectorExpr, File, FuncDecl, BinaryE
 from pytago.go_ast.core import _find_nodes, GoAST, ChanType, StructType, InterfaceType, BadExpr, OP_COMPLIMENTS, \
     GoStmt, TypeSwitchStmt, StarExpr, GenDecl, TypeAssertExpr, DeclStmt, BranchStmt, \
     go_op_to_go_py_dunder, py_dunder_to_go_name, _type_str_to_go_type
+from pytago.go_ast.traversal import trampoline, walk
 
 v = Ident.from_str
 
@@ -22,38 +24,101 @@ def safe_deepcopy(t):
     """
     return dill.copy(t)
 
-class InterfaceTypeCounter(ast.NodeVisitor):
-    def __init__(self):
-        self.interface_types = 0
-
-    def visit_InterfaceType(self, node: ast.NodeVisitor):
-        self.interface_types += 1
-
-    @classmethod
-    def get_interface_count(cls, node: GoAST) -> int:
-        counter = cls()
-        counter.visit(node)
-        return counter.interface_types
+class InterfaceTypeCounter:
+    @staticmethod
+    def get_interface_count(node: GoAST) -> int:
+        # Interface types nested inside other interface types aren't counted
+        is_interface = lambda x: isinstance(x, InterfaceType)
+        return sum(1 for x in walk(node, descend=lambda x: not is_interface(x)) if is_interface(x))
 
 
 class BaseTransformer(ast.NodeTransformer):
+    """
+    An ast.NodeTransformer that doesn't recurse into nodes it has no visit_* method for.
+
+    generic_visit is driven by an explicit stack (see traversal.trampoline), so only nodes
+    with a visit_* method cost a Python stack frame. Subclasses that need to hook into
+    generic visits should override _generic_visit_steps rather than generic_visit.
+
+    A visit_* method that calls generic_visit starts a stack of its own, so nesting the
+    nodes it's for nests Python frames after all. Those for nodes that nest deeply in
+    generated code (BinaryExpr, CallExpr, IfStmt) are generators instead, which
+    `yield from self._generic_visit_steps(node)` in place of calling generic_visit, and
+    run on the stack of whatever is visiting them. Call them through trampoline.
+
+    rewrites counts the changes made through what visit_* methods return: a node replaced
+    by a different one, removed, or spliced into a list as several. Changes made in place
+    aren't counted, so a transformer that rewrote nothing hasn't necessarily left the tree
+    as it was; pytago.metrics.recording_rewrites compares every node's fields for that.
+    """
     REPEATABLE = True
     STAGE = 1
+    # How many nodes this has been handed so far, for pytago.metrics.count
+    nodes_visited = 0
+    rewrites = 0
 
     def __init__(self):
         self.exit_callbacks = [self.generic_exit_callback]
         self.at_root = True
 
     def visit(self, node: GoAST):
+        self.nodes_visited += 1
         at_root = self.at_root
         self.at_root = False
         # Perform the entire visiting process
-        node = super().visit(node)
+        new_node = super().visit(node)
+        if isinstance(new_node, GeneratorType):
+            new_node = trampoline(new_node, self._dispatch)
+        if new_node is not node:
+            self.rewrites += 1
         if at_root:
             for callback in self.exit_callbacks:
-                callback(node)
+                callback(new_node)
+        return new_node
+
+    def generic_visit(self, node: AST):
+        return trampoline(self._generic_visit_steps(node), self._dispatch)
+
+    def _generic_visit_steps(self, node: AST):
+        for field, old_value in ast.iter_fields(node):
+            if isinstance(old_value, list):
+                new_values = []
+                for value in old_value:
+                    if isinstance(value, AST):
+                        new_value = yield value
+                        if new_value is not value:
+                            self.rewrites += 1
+                        if new_value is None:
+                            continue
+                        elif not isinstance(new_value, AST):
+                            new_values.extend(new_value)
+                            continue
+                        value = new_value
+                    new_values.append(value)
+                old_value[:] = new_values
+            elif isinstance(old_value, AST):
+                new_node = yield old_value
+                if new_node is not old_value:
+                    self.rewrites += 1
+                if new_node is None:
+                    delattr(node, field)
+                else:
+                    setattr(node, field, new_node)
         return node
 
+    def _dispatch(self, node: AST):
+        """
+        Equivalent to self.visit(node) below the root, except that generic visits are handed
+        back to the trampoline as generators instead of being made recursively.
+        """
+        self.nodes_visited += 1
+        method = getattr(self, 'visit_' + node.__class__.__name__, None)
+        if method is not None:
+            return method(node)
+        if type(self).generic_visit is not BaseTransformer.generic_visit:
+            return self.generic_visit(node)
+        return self._generic_visit_steps(node)
+
     def generic_exit_callback(self, *args, **kwargs):
         return
 
@@ -92,13 +157,13 @@ class InsertUniqueInitializers(BaseTransformer):
         super().__init__()
         self.to_initialize = []
 
-    def generic_visit(self, node: AST):
+    def _generic_visit_steps(self, node: AST):
         if hasattr(node, "_py_context"):
             # Some expressions have initializations attached to their body
             initializations = node._py_context.get("initializations", [])
             while initializations:  # Clear them to avoid the recursive case
                 self.generic_visit(initializations.pop())
-        return super().generic_visit(node)
+        return (yield from super()._generic_visit_steps(node))
 
     def visit_FuncLit(self, node: FuncLit):
         # Handles PYTAGO_INIT for expressions
@@ -135,7 +200,7 @@ class PrintToFmtPrintln(BaseTransformer):
     """
 
     def visit_CallExpr(self, node: CallExpr):
-        self.generic_visit(node)
+        yield from self._generic_visit_steps(node)
         match node.Fun:
             case Ident(Name="print"):
                 node.Fun = SelectorExpr(X=v("fmt"), Sel=v("Println"))
@@ -227,7 +292,7 @@ class NodeTransformerWithScope(BaseTransformer):
                 return True
         return isinstance(value, Stmt) and not isinstance(value, (AssignStmt, ValueSpec))
 
-    def generic_visit(self, node):
+    def _generic_visit_steps(self, node):
         self.stack.append(node)
         prev_globals = self.current_globals
         prev_nonlocals = self.current_nonlocals
@@ -251,23 +316,28 @@ class NodeTransformerWithScope(BaseTransformer):
                         new_scope = self.should_apply_new_scope(value)
                         if new_scope:
                             self.scope = Scope({}, self.scope)
-                        value = self.visit(value)
+                        new_value = yield value
                         if new_scope:
                             self.scope = self.scope.Outer
-                        if value is None:
+                        if new_value is not value:
+                            self.rewrites += 1
+                        if new_value is None:
                             continue
-                        elif not isinstance(value, AST):
-                            new_values.extend(value)
+                        elif not isinstance(new_value, AST):
+                            new_values.extend(new_value)
                             continue
+                        value = new_value
                     new_values.append(value)
                 old_value[:] = new_values
             elif isinstance(old_value, AST):
                 new_scope = self.should_apply_new_scope(old_value)
                 if new_scope:
                     self.scope = Scope({}, self.scope)
-                new_node = self.visit(old_value)
+                new_node = yield old_value
                 if new_scope:
                     self.scope = self.scope.Outer
+                if new_node is not old_value:
+                    self.rewrites += 1
                 if new_node is None:
                     delattr(node, field)
                 else:
@@ -644,7 +714,7 @@ class AppendSliceViaUnpacking(NodeTransformerWithScope):
 
 class ReplacePowWithMathPow(NodeTransformerWithScope):
     def visit_BinaryExpr(self, node: BinaryExpr):
-        self.generic_visit(node)
+        yield from self._generic_visit_steps(node)
         match node:
             case BinaryExpr(Op=token.PLACEHOLDER_POW):
                 replacement = CallExpr(Args=[node.X, node.Y],
@@ -743,7 +813,7 @@ class FileWritesAndErrors(NodeTransformerWithScope):
     REPEATABLE = False
 
     def visit_CallExpr(self, node: CallExpr):
-        self.generic_visit(node)
+        yield from self._generic_visit_steps(node)
         match node:
             case CallExpr(Fun=SelectorExpr(X=Ident(Name="os"), Sel=Ident(Name="OpenFile"))):
                 f = v("f", _type_help=node._type(), _py_context=node._py_context)
@@ -838,7 +908,7 @@ def get_dominant_type(type_a: Expr, type_b: Expr, op: Optional[token] = None):
 
 class HandleTypeCoercion(NodeTransformerWithScope):
     def visit_BinaryExpr(self, node: BinaryExpr):
-        self.generic_visit(node)
+        yield from self._generic_visit_steps(node)
         x_type, y_type = self.scope._get_type(node.X), self.scope._get_type(node.Y)
         match node.Op:
             case token.PLACEHOLDER_FLOOR_DIV:
@@ -911,7 +981,7 @@ class HandleTypeCoercion(NodeTransformerWithScope):
         match node:
             case AssignStmt(Lhs=[X], Rhs=[Y], Tok=token.MUL_ASSIGN):
                 mole_in = BinaryExpr(Op=token.MUL, X=X, Y=Y)
-                mole_out = self.visit_BinaryExpr(mole_in)
+                mole_out = trampoline(self.visit_BinaryExpr(mole_in), self._dispatch)
                 if mole_in != mole_out:
                     node.Tok = token.ASSIGN
                     node.Rhs[:] = [mole_out]
@@ -919,7 +989,7 @@ class HandleTypeCoercion(NodeTransformerWithScope):
         return node
 
     def visit_CallExpr(self, node: CallExpr):
-        self.generic_visit(node)
+        yield from self._generic_visit_steps(node)
         match node.Fun:
             case SelectorExpr(X=Ident(Name="math")):
                 # Coerce all arguments to float64
@@ -942,7 +1012,7 @@ class HandleTypeCoercion(NodeTransformerWithScope):
 
 class RemoveDuplicateCoercion(NodeTransformerWithScope):
     def visit_CallExpr(self, node: CallExpr):
-        self.generic_visit(node)
+        yield from self._generic_visit_steps(node)
         match node.Fun:
             case Ident(Name=basic_type) if basic_type in (gbt.value for gbt in GoBasicType):
                 # If the argument is a call to the same basic type, remove the coercion
@@ -954,7 +1024,7 @@ class RemoveDuplicateCoercion(NodeTransformerWithScope):
 
 class RequestsToHTTP(NodeTransformerWithScope):
     def visit_CallExpr(self, node: CallExpr):
-        self.generic_visit(node)
+        yield from self._generic_visit_steps(node)
         match node.Fun:
             case SelectorExpr(X=Ident(Name="requests")):
                 node.Fun.X.Name = "http"
@@ -1070,7 +1140,7 @@ class AddTextTemplateImportForFStrings(BaseTransformer):
         return node
 
     def visit_CallExpr(self, node: CallExpr):
-        self.generic_visit(node)
+        yield from self._generic_visit_steps(node)
         match node:
             case CallExpr(Fun=SelectorExpr(Sel=Ident(Name="New"), X=Ident(Name="template")), Args=[BasicLit(Value='"f"')]):
                 self.visited_fstring = True
@@ -1101,7 +1171,7 @@ class UseConstructorIfAvailable(BaseTransformer):
         return node
 
     def visit_CallExpr(self, node: CallExpr):
-        self.generic_visit(node)
+        yield from self._generic_visit_steps(node)
         match node.Fun:
             case Ident(Name=x):
                 if f"New{x}" in self.declared_function_names:
@@ -1111,7 +1181,7 @@ class UseConstructorIfAvailable(BaseTransformer):
 
 class SpecialComparators(NodeTransformerWithScope):
     def visit_BinaryExpr(self, node: BinaryExpr):
-        self.generic_visit(node)
+        yield from self._generic_visit_steps(node)
         match node.Op:
             case token.PLACEHOLDER_IN:
                 node.Op = token.NEQ
@@ -1206,7 +1276,7 @@ class YieldTransformer(NodeTransformerWithScope):
     REPEATABLE = False
 
     def visit_CallExpr(self, node: CallExpr):
-        self.generic_visit(node)
+        yield from self._generic_visit_steps(node)
         match node:
             case CallExpr(Fun=Ident(Name="next"), Args=[chan]):
                 return chan.call().receive()
@@ -1338,7 +1408,7 @@ class InitStmt(NodeTransformerWithScope):
 
 class FillDefaultsAndSortKeywords(NodeTransformerWithScope):
     def visit_CallExpr(self, node: CallExpr):
-        self.generic_visit(node)
+        yield from self._generic_visit_steps(node)
         return node
 
     def generic_missing_type_callback(self, node: Expr, val: Expr, type_: Expr):
@@ -1388,7 +1458,7 @@ class FillDefaultsAndSortKeywords(NodeTransformerWithScope):
 
 class Truthiness(NodeTransformerWithScope):
     def visit_IfStmt(self, node: IfStmt):
-        self.generic_visit(node)
+        yield from self._generic_visit_steps(node)
         if node.Cond and (type_ := self.scope._get_type(node.Cond)):
             node.Cond = node.Cond.cast(type_, Ident("bool"))
         return node
@@ -1407,7 +1477,7 @@ class Truthiness(NodeTransformerWithScope):
 class IterFuncs(NodeTransformerWithScope):
     # TODO: Deprecate via pysnippets
     def visit_CallExpr(self, node: CallExpr):
-        self.generic_visit(node)
+        yield from self._generic_visit_steps(node)
         if len(node.Args) == 0:
             return node
         if len(node.Args) == 1:
@@ -1499,7 +1569,7 @@ class IterFuncs(NodeTransformerWithScope):
 class IterMethods(NodeTransformerWithScope):
     # TODO: Deprecate via pysnippets
     def visit_CallExpr(self, node: CallExpr):
-        self.generic_visit(node)
+        yield from self._generic_visit_steps(node)
         if len(node.Args) != 0:
             return node
         if not isinstance(node.Fun, SelectorExpr):
@@ -1577,7 +1647,7 @@ class RemoveBadStmt(BaseTransformer):
 
 class PySnippetSwitches(NodeTransformerWithScope):
     def visit_CallExpr(self, node: CallExpr):
-        node = self.generic_visit(node)
+        node = yield from self._generic_visit_steps(node)
         if 'py_snippet' not in node._py_context:
             return node
 
@@ -1656,8 +1726,8 @@ class NodeTransformerWithInterfaceTypes(NodeTransformerWithScope):
                     s.generic_visit(node)
                     return node
 
-                def generic_visit(s, node):
-                    node = super().generic_visit(node)
+                def _generic_visit_steps(s, node):
+                    node = yield from super()._generic_visit_steps(node)
 
                     if not elt_types:
                         for elt in elts:
@@ -1692,7 +1762,7 @@ class NodeTransformerWithInterfaceTypes(NodeTransformerWithScope):
 
 class UntypedFunctionsTypedByCalls(NodeTransformerWithScope):
     def visit_CallExpr(self, node: CallExpr):
-        node = self.generic_visit(node)
+        node = yield from self._generic_visit_steps(node)
         scope = self.scope
 
         def exit_callback(*args, **kwargs):
@@ -1778,7 +1848,7 @@ class CallTypeInformation(NodeTransformerWithScope):
                                                 if t:
                                                     field.Type = safe_deepcopy(t)
                                                     break
-        self.generic_visit(node)
+        yield from self._generic_visit_steps(node)
         return node
 
     def visit_InterfaceType(self, node: InterfaceType):
@@ -1812,7 +1882,7 @@ def is_user_defined_class_type(node_type):
 
 class DundersToMethodCalls(NodeTransformerWithScope):
     def visit_BinaryExpr(self, node: BinaryExpr):
-        self.generic_visit(node)
+        yield from self._generic_visit_steps(node)
         for x, y in (node.X, node.Y), (node.Y, node.X):
             if is_user_defined_class_type(self.scope._get_type(x)):
                 py_dunder = go_op_to_go_py_dunder(node.Op)
@@ -1951,7 +2021,7 @@ class ComparingTypesComparesKinds(NodeTransformerWithScope):
     REPEATABLE = False
 
     def visit_BinaryExpr(self, node: BinaryExpr):
-        self.generic_visit(node)
+        yield from self._generic_visit_steps(node)
         x, y = node.X, node.Y
         for x, x_name, y, y_name in ((x, 'X', y, 'Y'), (y, 'Y', x, 'X')):
             match x:
@@ -2013,8 +2083,9 @@ class ScopeFunctionVars(BaseTransformer):
             return node
         potentially_expected_locals = set(x for x in py_locals.keys() if not (x.startswith("__") and x.endswith("__")))
         expected_locals = set()
-        for local in potentially_expected_locals:
-            usages = node.outermost_scope_search(Ident(local), skip=1)
+        potentially_expected_locals = list(potentially_expected_locals)
+        all_usages = node.outermost_scope_search_many([Ident(x) for x in potentially_expected_locals], skip=1)
+        for local, usages in zip(potentially_expected_locals, all_usages):
             if not usages:
                 continue
             if len(usages) == 1:  # May even need to make it "_"
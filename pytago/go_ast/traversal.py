@@ -0,0 +1,77 @@
+"""
+Explicit-stack tree traversal.
+
+Everything in here walks trees without recursing, so generated code with long
+elif chains, deeply nested expressions or huge literal tables can be processed
+without hitting the recursion limit.
+
+There are two building blocks:
+
+* `walk` and `walk_with_exit` iterate over the nodes of a tree depth-first, in
+  the same order `ast.NodeVisitor` would visit them.
+* `trampoline` runs a generator that yields sub-generators in place of making
+  recursive calls. The yielded generator is driven to completion and its return
+  value is sent back into the generator that yielded it. Recursive functions
+  can be turned into explicit-stack ones by replacing `f(x)` with
+  `(yield f(x))`. If a dispatch function is given, everything that's yielded goes
+  through it first, and only the generators it returns are run in place; any
+  other value it returns is sent straight back.
+"""
+import ast
+from types import GeneratorType
+from typing import Callable, Generator, Iterator, Optional
+
+
+def trampoline(steps: Generator, dispatch: Optional[Callable] = None):
+    stack = [steps]
+    value = None
+    while stack:
+        try:
+            child = stack[-1].send(value)
+        except StopIteration as stop:
+            stack.pop()
+            value = stop.value
+            continue
+        if dispatch is not None:
+            child = dispatch(child)
+            if not isinstance(child, GeneratorType):
+                value = child
+                continue
+        stack.append(child)
+        value = None
+    return value
+
+
+def walk(node: ast.AST, skipper: Optional[Callable] = None, descend: Optional[Callable] = None) -> Iterator[ast.AST]:
+    """
+    Yield node and all of its descendants depth-first. Nodes for which skipper returns
+    true are skipped along with their descendants. Nodes for which descend returns false
+    are yielded, but their descendants are not.
+    """
+    stack = [node]
+    while stack:
+        node = stack.pop()
+        if skipper and skipper(node):
+            continue
+        yield node
+        if descend and not descend(node):
+            continue
+        children = list(ast.iter_child_nodes(node))
+        children.reverse()
+        stack += children
+
+
+def walk_with_exit(node: ast.AST) -> Iterator[tuple[ast.AST, bool]]:
+    """
+    Like walk, but yields (node, True) when entering a node and (node, False)
+    once all of its descendants have been yielded.
+    """
+    stack = [(node, True)]
+    while stack:
+        node, entering = stack.pop()
+        yield node, entering
+        if entering:
+            stack.append((node, False))
+            children = [(child, True) for child in ast.iter_child_nodes(node)]
+            children.reverse()
+            stack += children
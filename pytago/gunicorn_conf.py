@@ -0,0 +1,9 @@
+"""
+Gunicorn settings for the web app: `gunicorn --config python:pytago.gunicorn_conf pytago.app:app`
+"""
+
+
+def post_worker_init(worker):
+    # Don't take traffic until the transpiler processes are warm
+    from pytago.app import warm_up
+    warm_up()
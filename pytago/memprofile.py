@@ -0,0 +1,125 @@
+"""
+Where a transpilation's memory goes, measured with tracemalloc.
+
+    with profiling_memory() as profile:
+        python_to_go(python)
+    print(profile.report())
+
+or `pytago --memprofile program.py`, which prints the same report to stderr.
+
+For every stage (see pytago.metrics.stage) the profile keeps the peak of traced memory
+while it ran, how much more was still allocated when it finished than when it
+started, the allocation sites holding the most memory at that point, and how many
+of each GoAST subclass were alive then. Only this process is traced, so with jobs
+the transforms that run in other processes aren't included.
+"""
+import gc
+import linecache
+import tracemalloc
+from collections import Counter
+from contextlib import contextmanager
+from typing import Iterator
+
+from pytago.metrics import observing_stages
+
+
+class StageMemory:
+    def __init__(self, name: str):
+        self.name = name
+        self.peak = 0
+        self.growth = 0
+        # (file, line, bytes, allocations), biggest first
+        self.top_sites: list[tuple[str, int, int, int]] = []
+        self.goast_counts: dict[str, int] = {}
+
+
+class MemoryProfile:
+    def __init__(self, top: int = 10):
+        self.top = top
+        self.stages: dict[str, StageMemory] = {}
+        self.peak = 0
+        # For each stage being run, the peak before it started and the peak of stages run inside it, which
+        # resetting the peak for them would otherwise lose
+        self._running: list[list[int]] = []
+
+    @contextmanager
+    def observe(self, name: str):
+        current, peak = tracemalloc.get_traced_memory()
+        self._running.append([peak, 0])
+        tracemalloc.reset_peak()
+        try:
+            yield
+        finally:
+            before, inner_peak = self._running.pop()
+            end, peak = tracemalloc.get_traced_memory()
+            peak = max(peak, inner_peak)
+            if self._running:
+                self._running[-1][1] = max(self._running[-1][1], before)
+            stage = self.stages.setdefault(name, StageMemory(name))
+            stage.peak = max(stage.peak, peak)
+            stage.growth += end - current
+            self.peak = max(self.peak, peak)
+            # What the stage has left behind is what's live now
+            stage.top_sites = top_sites(tracemalloc.take_snapshot(), self.top)
+            stage.goast_counts = goast_counts()
+
+    def report(self) -> str:
+        lines = [f"peak traced memory: {_size(self.peak)}"]
+        for stage in self.stages.values():
+            lines.append("")
+            lines.append(f"{stage.name}: peak {_size(stage.peak)}, {_size(stage.growth, sign=True)} when done")
+            for filename, lineno, size, count in stage.top_sites:
+                lines.append(f"  {_size(size):>10} {count:>8} allocations  {filename}:{lineno}")
+                if source := linecache.getline(filename, lineno).strip():
+                    lines.append(f"  {'':>10} {'':>8}              {source}")
+            if stage.goast_counts:
+                total = sum(stage.goast_counts.values())
+                lines.append(f"  {total} GoAST nodes alive:")
+                for class_name, count in list(stage.goast_counts.items())[:self.top]:
+                    lines.append(f"  {count:>10} {class_name}")
+        return "\n".join(lines)
+
+
+@contextmanager
+def profiling_memory(top: int = 10) -> Iterator[MemoryProfile]:
+    """
+    Trace this thread's stages into the yielded MemoryProfile, keeping the top biggest
+    allocation sites and GoAST subclasses of each. Starts tracemalloc if it isn't tracing
+    already, and stops it again afterwards.
+    """
+    started = not tracemalloc.is_tracing()
+    if started:
+        tracemalloc.start()
+    profile = MemoryProfile(top)
+    try:
+        with observing_stages(profile.observe):
+            yield profile
+    finally:
+        if started:
+            tracemalloc.stop()
+
+
+def top_sites(snapshot: tracemalloc.Snapshot, limit: int) -> list[tuple[str, int, int, int]]:
+    snapshot = snapshot.filter_traces((
+        tracemalloc.Filter(False, tracemalloc.__file__),
+        tracemalloc.Filter(False, __file__),
+    ))
+    return [(stat.traceback[0].filename, stat.traceback[0].lineno, stat.size, stat.count)
+            for stat in snapshot.statistics("lineno")[:limit]]
+
+
+def goast_counts() -> dict[str, int]:
+    """How many instances of each GoAST subclass are alive, most numerous first"""
+    from pytago.go_ast.core import GoAST
+    counts = Counter(type(o).__name__ for o in gc.get_objects() if isinstance(o, GoAST))
+    return dict(counts.most_common())
+
+
+def _size(n: int, sign: bool = False) -> str:
+    prefix = ("+" if n >= 0 else "-") if sign else ""
+    n = abs(n)
+    for unit in ("B", "KiB", "MiB"):
+        if n < 1024:
+            return f"{prefix}{n:.0f}{unit}" if unit == "B" else f"{prefix}{n:.1f}{unit}"
+        n /= 1024
+    return f"{prefix}{n:.1f}GiB"
@@ -0,0 +1,278 @@
+"""
+Just enough of the Prometheus client model to expose pytago's metrics as text.
+
+Metrics are registered on a Registry, and Registry.render produces the text
+exposition format for a /metrics endpoint. Counters and gauges can be backed by
+a function instead of being updated directly, which is how numbers that are
+already tracked elsewhere (cache hits, idle workers, ...) are exposed.
+
+Stage timings are collected with `stage`, which does nothing unless the current
+thread is inside `recording_stages`, or something is `observing_stages` (which is
+how pytago.memprofile measures them). In the same way, `snippet` counts the snippets
+a transpilation expands into its Go, for threads inside `recording_snippets`, and
+`count` adds to the deterministic counters (nodes visited, fixed-point rounds, ...)
+of threads inside `recording_counts`, and `rewrites` logs how many rewrites each
+transformer made in each fixed-point round, for threads inside `recording_rewrites`.
+A rewrite is a field of a node that a transformer set to something else, or spliced
+nodes into or out of, so one that's logged with 0 left the tree exactly as it was.
+Telling takes a snapshot of every node's fields around every transformer, so that
+one is slow.
+"""
+import math
+import threading
+import time
+from bisect import bisect_left
+from contextlib import ExitStack, contextmanager
+from typing import Callable, ContextManager, Iterator, Optional
+
+DEFAULT_BUCKETS = (0.005, 0.01, 0.025, 0.05, 0.1, 0.25, 0.5, 1.0, 2.5, 5.0, 10.0, 30.0, 60.0, math.inf)
+
+_local = threading.local()
+
+
+@contextmanager
+def recording_stages() -> Iterator[dict[str, float]]:
+    """Collect the seconds spent in each stage run by this thread into the yielded dict"""
+    previous = getattr(_local, "stages", None)
+    _local.stages = stages = {}
+    try:
+        yield stages
+    finally:
+        _local.stages = previous
+
+
+@contextmanager
+def observing_stages(observer: Callable[[str], ContextManager]) -> Iterator[None]:
+    """Run each stage that this thread runs inside the context manager observer(stage_name)"""
+    previous = getattr(_local, "observers", ())
+    _local.observers = previous + (observer,)
+    try:
+        yield
+    finally:
+        _local.observers = previous
+
+
+@contextmanager
+def stage(name: str):
+    stages = getattr(_local, "stages", None)
+    observers = getattr(_local, "observers", ())
+    if stages is None and not observers:
+        yield
+        return
+    with ExitStack() as observing:
+        for observer in observers:
+            observing.enter_context(observer(name))
+        start = time.perf_counter()
+        try:
+            yield
+        finally:
+            if stages is not None:
+                stages[name] = stages.get(name, 0.0) + time.perf_counter() - start
+
+
+@contextmanager
+def recording_snippets() -> Iterator[dict[str, int]]:
+    """Count how many times this thread expands each snippet into the yielded dict"""
+    previous = getattr(_local, "snippets", None)
+    _local.snippets = snippets = {}
+    try:
+        yield snippets
+    finally:
+        _local.snippets = previous
+
+
+def snippet(name: str):
+    snippets = getattr(_local, "snippets", None)
+    if snippets is not None:
+        snippets[name] = snippets.get(name, 0) + 1
+
+
+@contextmanager
+def recording_counts() -> Iterator[dict[str, int]]:
+    """Collect what this thread counts into the yielded dict"""
+    previous = getattr(_local, "counts", None)
+    _local.counts = counts = {}
+    try:
+        yield counts
+    finally:
+        _local.counts = previous
+
+
+def count(name: str, amount: int = 1):
+    counts = getattr(_local, "counts", None)
+    if counts is not None:
+        counts[name] = counts.get(name, 0) + amount
+
+
+@contextmanager
+def recording_rewrites() -> Iterator[dict[str, list[int]]]:
+    """Collect the rewrites each transformer run by this thread makes, by round, into the yielded dict"""
+    previous = getattr(_local, "rewrites", None)
+    _local.rewrites = log = {}
+    try:
+        yield log
+    finally:
+        _local.rewrites = previous
+
+
+def recording_rewrites_active() -> bool:
+    """Whether this thread is inside recording_rewrites, which rewrites are only worth working out for"""
+    return getattr(_local, "rewrites", None) is not None
+
+
+def rewrites(transformer: str, round: int, amount: int):
+    log = getattr(_local, "rewrites", None)
+    if log is not None:
+        rounds = log.setdefault(transformer, [])
+        rounds.extend([0] * (round + 1 - len(rounds)))
+        rounds[round] += amount
+
+
+def _format_value(value: float) -> str:
+    if value == math.inf:
+        return "+Inf"
+    return repr(float(value)) if isinstance(value, float) else str(value)
+
+
+def _format_labels(names: tuple, values: tuple, extra: str = "") -> str:
+    parts = [f'{name}="{_escape(str(value))}"' for name, value in zip(names, values)]
+    if extra:
+        parts.append(extra)
+    return "{" + ",".join(parts) + "}" if parts else ""
+
+
+def _escape(value: str) -> str:
+    return value.replace("\\", "\\\\").replace("\n", "\\n").replace('"', '\\"')
+
+
+class _Metric:
+    TYPE = None
+
+    def __init__(self, name: str, documentation: str, labels: tuple = (), function: Optional[Callable] = None):
+        self.name = name
+        self.documentation = documentation
+        self.labels = tuple(labels)
+        self.function = function
+        self._values = {}
+        self._lock = threading.Lock()
+
+    def _key(self, labels: dict) -> tuple:
+        if set(labels) != set(self.labels):
+            raise ValueError(f"{self.name} takes the labels {self.labels}, not {tuple(labels)}")
+        return tuple(labels[name] for name in self.labels)
+
+    def _samples(self) -> Iterator[str]:
+        if self.function is not None:
+            yield f"{self.name} {_format_value(self.function())}"
+            return
+        with self._lock:
+            values = list(self._values.items())
+        for key, value in values:
+            yield f"{self.name}{_format_labels(self.labels, key)} {_format_value(value)}"
+
+    def render(self) -> str:
+        header = f"# HELP {self.name} {self.documentation}\n# TYPE {self.name} {self.TYPE}\n"
+        return header + "".join(sample + "\n" for sample in self._samples())
+
+
+class Counter(_Metric):
+    TYPE = "counter"
+
+    def __init__(self, name: str, documentation: str, labels: tuple = (), function: Optional[Callable] = None):
+        super().__init__(name, documentation, labels, function)
+        if not self.labels:
+            self._values[()] = 0
+
+    def inc(self, amount: float = 1, **labels):
+        key = self._key(labels)
+        with self._lock:
+            self._values[key] = self._values.get(key, 0) + amount
+
+    def get(self, **labels) -> float:
+        if self.function is not None:
+            return self.function()
+        return self._values.get(self._key(labels), 0)
+
+
+class Gauge(Counter):
+    TYPE = "gauge"
+
+    def dec(self, amount: float = 1, **labels):
+        self.inc(-amount, **labels)
+
+    def set(self, value: float, **labels):
+        key = self._key(labels)
+        with self._lock:
+            self._values[key] = value
+
+    @contextmanager
+    def track_in_progress(self, **labels):
+        self.inc(**labels)
+        try:
+            yield
+        finally:
+            self.dec(**labels)
+
+
+class Histogram(_Metric):
+    TYPE = "histogram"
+
+    def __init__(self, name: str, documentation: str, labels: tuple = (), buckets: tuple = DEFAULT_BUCKETS):
+        super().__init__(name, documentation, labels)
+        self.buckets = tuple(sorted(set(buckets) | {math.inf}))
+
+    def observe(self, value: float, **labels):
+        key = self._key(labels)
+        with self._lock:
+            counts, total = self._values.get(key) or ([0] * len(self.buckets), 0.0)
+            counts[bisect_left(self.buckets, value)] += 1
+            self._values[key] = counts, total + value
+
+    @contextmanager
+    def time(self, **labels):
+        start = time.perf_counter()
+        try:
+            yield
+        finally:
+            self.observe(time.perf_counter() - start, **labels)
+
+    def count(self, **labels) -> int:
+        counts, _ = self._values.get(self._key(labels)) or ([0], 0.0)
+        return sum(counts)
+
+    def _samples(self) -> Iterator[str]:
+        with self._lock:
+            values = [(key, list(counts), total) for key, (counts, total) in self._values.items()]
+        for key, counts, total in values:
+            cumulative = 0
+            for bucket, count in zip(self.buckets, counts):
+                cumulative += count
+                le = f'le="{_format_value(bucket)}"'
+                yield f"{self.name}_bucket{_format_labels(self.labels, key, le)} {cumulative}"
+            yield f"{self.name}_sum{_format_labels(self.labels, key)} {_format_value(total)}"
+            yield f"{self.name}_count{_format_labels(self.labels, key)} {cumulative}"
+
+
+class Registry:
+    CONTENT_TYPE = "text/plain; version=0.0.4; charset=utf-8"
+
+    def __init__(self):
+        self._metrics = {}
+
+    def _register(self, metric: _Metric):
+        if metric.name in self._metrics:
+            raise ValueError(f"{metric.name} is already registered")
+        self._metrics[metric.name] = metric
+        return metric
+
+    def counter(self, name: str, documentation: str, labels: tuple = (), function: Optional[Callable] = None):
+        return self._register(Counter(name, documentation, labels, function))
+
+    def gauge(self, name: str, documentation: str, labels: tuple = (), function: Optional[Callable] = None):
+        return self._register(Gauge(name, documentation, labels, function))
+
+    def histogram(self, name: str, documentation: str, labels: tuple = (), buckets: tuple = DEFAULT_BUCKETS):
+        return self._register(Histogram(name, documentation, labels, buckets))
+
+    def render(self) -> str:
+        return "".join(metric.render() for metric in self._metrics.values())
@@ -0,0 +1,106 @@
+"""
+A sampling profiler for transpilations that take far too long, cheap enough to leave on.
+
+    with sampling_profile() as profile:
+        python_to_go(python)
+    profile.write("out.folded")
+
+or `pytago --sample-profile out.folded program.py`. The output is in the folded format
+that flamegraph.pl, speedscope and inferno read: one line per distinct stack, outermost
+frame first, followed by how many samples it was seen in.
+
+Every interval seconds, a background thread looks at what the profiled thread is running.
+Stacks start with the stage being run (see pytago.metrics.stage). Frames of transformers'
+visit_ methods are named after the transformer's class rather than where the method is
+defined, and labelled with the type of the node they're visiting, e.g.
+
+    stage:clean_go_tree;...;UnpackAssignments.visit_AssignStmt[AssignStmt];...
+
+Other frames are named after their function and where it's defined. Those are the only
+frames whose locals are looked at, since reading another thread's has side effects.
+
+Samples can't be taken more often than the interpreter switches threads
+(sys.getswitchinterval(), 5ms by default) while the profiled thread holds the GIL.
+"""
+import ast
+import os
+import sys
+import threading
+from collections import Counter
+from contextlib import contextmanager
+from typing import Iterator, Optional
+
+from pytago.metrics import observing_stages
+
+
+class SampleProfile:
+    def __init__(self, thread_id: int, interval: float):
+        self.thread_id = thread_id
+        self.interval = interval
+        self.samples: Counter[tuple[str, ...]] = Counter()
+        self.stage: Optional[str] = None
+        self._stop = threading.Event()
+        self._sampler = threading.Thread(target=self._sample_until_stopped, name="pytago-sampler", daemon=True)
+
+    @contextmanager
+    def observe(self, name: str):
+        previous, self.stage = self.stage, name
+        try:
+            yield
+        finally:
+            self.stage = previous
+
+    def _sample_until_stopped(self):
+        while not self._stop.wait(self.interval):
+            frame = sys._current_frames().get(self.thread_id)
+            if frame is not None:
+                self.sample(frame)
+
+    def sample(self, frame):
+        stack = []
+        while frame is not None:
+            stack.append(frame_label(frame))
+            frame = frame.f_back
+        if self.stage is not None:
+            stack.append(f"stage:{self.stage}")
+        self.samples[tuple(reversed(stack))] += 1
+
+    def folded(self) -> str:
+        return "".join(f"{';'.join(stack)} {count}\n" for stack, count in sorted(self.samples.items()))
+
+    def write(self, path: str):
+        with open(path, "w", encoding="utf_8") as f:
+            f.write(self.folded())
+
+
+def frame_label(frame) -> str:
+    code = frame.f_code
+    label = None
+    if code.co_name.startswith("visit_") and code.co_argcount == 2 and code.co_varnames[0] == "self":
+        from pytago.go_ast.transformers import BaseTransformer
+        # Both are arguments, so they're set however far the frame has got
+        variables = frame.f_locals
+        owner, node = variables.get("self"), variables.get(code.co_varnames[1])
+        if isinstance(owner, BaseTransformer):
+            label = f"{type(owner).__name__}.{code.co_name}"
+            if isinstance(node, ast.AST):
+                label += f"[{type(node).__name__}]"
+    if label is None:
+        # co_qualname is new in Python 3.11
+        name = getattr(code, "co_qualname", code.co_name)
+        label = f"{name} ({os.path.basename(code.co_filename)}:{code.co_firstlineno})"
+    # Folded stacks are split on semicolons, and on the last space for the count
+    return label.replace(";", ":")
+
+
+@contextmanager
+def sampling_profile(interval: float = 0.005) -> Iterator[SampleProfile]:
+    """Sample what this thread is running every interval seconds into the yielded SampleProfile"""
+    profile = SampleProfile(threading.get_ident(), interval)
+    profile._sampler.start()
+    try:
+        with observing_stages(profile.observe):
+            yield profile
+    finally:
+        profile._stop.set()
+        profile._sampler.join()
@@ -0,0 +1,236 @@
+"""
+`pytago serve`: a long-lived transpiler speaking line-delimited JSON-RPC 2.0.
+
+Requests and responses are one JSON object per line, over stdio or a Unix socket.
+
+    {"jsonrpc": "2.0", "id": 1, "method": "transpile", "params": {"py": "print(1)"}}
+    {"jsonrpc": "2.0", "id": 1, "result": {"go": "package main\\n..."}}
+
+Methods:
+
+* transpile(py, timeout=None) -> {"go": str}
+* transpile_many(sources, timeout=None) -> {"results": [{"go": str} | {"error": {...}}, ...]}
+* stats() -> counters, cache and pool sizes
+* shutdown() -> null, after which the server stops reading requests
+
+Requests are handled concurrently, so responses can come back in a different
+order than the requests were sent in; match them up by id.
+"""
+import json
+import os
+import socketserver
+import sys
+import threading
+import time
+from concurrent.futures import ThreadPoolExecutor, wait
+from typing import Optional, TextIO
+
+from pytago.cache import LRUCache, source_key
+from pytago.workers import TranspileTimeout, WorkerPool
+
+PARSE_ERROR = -32700
+INVALID_REQUEST = -32600
+METHOD_NOT_FOUND = -32601
+INVALID_PARAMS = -32602
+INTERNAL_ERROR = -32603
+PYTHON_SYNTAX_ERROR = -32000
+TIMEOUT_ERROR = -32001
+
+
+class RPCError(Exception):
+    def __init__(self, code: int, message: str):
+        super().__init__(message)
+        self.code = code
+        self.message = message
+
+
+class Server:
+    def __init__(self, workers: Optional[int] = None, timeout: Optional[float] = None, cache_size: int = 1024):
+        self.timeout = timeout
+        self.pool = WorkerPool(workers)
+        self.cache = LRUCache(cache_size)
+        self.started = time.monotonic()
+        self.requests = 0
+        self.errors = 0
+        # Requests are handled on many threads at once
+        self._counter_lock = threading.Lock()
+        self.shutting_down = threading.Event()
+        self._executor = ThreadPoolExecutor(max_workers=self.pool.size * 2, thread_name_prefix="pytago-serve")
+        self._batch_executor = ThreadPoolExecutor(max_workers=self.pool.size, thread_name_prefix="pytago-batch")
+        self._methods = {
+            "transpile": self.transpile,
+            "transpile_many": self.transpile_many,
+            "stats": self.stats,
+            "shutdown": self.shutdown,
+        }
+
+    def transpile(self, py: str, timeout: Optional[float] = None) -> dict:
+        if not isinstance(py, str):
+            raise RPCError(INVALID_PARAMS, "py must be a string")
+        go = self.cache.get_or_compute(source_key(py),
+                                       lambda: self._transpile(py, self.timeout if timeout is None else timeout))
+        return {"go": go}
+
+    def transpile_many(self, sources: list, timeout: Optional[float] = None) -> dict:
+        if not isinstance(sources, list):
+            raise RPCError(INVALID_PARAMS, "sources must be a list of strings")
+
+        def one(py):
+            try:
+                return self.transpile(py, timeout)
+            except RPCError as e:
+                return {"error": {"code": e.code, "message": e.message}}
+
+        return {"results": list(self._batch_executor.map(one, sources))}
+
+    def stats(self) -> dict:
+        return {
+            "uptime": time.monotonic() - self.started,
+            "requests": self.requests,
+            "errors": self.errors,
+            "timeouts": self.pool.timeouts,
+            "crashes": self.pool.crashes,
+            "workers": self.pool.size,
+            "idle_workers": self.pool.idle,
+            "cache_size": len(self.cache),
+            "cache_hits": self.cache.hits,
+            "cache_misses": self.cache.misses,
+            "cache_coalesced": self.cache.coalesced,
+        }
+
+    def shutdown(self) -> None:
+        self.shutting_down.set()
+
+    def _transpile(self, py: str, timeout: Optional[float]) -> str:
+        try:
+            return self.pool.transpile(py, timeout=timeout)
+        except SyntaxError as e:
+            raise RPCError(PYTHON_SYNTAX_ERROR, f"{type(e).__name__}: {e}")
+        except TranspileTimeout as e:
+            raise RPCError(TIMEOUT_ERROR, str(e))
+        except Exception as e:
+            raise RPCError(INTERNAL_ERROR, f"{type(e).__name__}: {e}")
+
+    def handle_line(self, line: str) -> Optional[str]:
+        """Handle one request, returning the response line, or None for notifications"""
+        with self._counter_lock:
+            self.requests += 1
+        request_id = None
+        try:
+            try:
+                request = json.loads(line)
+            except ValueError as e:
+                raise RPCError(PARSE_ERROR, str(e))
+            if not isinstance(request, dict) or not isinstance(request.get("method"), str):
+                raise RPCError(INVALID_REQUEST, "expected an object with a method")
+            request_id = request.get("id")
+            method = self._methods.get(request["method"])
+            if method is None:
+                raise RPCError(METHOD_NOT_FOUND, f"no such method: {request['method']}")
+            params = request.get("params", {})
+            try:
+                result = method(*params) if isinstance(params, list) else method(**params)
+            except TypeError as e:
+                raise RPCError(INVALID_PARAMS, str(e))
+            if "id" not in request:
+                return None
+            response = {"jsonrpc": "2.0", "id": request_id, "result": result}
+        except RPCError as e:
+            with self._counter_lock:
+                self.errors += 1
+            response = {"jsonrpc": "2.0", "id": request_id, "error": {"code": e.code, "message": e.message}}
+        return json.dumps(response)
+
+    def serve_stream(self, infile: TextIO, outfile: TextIO):
+        """Read requests from infile until it's exhausted or shutdown is called"""
+        write_lock = threading.Lock()
+
+        def respond(line):
+            if (response := self.handle_line(line)) is not None:
+                with write_lock:
+                    outfile.write(response + "\n")
+                    outfile.flush()
+
+        pending = set()
+        pending_lock = threading.Lock()
+
+        def done(future):
+            with pending_lock:
+                pending.discard(future)
+
+        shutdown_line = None
+        for line in infile:
+            if not line.strip():
+                continue
+            if _method_of(line) == "shutdown":
+                # Nothing sent after a shutdown gets started, and everything sent before it is answered first
+                shutdown_line = line
+                break
+            future = self._executor.submit(respond, line)
+            with pending_lock:
+                pending.add(future)
+            future.add_done_callback(done)
+        with pending_lock:
+            unfinished = list(pending)
+        wait(unfinished)
+        if shutdown_line is not None:
+            respond(shutdown_line)
+
+    def serve_unix(self, path: str):
+        server = self
+
+        class Handler(socketserver.StreamRequestHandler):
+            def handle(self):
+                out = _SocketWriter(self.wfile)
+                server.serve_stream(_lines(self.rfile), out)
+                if server.shutting_down.is_set():
+                    threading.Thread(target=unix_server.shutdown).start()
+
+        if os.path.exists(path):
+            os.remove(path)
+        with socketserver.ThreadingUnixStreamServer(path, Handler) as unix_server:
+            try:
+                unix_server.serve_forever()
+            finally:
+                os.remove(path)
+
+    def close(self):
+        self._executor.shutdown(wait=True)
+        self._batch_executor.shutdown(wait=True)
+        self.pool.close()
+
+
+def _method_of(line: str) -> Optional[str]:
+    try:
+        request = json.loads(line)
+    except ValueError:
+        return None
+    return request.get("method") if isinstance(request, dict) else None
+
+
+def _lines(rfile):
+    for line in rfile:
+        yield line.decode("utf_8")
+
+
+class _SocketWriter:
+    def __init__(self, wfile):
+        self.wfile = wfile
+
+    def write(self, s: str):
+        self.wfile.write(s.encode("utf_8"))
+
+    def flush(self):
+        self.wfile.flush()
+
+
+def serve(socket: Optional[str] = None, workers: Optional[int] = None, timeout: Optional[float] = None,
+          cache_size: int = 1024):
+    server = Server(workers=workers, timeout=timeout, cache_size=cache_size)
+    try:
+        if socket:
+            server.serve_unix(socket)
+        else:
+            server.serve_stream(sys.stdin, sys.stdout)
+    finally:
+        server.close()
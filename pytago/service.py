@@ -0,0 +1,321 @@
+"""
+What the web apps have in common, whichever framework serves them: configuration,
+the result cache, playground sessions, metrics, how failures become responses and
+how responses are compressed and tagged for caching.
+
+pytago.app serves them with Flask (under gunicorn) and pytago.asgi with Starlette
+(under uvicorn). Each sets the `backend` that does its transpiling, which is what
+the pool metrics and /stats report on.
+"""
+import gzip
+import os
+import re
+import threading
+import traceback
+from collections import OrderedDict
+from contextlib import contextmanager
+from typing import Iterator, Optional
+
+from pytago import __version__
+from pytago.cache import LRUCache, SharedCache, source_key
+from pytago.metrics import Registry
+from pytago.workers import PoolSaturated, TranspileCancelled, TranspileTimeout, WorkerCrashed
+
+try:
+    import brotli
+except ImportError:  # Optional, responses are only gzipped without it
+    brotli = None
+
+# Shared by all of this process's requests, keyed on the hash of the submitted source, and with other
+# processes on the host too if there's a shared cache
+cache_size = int(os.environ.get("PYTAGO_CACHE_SIZE", 1024))
+shared_cache_path = os.environ.get("PYTAGO_SHARED_CACHE")
+if shared_cache_path:
+    results = SharedCache(shared_cache_path, cache_size,
+                          shared_maxsize=int(os.environ.get("PYTAGO_SHARED_CACHE_SIZE", 100_000)),
+                          ttl=float(os.environ.get("PYTAGO_SHARED_CACHE_TTL", 7 * 24 * 60 * 60)) or None)
+else:
+    results = LRUCache(cache_size)
+# Transpilations run in a bounded pool of processes, each with its own deadline
+workers = int(os.environ.get("PYTAGO_WORKERS", 0)) or None
+queue_limit = int(os.environ.get("PYTAGO_QUEUE_LIMIT", 16))
+timeout = float(os.environ.get("PYTAGO_TIMEOUT", 30))
+batch_limit = int(os.environ.get("PYTAGO_BATCH_LIMIT", 1000))
+# Transpiled by every worker before it takes requests
+warmup_paths = os.environ.get(
+    "PYTAGO_WARMUP", os.path.join(os.path.dirname(os.path.dirname(__file__)), "examples", "helloworld.py"))
+port = os.environ.get("PORT", 8080)
+
+# Whatever the serving app transpiles with: a WorkerPool, or anything with the same counters
+backend = None
+
+# The newest sequence number and cancel event of each playground session
+sessions = OrderedDict()
+sessions_lock = threading.Lock()
+max_sessions = 10000
+
+html = None
+html_tag = None
+
+# The page is revalidated on every load, which its ETag makes cheap
+PAGE_CACHE_CONTROL = "public, no-cache"
+# Results only depend on the source and pytago's version, both of which are in their ETag
+RESULT_CACHE_CONTROL = "public, max-age=86400"
+# Bodies shorter than this aren't worth compressing
+MIN_COMPRESS_SIZE = 512
+# Compressed bodies, keyed on their ETag
+encoded = LRUCache(256)
+
+metrics = Registry()
+request_seconds = metrics.histogram("pytago_request_seconds", "Time taken to answer transpilation requests")
+stage_seconds = metrics.histogram("pytago_stage_seconds", "Time taken by each stage of a transpilation",
+                                  labels=("stage",))
+errors = metrics.counter("pytago_errors_total", "Transpilation requests that failed, by error", labels=("error",))
+syntax_errors = metrics.counter("pytago_syntax_errors_total", "Submitted programs that weren't valid Python")
+requests_in_flight = metrics.gauge("pytago_requests_in_flight", "Transpilation requests being answered")
+metrics.gauge("pytago_transpilations_in_flight", "Transpilations running in a worker",
+              function=lambda: backend.size - backend.idle if backend else 0)
+metrics.gauge("pytago_queue_depth", "Transpilations waiting for a worker",
+              function=lambda: backend.queue_depth if backend else 0)
+metrics.counter("pytago_rejections_total", "Requests turned away because the queue was full",
+                function=lambda: backend.counters()["rejections"] if backend else 0)
+metrics.counter("pytago_timeouts_total", "Transpilations that missed their deadline",
+                function=lambda: backend.counters()["timeouts"] if backend else 0)
+metrics.counter("pytago_cancellations_total", "Transpilations cancelled by a newer request from the same session",
+                function=lambda: backend.counters()["cancellations"] if backend else 0)
+metrics.counter("pytago_cache_hits_total", "Requests answered from the result cache", function=lambda: results.hits)
+metrics.counter("pytago_cache_misses_total", "Requests that had to be transpiled", function=lambda: results.misses)
+metrics.counter("pytago_cache_coalesced_total", "Requests that waited for an identical one to finish",
+                function=lambda: results.coalesced)
+metrics.counter("pytago_shared_cache_hits_total", "Cache hits found in the cache shared with other processes",
+                function=lambda: getattr(results, "shared_hits", 0))
+metrics.counter("pytago_shared_cache_errors_total", "Reads and writes of the shared cache that failed",
+                function=lambda: getattr(results, "shared_errors", 0))
+
+
+def index_html() -> str:
+    global html, html_tag
+    if html is None:
+        here = os.path.dirname(__file__)
+        for path in (os.path.join(here, "static", "index.html"),
+                     # Docker, where the installed package doesn't come with its static files
+                     os.path.join(os.getcwd(), "static", "index.html"),
+                     os.path.join(os.getcwd(), "pytago", "static", "index.html")):
+            try:
+                with open(path) as f:
+                    html = f.read()
+                break
+            except FileNotFoundError:
+                pass
+        else:
+            raise FileNotFoundError("couldn't find static/index.html")
+        html_tag = source_key(html)
+    return html
+
+
+def page_tag() -> str:
+    index_html()
+    return html_tag
+
+
+def result_tag(py: str) -> str:
+    return result_key_tag(source_key(py))
+
+
+def result_key_tag(key: str) -> str:
+    return f"{key}-{__version__}"
+
+
+# What source_key returns
+_RESULT_KEY = re.compile("[0-9a-f]{64}")
+
+
+def is_result_key(key: str) -> bool:
+    return _RESULT_KEY.fullmatch(key) is not None
+
+
+def result_location(key: str) -> str:
+    """Where the result for the source with this key can be fetched from, while it's cached"""
+    return f"/result/{key}"
+
+
+def negotiate_encoding(accept_encoding: Optional[str]) -> Optional[str]:
+    """The best content coding the client accepts: br if brotli is installed, else gzip, else None"""
+    accepted = set()
+    for part in (accept_encoding or "").split(","):
+        coding, _, param = part.partition(";")
+        name, _, value = param.partition("=")
+        if name.strip() == "q":
+            try:
+                if float(value) <= 0:
+                    continue
+            except ValueError:
+                continue
+        accepted.add(coding.strip().lower())
+    if brotli is not None and "br" in accepted:
+        return "br"
+    if "gzip" in accepted:
+        return "gzip"
+    return None
+
+
+def _compress(data: bytes, encoding: str) -> bytes:
+    if encoding == "br":
+        return brotli.compress(data)
+    return gzip.compress(data, mtime=0)
+
+
+class Representation:
+    """
+    How a response body identified by tag gets sent to one client: compressed with the best
+    coding it accepts, with a strong ETag for that tag and coding, and not at all if the client
+    already has it. Since the ETag only depends on the tag, not_modified can be checked before
+    the body has even been made.
+
+    Only a GET or HEAD can be answered with a 304. Any other request whose If-None-Match
+    matches has failed its precondition and gets a 412 (RFC 9110, section 13.1.2); clients
+    revalidating a POST's result should GET its Content-Location, given as location, instead.
+    """
+    def __init__(self, tag: str, cache_control: str, accept_encoding: Optional[str] = None,
+                 if_none_match: Optional[str] = None, method: str = "GET", location: Optional[str] = None):
+        self.encoding = negotiate_encoding(accept_encoding)
+        self.etag = f'"{tag}-{self.encoding}"' if self.encoding else f'"{tag}"'
+        self.headers = {"ETag": self.etag, "Cache-Control": cache_control, "Vary": "Accept-Encoding"}
+        if location is not None:
+            self.headers["Content-Location"] = location
+        matches = _etag_matches(if_none_match, self.etag)
+        self.not_modified = matches and method in ("GET", "HEAD")
+        self.precondition_failed = matches and not self.not_modified
+
+    def encode(self, body: str) -> tuple[bytes, dict[str, str]]:
+        """The bytes to send for body, and the headers to send them with"""
+        data = body.encode("utf_8")
+        headers = dict(self.headers)
+        if self.encoding is not None and len(data) >= MIN_COMPRESS_SIZE:
+            data = encoded.get_or_compute(self.etag, lambda: _compress(data, self.encoding))
+            headers["Content-Encoding"] = self.encoding
+        return data, headers
+
+
+def _etag_matches(if_none_match: Optional[str], etag: str) -> bool:
+    if not if_none_match:
+        return False
+    for candidate in if_none_match.split(","):
+        candidate = candidate.strip()
+        if candidate == "*" or candidate.removeprefix("W/") == etag:
+            return True
+    return False
+
+
+@contextmanager
+def session_turn(session, seq, cancel=None) -> Iterator[Optional[threading.Event]]:
+    """
+    Requests from the playground carry a session ID and a sequence number that goes up with
+    every edit. A new request cancels its session's previous one, and requests that arrive
+    after a newer one are cancelled from the start. Yields the event that cancels this one,
+    which is cancel if it's given; anything with set() and is_set() will do.
+    """
+    if not isinstance(session, str) or not isinstance(seq, int):
+        yield None
+        return
+    if cancel is None:
+        cancel = threading.Event()
+    with sessions_lock:
+        newest_seq, newest_cancel = sessions.get(session, (None, None))
+        if newest_seq is not None and newest_seq >= seq:
+            cancel.set()
+        else:
+            if newest_cancel is not None:
+                newest_cancel.set()
+            sessions[session] = seq, cancel
+            sessions.move_to_end(session)
+            while len(sessions) > max_sessions:
+                sessions.popitem(last=False)
+    yield cancel
+
+
+def failure_response(e: Exception) -> Optional[tuple[str, int]]:
+    """The message and HTTP status for failures caused by load rather than bugs"""
+    match e:
+        case PoolSaturated():
+            return "Too many requests, try again later", 429
+        case TranspileTimeout():
+            return f"Transpilation took longer than {timeout} seconds", 503
+        case WorkerCrashed():
+            return "Transpilation failed unexpectedly", 503
+        case TranspileCancelled():
+            return "Superseded by a newer request", 409
+    return None
+
+
+def batch_item(go: Optional[str] = None, error: Optional[Exception] = None) -> dict:
+    """One line of a /batch response, less its index"""
+    if error is not None:
+        errors.inc(error=type(error).__name__)
+        if (failure := failure_response(error)) is None:
+            failure = f"{type(error).__name__}: {error}", 500
+        message, status = failure
+        return {"error": {"type": type(error).__name__, "message": message, "status": status}}
+    if isinstance(go, SyntaxErrorReport):
+        return {"error": {"type": "SyntaxError", "message": go, "status": 200}}
+    return {"go": go}
+
+
+BAD_BATCH_ITEM = {"error": {"type": "BadRequest", "message": "expected a non-empty string", "status": 400}}
+
+
+class SyntaxErrorReport(str):
+    """What's returned in place of Go code for programs that aren't valid Python"""
+
+
+def syntax_error_report(e: SyntaxError) -> SyntaxErrorReport:
+    syntax_errors.inc()
+    tb = "".join(traceback.format_exception(type(e), e, e.__traceback__, chain=False))
+    lines = []
+    seen_unknown = False
+    for line in tb.splitlines():
+        if '<unknown>' in line:
+            seen_unknown = True
+        if seen_unknown:
+            lines.append(line)
+    return SyntaxErrorReport('\n'.join(lines) or str(e))
+
+
+def observe_stages(stages: dict[str, float]):
+    for name, seconds in stages.items():
+        stage_seconds.observe(seconds, stage=name)
+
+
+def stats() -> dict:
+    counters = backend.counters() if backend else {}
+    return {
+        "workers": backend.size if backend else 0,
+        "idle_workers": backend.idle if backend else 0,
+        "queue_depth": backend.queue_depth if backend else 0,
+        "queue_limit": queue_limit,
+        "rejections": counters.get("rejections", 0),
+        "timeouts": counters.get("timeouts", 0),
+        "crashes": counters.get("crashes", 0),
+        "cancellations": counters.get("cancellations", 0),
+        "cache_size": len(results),
+        "cache_hits": results.hits,
+        "cache_misses": results.misses,
+        "cache_coalesced": results.coalesced,
+        "shared_cache_size": results.shared_size if isinstance(results, SharedCache) else None,
+        "shared_cache_hits": getattr(results, "shared_hits", 0),
+    }
+
+
+def is_ready() -> bool:
+    return backend is not None and backend.ready.is_set() and getattr(backend, "startup_error", None) is None
+
+
+def warmup_corpus() -> list[str]:
+    corpus = []
+    for path in filter(None, warmup_paths.split(os.pathsep)):
+        try:
+            with open(path, encoding="utf_8") as f:
+                corpus.append(f.read())
+        except FileNotFoundError:
+            pass
+    return corpus or ['def main():\n    print("hello world")\n']
@@ -0,0 +1,237 @@
+"""
+Generated Python programs of a chosen size and shape, for benchmarks and scaling tests.
+
+    from pytago.synthetic import generate
+    python = generate(functions=200, depth=3, locals_per_function=8, call_density=0.5)
+
+or, from the command line:
+
+    python -m pytago.synthetic --functions 200 --depth 3 > big.py
+
+Programs are put together from constructs the examples already cover: classes,
+comprehensions, f-strings, try/except, generators, file loops, while loops and
+if/elif/else chains, nested up to depth blocks deep inside every function. They
+always terminate and print the same output on every run, and everything in them
+is an int, so the Go they transpile to prints the same thing too.
+"""
+import argparse
+import random
+from contextlib import contextmanager
+from typing import Optional
+
+# The file that file loops read, which main writes before anything else
+FILE_NAME = "synthetic.tmp"
+
+CONSTRUCTS = ("loop", "if", "while", "try", "comprehension", "fstring", "generator", "file", "class")
+
+
+class _Writer:
+    def __init__(self):
+        self.lines = []
+        self.indent = 0
+
+    def line(self, text: str = ""):
+        self.lines.append("    " * self.indent + text if text else "")
+
+    @contextmanager
+    def block(self, header: str):
+        self.line(header)
+        self.indent += 1
+        try:
+            yield
+        finally:
+            self.indent -= 1
+
+
+class _Generator:
+    def __init__(self, functions: int, depth: int, locals_per_function: int, call_density: float, classes: int,
+                 statements_per_block: int, constructs: tuple[str, ...], seed: int, main_calls: Optional[int]):
+        self.functions = max(1, functions)
+        self.depth = depth
+        self.locals = max(1, locals_per_function)
+        self.call_density = call_density
+        self.classes = classes
+        self.statements_per_block = max(1, statements_per_block)
+        self.constructs = tuple(c for c in constructs if c != "class" or classes)
+        self.random = random.Random(seed)
+        self.out = _Writer()
+        self.function = 0
+        # Generator and file loops in the function so far, each of which gets its own names
+        self.loops = 0
+        self.main_calls = self.functions if main_calls is None else min(main_calls, self.functions)
+
+    def var(self) -> str:
+        return f"v{self.random.randrange(self.locals)}"
+
+    def assign(self, target: str, value: str):
+        # Everything stays small and non-negative, so Python's ints and Go's behave the same
+        self.out.line(f"{target} = ({value}) % 1000")
+
+    def simple_statement(self):
+        if self.function and self.random.random() < self.call_density:
+            callee = self.random.randrange(self.function)
+            with self.out.block("if n > 0:"):
+                target = self.var()
+                self.assign(target, f"{target} + f{callee}(n - 1)")
+            return
+        a, b = self.var(), self.var()
+        self.assign(a, f"{a} + {b} * {self.random.randrange(1, 10)}")
+
+    def compound_statement(self, depth: int):
+        w = self.out
+        kind = self.random.choice(self.constructs)
+        a, b = self.var(), self.var()
+        if kind == "loop":
+            with w.block(f"for i{depth} in range({self.random.randrange(1, 4)}):"):
+                self.assign(a, f"{a} + i{depth}")
+                self.body(depth + 1)
+        elif kind == "if":
+            with w.block(f"if {a} % 3 == 0:"):
+                self.assign(b, f"{b} + 3")
+                self.body(depth + 1)
+            with w.block(f"elif {a} % 3 == 1:"):
+                self.assign(b, f"{b} + 1")
+                self.body(depth + 1)
+            with w.block("else:"):
+                self.assign(b, f"{b} + 2")
+        elif kind == "while":
+            with w.block(f"while {a} > 10:"):
+                # Not //, which pytago only makes an integer division of when it knows a is an int
+                w.line(f"{a} = {a} - 10")
+            self.body(depth + 1)
+        elif kind == "try":
+            with w.block("try:"):
+                self.assign(a, f'{a} + int("{self.random.randrange(100)}")')
+                self.body(depth + 1)
+            with w.block("except ValueError:"):
+                self.assign(a, f"{a} + 1")
+        elif kind == "comprehension":
+            comprehension = self.random.choice([
+                f"[x * {b} for x in range({a} % 5)]",
+                f"{{x: x + {b} for x in range({a} % 5)}}",
+                f"{{x % 3 for x in range({a} % 5)}}",
+            ])
+            self.assign(a, f"{a} + len({comprehension})")
+            self.body(depth + 1)
+        elif kind == "fstring":
+            w.line(f'print(f"f{self.function}: {{{a}}} {{{b} + 1}}")')
+            self.body(depth + 1)
+        elif kind == "generator":
+            self.loops += 1
+            # Iterated through a variable, as in examples/yields.py
+            w.line(f"gen{self.loops} = g{self.function}()")
+            with w.block(f"for x{self.loops} in gen{self.loops}:"):
+                self.assign(b, f"{b} + x{self.loops}")
+                self.body(depth + 1)
+        elif kind == "file":
+            self.loops += 1
+            with w.block(f'with open("{FILE_NAME}") as fh{self.loops}:'):
+                with w.block(f"for line{self.loops} in fh{self.loops}:"):
+                    self.assign(a, f"{a} + len(line{self.loops})")
+            self.body(depth + 1)
+        elif kind == "class":
+            c = self.random.randrange(self.classes)
+            self.assign(a, f"{a} + C{c}({b}).scaled({self.random.randrange(1, 5)})")
+            self.body(depth + 1)
+
+    def body(self, depth: int):
+        """statements_per_block statements, one of which opens another block if there's depth left"""
+        if depth > self.depth:
+            return
+        compound = self.random.randrange(self.statements_per_block) if self.constructs else None
+        for i in range(self.statements_per_block):
+            if i == compound:
+                self.compound_statement(depth)
+            else:
+                self.simple_statement()
+
+    def class_def(self, c: int):
+        w = self.out
+        with w.block(f"class C{c}:"):
+            w.line("value: int")
+            w.line()
+            with w.block("def __init__(self, value: int) -> None:"):
+                w.line("self.value = value")
+            w.line()
+            with w.block("def scaled(self, factor: int) -> int:"):
+                w.line(f"return self.value * factor + {c}")
+        w.line()
+        w.line()
+
+    def function_def(self, k: int):
+        w = self.out
+        self.function = k
+        self.loops = 0
+        if "generator" in self.constructs:
+            with w.block(f"def g{k}():"):
+                with w.block(f"for i in range({k % 3 + 1}):"):
+                    w.line(f"yield i * {k % 7 + 1}")
+            w.line()
+            w.line()
+        with w.block(f"def f{k}(n: int) -> int:"):
+            for v in range(self.locals):
+                w.line(f"v{v} = n + {self.random.randrange(100)}")
+            self.body(1)
+            w.line(f"return ({' + '.join(f'v{v}' for v in range(self.locals))}) % 1000")
+        w.line()
+        w.line()
+
+    def module(self) -> str:
+        w = self.out
+        for c in range(self.classes if "class" in self.constructs else 0):
+            self.class_def(c)
+        for k in range(self.functions):
+            self.function_def(k)
+        with w.block("def main():"):
+            if "file" in self.constructs:
+                with w.block(f'with open("{FILE_NAME}", "w") as f:'):
+                    w.line('f.write("one\\ntwo\\nthree\\n")')
+            for k in range(self.main_calls):
+                w.line(f"print(f{k}(2))")
+        w.line()
+        w.line()
+        with w.block("if __name__ == '__main__':"):
+            w.line("main()")
+        return "\n".join(w.lines) + "\n"
+
+
+def generate(functions: int = 10, depth: int = 2, locals_per_function: int = 4, call_density: float = 0.2,
+             classes: int = 1, statements_per_block: int = 3, constructs: Optional[tuple[str, ...]] = None,
+             seed: int = 0, main_calls: Optional[int] = None) -> str:
+    """
+    A program of functions functions, each with locals_per_function locals and blocks nested
+    depth deep. Every block has statements_per_block statements. call_density is the chance
+    that a simple statement calls an earlier function. constructs limits which of CONSTRUCTS
+    the blocks can be made of. main calls the first main_calls functions (all of them by
+    default), so with few calls the rest are left independent of each other, as
+    pytago.go_ast.parallel partitions them. The same arguments always give the same program.
+    """
+    return _Generator(functions, depth, locals_per_function, call_density, classes, statements_per_block,
+                      CONSTRUCTS if constructs is None else tuple(constructs), seed, main_calls).module()
+
+
+def generate_lines(lines: int, **shape) -> str:
+    """A program of about lines lines, with as many functions of the given shape as that takes"""
+    sample = generate(**{**shape, "functions": 10}).count("\n")
+    overhead = generate(**{**shape, "functions": 1}).count("\n")
+    per_function = max(1, (sample - overhead) / 9)
+    return generate(**{**shape, "functions": max(1, round((lines - overhead) / per_function) + 1)})
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Print a generated Python program")
+    parser.add_argument("-f", "--functions", type=int, default=10)
+    parser.add_argument("-d", "--depth", type=int, default=2)
+    parser.add_argument("-l", "--locals", type=int, default=4, dest="locals_per_function")
+    parser.add_argument("-c", "--call-density", type=float, default=0.2)
+    parser.add_argument("--classes", type=int, default=1)
+    parser.add_argument("--statements", type=int, default=3, dest="statements_per_block")
+    parser.add_argument("--constructs", type=lambda s: tuple(s.split(",")), default=None,
+                        help=f"comma separated, out of {','.join(CONSTRUCTS)}")
+    parser.add_argument("-s", "--seed", type=int, default=0)
+    parser.add_argument("--main-calls", type=int, default=None, help="functions main calls (default: all)")
+    print(generate(**vars(parser.parse_args())), end="")
+
+
+if __name__ == '__main__':
+    main()
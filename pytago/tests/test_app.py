@@ -0,0 +1,93 @@
+import gzip
+import json
+from unittest import TestCase
+
+from pytago import service
+from pytago.app import app, results, session_turn, syntax_errors, warm_up
+from pytago.cache import source_key
+
+
+class Test(TestCase):
+    def test_results_are_cached(self):
+        client = app.test_client()
+        hits = results.hits
+        first = client.post("/", json={"py": "print(1"}).get_data(as_text=True)
+        second = client.post("/", json={"py": "print(1"}).get_data(as_text=True)
+        self.assertIn("SyntaxError", first)
+        self.assertEqual(first, second)
+        self.assertEqual(hits + 1, results.hits)
+
+    def test_metrics(self):
+        client = app.test_client()
+        before = syntax_errors.get()
+        client.post("/", json={"py": "def f(:"})
+        metrics = client.get("/metrics").get_data(as_text=True)
+        self.assertEqual(before + 1, syntax_errors.get())
+        self.assertIn(f"pytago_syntax_errors_total {before + 1}\n", metrics)
+        self.assertIn('pytago_stage_seconds_count{stage="parse"}', metrics)
+
+    def test_healthz_after_warm_up(self):
+        warm_up()
+        self.assertEqual(200, app.test_client().get("/healthz").status_code)
+
+    def test_batch(self):
+        response = app.test_client().post("/batch", json={"sources": ["print(2", 3, "def g(:", "print(2"]})
+        self.assertEqual("application/x-ndjson", response.mimetype)
+        items = sorted((json.loads(line) for line in response.get_data(as_text=True).splitlines()),
+                       key=lambda item: item["index"])
+        self.assertEqual([0, 1, 2, 3], [item["index"] for item in items])
+        self.assertEqual(["SyntaxError", "BadRequest", "SyntaxError", "SyntaxError"],
+                         [item["error"]["type"] for item in items])
+        self.assertEqual(items[0]["error"], items[3]["error"])
+        self.assertEqual(400, app.test_client().post("/batch", json={"sources": "print(1)"}).status_code)
+
+    def test_newer_requests_cancel_older_ones(self):
+        with session_turn("test-session", 1) as first:
+            with session_turn("test-session", 2) as second:
+                self.assertTrue(first.is_set())
+                self.assertFalse(second.is_set())
+            with session_turn("test-session", 1) as late:
+                self.assertTrue(late.is_set())
+            with session_turn("other-session", 1) as other:
+                self.assertFalse(other.is_set())
+        with session_turn(None, None) as unsequenced:
+            self.assertIsNone(unsequenced)
+
+    def test_page_is_compressed_and_revalidated(self):
+        client = app.test_client()
+        response = client.get("/", headers={"Accept-Encoding": "br;q=0, gzip"})
+        self.assertEqual("gzip", response.headers["Content-Encoding"])
+        self.assertEqual(service.index_html(), gzip.decompress(response.data).decode())
+        self.assertEqual(service.PAGE_CACHE_CONTROL, response.headers["Cache-Control"])
+        etag = response.headers["ETag"]
+        self.assertEqual(etag, client.get("/", headers={"Accept-Encoding": "gzip"}).headers["ETag"])
+        self.assertNotEqual(etag, client.get("/").headers["ETag"])
+        revalidated = client.get("/", headers={"Accept-Encoding": "gzip", "If-None-Match": etag})
+        self.assertEqual(304, revalidated.status_code)
+        self.assertEqual(b"", revalidated.data)
+
+    def test_results_are_revalidated_without_transpiling(self):
+        client = app.test_client()
+        response = client.post("/", json={"py": "print(7"})
+        etag = response.headers["ETag"]
+        self.assertIn(service.result_tag("print(7"), etag)
+        location = response.headers["Content-Location"]
+        self.assertEqual(f"/result/{source_key('print(7')}", location)
+        hits, misses = results.hits, results.misses
+        revalidated = client.get(location, headers={"If-None-Match": etag})
+        self.assertEqual(304, revalidated.status_code)
+        self.assertEqual(etag, revalidated.headers["ETag"])
+        self.assertEqual((hits, misses), (results.hits, results.misses))
+        # A POST can't be told it's not modified, only that its precondition failed
+        self.assertEqual(412, client.post("/", json={"py": "print(7"}, headers={"If-None-Match": etag}).status_code)
+        self.assertEqual((hits, misses), (results.hits, results.misses))
+        self.assertEqual(200, client.post("/", json={"py": "print(8"}, headers={"If-None-Match": etag}).status_code)
+        fetched = client.get(location)
+        self.assertEqual(200, fetched.status_code)
+        self.assertEqual(response.data, fetched.data)
+        self.assertEqual(service.RESULT_CACHE_CONTROL, fetched.headers["Cache-Control"])
+        self.assertEqual(404, client.get(f"/result/{source_key('never sent')}").status_code)
+        self.assertEqual(404, client.get("/result/not-a-key").status_code)
+
+    def test_bad_request(self):
+        self.assertEqual(400, app.test_client().post("/", json={}).status_code)
@@ -0,0 +1,116 @@
+import asyncio
+import json
+import os
+import tempfile
+import time
+from unittest import TestCase, mock
+
+from starlette.testclient import TestClient
+
+from pytago import service
+from pytago.asgi import app, get_transpiler
+from pytago.cache import SharedCache, source_key
+from pytago.service import results
+
+
+def _on_event_loop() -> bool:
+    try:
+        asyncio.get_running_loop()
+    except RuntimeError:
+        return False
+    return True
+
+
+class LoopCheckingCache(SharedCache):
+    """Records whether each read and write of the database happened on an event loop"""
+    def __init__(self, *args, **kwargs):
+        self.on_loop = []
+        super().__init__(*args, **kwargs)
+
+    def _load(self, key):
+        self.on_loop.append(_on_event_loop())
+        return super()._load(key)
+
+    def _save(self, key, value):
+        self.on_loop.append(_on_event_loop())
+        super()._save(key, value)
+
+
+class Test(TestCase):
+    @classmethod
+    def setUpClass(cls):
+        cls.client = TestClient(app).__enter__()
+
+    @classmethod
+    def tearDownClass(cls):
+        cls.client.__exit__(None, None, None)
+
+    def test_page(self):
+        response = self.client.get("/")
+        self.assertEqual(200, response.status_code)
+        self.assertIn("<html", response.text)
+
+    def test_results_are_cached(self):
+        hits = results.hits
+        first = self.client.post("/", json={"py": "print(3"}).text
+        second = self.client.post("/", json={"py": "print(3"}).text
+        self.assertIn("SyntaxError", first)
+        self.assertEqual(first, second)
+        self.assertEqual(hits + 1, results.hits)
+
+    def test_shared_cache_is_used_off_the_event_loop(self):
+        with tempfile.TemporaryDirectory() as directory:
+            shared = LoopCheckingCache(os.path.join(directory, "results.sqlite"), 16)
+            with mock.patch("pytago.asgi.results", shared):
+                first = self.client.post("/", json={"py": "print(10"}).text
+                # Only in the database now
+                shared._items.clear()
+                self.assertEqual(first, self.client.post("/", json={"py": "print(10"}).text)
+                self.assertEqual(first, self.client.get(f"/result/{source_key('print(10')}").text)
+            self.assertEqual(1, shared.shared_hits)
+            self.assertGreaterEqual(len(shared.on_loop), 3)
+            self.assertFalse(any(shared.on_loop))
+
+    def test_batch(self):
+        response = self.client.post("/batch", json={"sources": ["print(4", 4, "def h(:", "print(4"]})
+        self.assertEqual("application/x-ndjson", response.headers["content-type"])
+        items = sorted((json.loads(line) for line in response.text.splitlines()), key=lambda item: item["index"])
+        self.assertEqual([0, 1, 2, 3], [item["index"] for item in items])
+        self.assertEqual(["SyntaxError", "BadRequest", "SyntaxError", "SyntaxError"],
+                         [item["error"]["type"] for item in items])
+        self.assertEqual(items[0]["error"], items[3]["error"])
+        self.assertEqual(400, self.client.post("/batch", json={"sources": "print(1)"}).status_code)
+
+    def test_superseded_requests_are_cancelled(self):
+        self.client.post("/", json={"py": "print(5", "session": "asgi-session", "seq": 2})
+        cancellations = get_transpiler().cancellations
+        response = self.client.post("/", json={"py": "print(6", "session": "asgi-session", "seq": 1})
+        self.assertEqual(409, response.status_code)
+        self.assertEqual(cancellations + 1, get_transpiler().cancellations)
+
+    def test_healthz_and_stats(self):
+        deadline = time.monotonic() + 60
+        while self.client.get("/healthz").status_code != 200 and time.monotonic() < deadline:
+            time.sleep(0.1)
+        self.assertTrue(service.is_ready())
+        self.assertEqual(get_transpiler().size, self.client.get("/stats").json()["workers"])
+        self.assertIn("pytago_cache_hits_total", self.client.get("/metrics").text)
+
+    def test_revalidation(self):
+        page = self.client.get("/", headers={"Accept-Encoding": "gzip"})
+        self.assertEqual("gzip", page.headers["Content-Encoding"])
+        self.assertEqual(service.index_html(), page.text)
+        self.assertEqual(304, self.client.get("/", headers={"Accept-Encoding": "gzip",
+                                                            "If-None-Match": page.headers["ETag"]}).status_code)
+        response = self.client.post("/", json={"py": "print(9"})
+        etag, location = response.headers["ETag"], response.headers["Content-Location"]
+        misses = results.misses
+        self.assertEqual(412, self.client.post("/", json={"py": "print(9"}, headers={"If-None-Match": etag}).status_code)
+        self.assertEqual(304, self.client.get(location, headers={"If-None-Match": etag}).status_code)
+        self.assertEqual(misses, results.misses)
+        self.assertEqual(response.text, self.client.get(location).text)
+        self.assertEqual(404, self.client.get(f"/result/{source_key('never sent')}").status_code)
+
+    def test_bad_request(self):
+        self.assertEqual(400, self.client.post("/", json={}).status_code)
+        self.assertEqual(400, self.client.post("/", content="{").status_code)
@@ -0,0 +1,107 @@
+import os
+import tempfile
+import threading
+import time
+from unittest import TestCase
+
+from pytago.cache import LRUCache, SharedCache
+
+
+class Test(TestCase):
+    def test_eviction(self):
+        cache = LRUCache(2)
+        cache.put("a", 1)
+        cache.put("b", 2)
+        self.assertEqual(1, cache.get("a"))
+        cache.put("c", 3)
+        self.assertNotIn("b", cache)
+        self.assertEqual((1, 3), (cache.get("a"), cache.get("c")))
+
+    def test_get_or_compute_coalesces(self):
+        cache = LRUCache()
+        started = threading.Event()
+        release = threading.Event()
+        calls = []
+
+        def compute():
+            calls.append(1)
+            started.set()
+            release.wait(10)
+            return "go"
+
+        results = []
+        first = threading.Thread(target=lambda: results.append(cache.get_or_compute("k", compute)))
+        first.start()
+        started.wait(10)
+        others = [threading.Thread(target=lambda: results.append(cache.get_or_compute("k", compute)))
+                  for _ in range(4)]
+        for thread in others:
+            thread.start()
+        while cache.coalesced < 4:
+            time.sleep(0.001)
+        release.set()
+        for thread in [first, *others]:
+            thread.join()
+        self.assertEqual(["go"] * 5, results)
+        self.assertEqual(1, len(calls))
+        self.assertEqual("go", cache.get_or_compute("k", compute))
+        self.assertEqual((1, 1, 4), (cache.hits, cache.misses, cache.coalesced))
+
+    def test_get_or_compute_does_not_cache_exceptions(self):
+        cache = LRUCache()
+
+        def fail():
+            raise ValueError("nope")
+
+        for _ in range(2):
+            with self.assertRaises(ValueError):
+                cache.get_or_compute("k", fail)
+        self.assertEqual(2, cache.misses)
+        self.assertEqual(0, len(cache))
+
+
+class Marked(str):
+    pass
+
+
+class SharedCacheTest(TestCase):
+    def setUp(self):
+        self.directory = tempfile.TemporaryDirectory()
+        self.path = os.path.join(self.directory.name, "results.sqlite3")
+
+    def tearDown(self):
+        self.directory.cleanup()
+
+    def test_shared_between_caches(self):
+        first, second = SharedCache(self.path), SharedCache(self.path)
+        first.put("k", Marked("go"))
+        calls = []
+        value = second.get_or_compute("k", lambda: calls.append(1))
+        self.assertEqual("go", value)
+        self.assertIsInstance(value, Marked)
+        self.assertEqual([], calls)
+        self.assertEqual((1, 0, 1), (second.hits, second.misses, second.shared_hits))
+        # Now it's in second's own memory too
+        self.assertIn("k", second)
+
+    def test_expiry_and_eviction(self):
+        cache = SharedCache(self.path, maxsize=0, shared_maxsize=2, ttl=0.05)
+        cache.put("old", 1)
+        time.sleep(0.1)
+        self.assertIsNone(cache.get("old"))
+        cache.ttl = None
+        for key in "abc":
+            cache.put(key, key)
+            time.sleep(0.01)
+        cache.get("a")
+        cache.prune()
+        self.assertEqual(2, cache.shared_size)
+        self.assertEqual(("a", None, "c"), (cache.get("a"), cache.get("b"), cache.get("c")))
+
+    def test_falls_back_to_memory(self):
+        with self.assertLogs("pytago", "WARNING"):
+            cache = SharedCache(os.path.join(self.path, "missing", "results.sqlite3"))
+        self.assertFalse(cache.available)
+        self.assertEqual("go", cache.get_or_compute("k", lambda: "go"))
+        self.assertEqual("go", cache.get("k"))
+        self.assertEqual(0, cache.shared_errors)
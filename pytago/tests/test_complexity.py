@@ -0,0 +1,103 @@
+"""
+Transpiles programs made of one construct repeated N, 2N and 4N times, and fails if the work
+or time any stage takes grows faster than linearly in N by more than a margin: 1 is linear,
+2 is quadratic.
+
+Nodes visited are deterministic, so their growth is measured on what doubling N adds,
+log2((m(4N) - m(2N)) / (m(2N) - m(N))), which what every transpilation visits regardless
+of N doesn't hide. It may exceed 1 by PYTAGO_COMPLEXITY_MARGIN (0.25 by default).
+
+Times are the best of a few runs, too noisy to take differences of, so their growth is
+log4(t(4N) / t(N)). It may exceed 1 by twice the margin, and is only checked for stages
+that take at least MIN_SECONDS at 4N.
+"""
+import gc
+import math
+import os
+import time
+import warnings
+from unittest import TestCase
+
+from pytago.core import python_to_compilation_code
+from pytago.metrics import recording_counts, recording_stages
+from pytago.synthetic import generate
+
+MARGIN = float(os.environ.get("PYTAGO_COMPLEXITY_MARGIN", 0.25))
+MIN_SECONDS = 0.1
+REPEAT = 2
+
+
+def many_locals(n: int) -> str:
+    body = "".join(f"    v{i} = v{i - 1} + 1\n" for i in range(1, n))
+    return f"def main():\n    v0 = 0\n{body}    print(v{n - 1})\n"
+
+
+def many_snippet_calls(n: int) -> str:
+    return 'def main():\n    s = "a"\n' + "    print(s.upper())\n" * n
+
+
+def deep_nesting(n: int) -> str:
+    lines = ["def main():", "    a = 1"]
+    lines += ["    " * (i + 1) + f"if a > {i}:" for i in range(n)]
+    lines.append("    " * (n + 1) + "print(a)")
+    return "\n".join(lines) + "\n"
+
+
+def long_elif_chain(n: int) -> str:
+    lines = ["def main():", "    a = int(input())", "    if a == 0:", "        print(0)"]
+    for i in range(1, n):
+        lines += [f"    elif a == {i}:", f"        print({i})"]
+    return "\n".join(lines) + "\n"
+
+
+def many_classes(n: int) -> str:
+    return generate(functions=1, classes=n, depth=1, constructs=("class",))
+
+
+# Each construct, and the N it starts at
+PROBES = {
+    "locals": (many_locals, 100),
+    "snippet_calls": (many_snippet_calls, 50),
+    "nesting": (deep_nesting, 16),
+    "elif_chain": (long_elif_chain, 40),
+    "classes": (many_classes, 16),
+}
+
+
+def measure(python: str) -> tuple[int, dict[str, float]]:
+    """Nodes visited, and the best time of each stage"""
+    best = {}
+    for _ in range(REPEAT):
+        gc.collect()
+        with recording_counts() as counts, recording_stages() as stages, warnings.catch_warnings():
+            warnings.simplefilter("ignore")
+            python_to_compilation_code(python)
+        for name, seconds in stages.items():
+            best[name] = min(best.get(name, math.inf), seconds)
+    return counts["nodes_visited"], best
+
+
+def growth(small: float, medium: float, large: float) -> float:
+    """How fast what doubling N adds grows, which fixed costs don't affect"""
+    return math.log2(max(large - medium, 1e-9) / max(medium - small, 1e-9))
+
+
+def exponent(small: float, large: float) -> float:
+    """k for large = small * 4 ** k, which is less sensitive to noise than growth"""
+    return math.log(large / small, 4)
+
+
+class Test(TestCase):
+    def test_growth_is_linear(self):
+        for name, (make, n) in PROBES.items():
+            with self.subTest(name):
+                (nodes_1, stages_1), (nodes_2, stages_2), (nodes_4, stages_4) = (
+                    measure(make(n * k)) for k in (1, 2, 4))
+                self.assertLessEqual(growth(nodes_1, nodes_2, nodes_4), 1 + MARGIN,
+                                     f"nodes visited: {nodes_1}, {nodes_2}, {nodes_4}")
+                for stage in stages_1:
+                    times = stages_1[stage], stages_2[stage], stages_4[stage]
+                    if times[2] < MIN_SECONDS:
+                        continue
+                    self.assertLessEqual(exponent(times[0], times[2]), 1 + 2 * MARGIN,
+                                         f"{stage} seconds: {', '.join(f'{t:.3f}' for t in times)}")
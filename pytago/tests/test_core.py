@@ -1,12 +1,63 @@
+"""
+Transpiles each example and compares the result with its .go. The tests don't share any state,
+so they can be run in parallel with pytest-xdist (`pytest -n auto`).
+
+Examples that matched once aren't transpiled again until they, the .go they're compared with
+or pytago's own source change. Matches are recorded in PYTAGO_TEST_CACHE (.pytago-test-cache
+at the top of the repository by default), which can be set to an empty string to turn that off.
+"""
+import hashlib
+import logging
 import os
+import tempfile
 from unittest import TestCase
 
+import pytago
 from pytago import python_to_go
 
-# Change directories to the location of the test for consistency between testing environments
-abspath = os.path.abspath(__file__)
-dname = os.path.dirname(abspath)
-os.chdir(dname)
+EXAMPLES_PATH = os.path.join(os.path.dirname(__file__), "..", "..", "examples")
+PACKAGE_PATH = os.path.dirname(pytago.__file__)
+CACHE_PATH = os.environ.get("PYTAGO_TEST_CACHE",
+                            os.path.join(os.path.dirname(__file__), "..", "..", ".pytago-test-cache"))
+
+# So that the intermediate programs are captured along with failures
+logging.getLogger("pytago").setLevel(logging.DEBUG)
+
+_version = None
+
+
+def pytago_version() -> str:
+    """pytago's version number, along with a digest of its source so that edits count as a new version"""
+    global _version
+    if _version is None:
+        digest = hashlib.sha256()
+        for directory, subdirectories, files in os.walk(PACKAGE_PATH):
+            subdirectories[:] = sorted(d for d in subdirectories if d not in ("tests", "__pycache__", "static"))
+            for name in sorted(files):
+                if name.endswith(".py"):
+                    digest.update(name.encode())
+                    with open(os.path.join(directory, name), "rb") as f:
+                        digest.update(f.read())
+        _version = f"{pytago.__version__}-{digest.hexdigest()[:16]}"
+    return _version
+
+
+def match_key(python: str, go: str) -> str:
+    return hashlib.sha256("\0".join((pytago_version(), python, go)).encode()).hexdigest()
+
+
+def matched_before(key: str) -> bool:
+    return bool(CACHE_PATH) and os.path.exists(os.path.join(CACHE_PATH, key))
+
+
+def record_match(key: str):
+    if not CACHE_PATH:
+        return
+    os.makedirs(CACHE_PATH, exist_ok=True)
+    # Written somewhere else first, since other test processes may be looking for it
+    fd, tmp = tempfile.mkstemp(dir=CACHE_PATH)
+    os.close(fd)
+    os.replace(tmp, os.path.join(CACHE_PATH, key))
 
 
 class Test(TestCase):
@@ -15,9 +66,14 @@ class Test(TestCase):
         self.maxDiff = None
 
     def assert_examples_match(self, example: str):
-        with open(f"../../examples/{example}.py", encoding="utf_8") as a, \
-                open(f"../../examples/{example}.go", encoding="utf_8") as b:
-            self.assertEqual(b.read(), python_to_go(a.read()))
+        with open(os.path.join(EXAMPLES_PATH, f"{example}.py"), encoding="utf_8") as a, \
+                open(os.path.join(EXAMPLES_PATH, f"{example}.go"), encoding="utf_8") as b:
+            python, go = a.read(), b.read()
+        key = match_key(python, go)
+        if matched_before(key):
+            return
+        self.assertEqual(go, python_to_go(python, debug=True))
+        record_match(key)
 
     def test_hello_world(self):
         self.assert_examples_match("helloworld")
@@ -0,0 +1,46 @@
+import ast
+import random
+from unittest import TestCase, mock
+
+from pytago import fuzz
+
+
+class Test(TestCase):
+    def test_minimize(self):
+        python = "def f():\n    a = 1\n    if a:\n        b = 2\n        c = 3\n    d = 4\n\nprint(1)\nprint(2)\n"
+        minimized = fuzz.minimize(python, lambda p: "c = 3" in p)
+        self.assertEqual("def f():\n    if a:\n        c = 3\n", minimized)
+        ast.parse(minimized)
+
+    def test_minimize_fills_emptied_blocks(self):
+        python = "while x:\n    a = 1\n    b = 2\nprint(3)\n"
+        self.assertEqual("while x:\n    pass\n", fuzz.minimize(python, lambda p: p.startswith("while x")))
+
+    def test_layout_ignored_outside_strings(self):
+        self.assertEqual('a{b:"x  \\" y",c:`z\n`}', fuzz._without_layout('a {\n   b: "x  \\" y", c: `z\n` }'))
+
+    def test_pipelines_agree(self):
+        python = fuzz.random_program(random.Random(0))
+        for pipeline in fuzz.available_pipelines():
+            with self.subTest(pipeline):
+                self.assertIsNone(fuzz.disagreement(python, pipeline))
+
+    def test_disagreements_reported_minimized(self):
+        # Quicker to compare than real pipelines, and wrong about every program with a for loop
+        fuzz.PIPELINES["broken"] = (lambda p: p + "//" if "for " in p else p, lambda p: p)
+        try:
+            failures = fuzz.fuzz(1, seed=0, pipelines=["broken"])
+        finally:
+            del fuzz.PIPELINES["broken"]
+        self.assertEqual(1, len(failures))
+        self.assertLess(len(failures[0]["program"]), len(failures[0]["original"]))
+        self.assertIn("for ", failures[0]["program"])
+
+    def test_missing_tools_not_agreement(self):
+        def missing(python):
+            raise FileNotFoundError("goimports")
+        with mock.patch.dict(fuzz.PIPELINES, {"missing": (missing, missing)}):
+            with self.assertRaises(fuzz.PipelineUnavailable):
+                fuzz.disagreement("print(1)\n", "missing")
+        with mock.patch("shutil.which", lambda tool: None if tool == "golines" else "/usr/bin/" + tool):
+            self.assertNotIn("async", fuzz.available_pipelines())
@@ -0,0 +1,32 @@
+import tracemalloc
+from unittest import TestCase
+
+from pytago.core import python_to_compilation_code
+from pytago.memprofile import profiling_memory
+from pytago.metrics import stage
+
+
+class Test(TestCase):
+    def test_stages_profiled(self):
+        with profiling_memory(top=3) as profile:
+            python_to_compilation_code('def main():\n    a = [1, 2, 3]\n    print(a)\n')
+        self.assertFalse(tracemalloc.is_tracing())
+        self.assertEqual(["parse", "from_Module", "clean_go_tree", "dump"], list(profile.stages))
+        for memory in profile.stages.values():
+            self.assertGreater(memory.peak, 0)
+            self.assertLessEqual(memory.peak, profile.peak)
+            self.assertEqual(3, len(memory.top_sites))
+        self.assertIn("Ident", profile.stages["from_Module"].goast_counts)
+        report = profile.report()
+        self.assertIn("clean_go_tree: peak", report)
+        self.assertIn("GoAST nodes alive", report)
+
+    def test_nested_stages_keep_outer_peak(self):
+        with profiling_memory() as profile:
+            with stage("outer"):
+                big = bytearray(4 << 20)
+                del big
+                with stage("inner"):
+                    pass
+        self.assertGreaterEqual(profile.stages["outer"].peak, 4 << 20)
+        self.assertLess(profile.stages["inner"].peak, 4 << 20)
@@ -0,0 +1,73 @@
+from unittest import TestCase
+
+from pytago import python_to_go
+from pytago.core import python_to_compilation_code
+from pytago.go_ast import BinaryExpr, ExprStmt, Ident, token
+from pytago.go_ast.parsing import _apply_round
+from pytago.go_ast.transformers import BaseTransformer
+from pytago.metrics import Registry, recording_rewrites, recording_snippets, recording_stages, snippet, stage
+
+
+class RenameY(BaseTransformer):
+    def visit_Ident(self, node: Ident):
+        if node.Name == "y":
+            node.Name = "z"
+        return node
+
+
+class Test(TestCase):
+    def test_render(self):
+        registry = Registry()
+        counter = registry.counter("things_total", "Things", labels=("kind",))
+        histogram = registry.histogram("thing_seconds", "Thing time", buckets=(0.1, 1))
+        registry.gauge("queue", "Queue", function=lambda: 3)
+        counter.inc(kind='a"b')
+        histogram.observe(0.5)
+        histogram.observe(5)
+        self.assertEqual(
+            '# HELP things_total Things\n'
+            '# TYPE things_total counter\n'
+            'things_total{kind="a\\"b"} 1\n'
+            '# HELP thing_seconds Thing time\n'
+            '# TYPE thing_seconds histogram\n'
+            'thing_seconds_bucket{le="0.1"} 0\n'
+            'thing_seconds_bucket{le="1"} 1\n'
+            'thing_seconds_bucket{le="+Inf"} 2\n'
+            'thing_seconds_sum 5.5\n'
+            'thing_seconds_count 2\n'
+            '# HELP queue Queue\n'
+            '# TYPE queue gauge\n'
+            'queue 3\n',
+            registry.render())
+
+    def test_stages_only_recorded_when_asked(self):
+        with stage("outside"):
+            pass
+        with recording_stages() as stages:
+            with stage("a"), stage("b"):
+                pass
+            with self.assertRaises(SyntaxError):
+                python_to_go("print(1", debug=False)
+        self.assertEqual({"a", "b", "parse"}, set(stages))
+
+    def test_snippets_only_recorded_when_asked(self):
+        snippet("outside")
+        with recording_snippets() as snippets:
+            python_to_compilation_code('def main():\n    print(f"{1}")\n    print("a".upper())\n')
+        self.assertEqual({"ast_snippets.fstring": 1, "py_snippets.go_upper": 1}, snippets)
+
+    def test_rewrites_recorded_by_round(self):
+        with recording_rewrites() as rewrites:
+            python_to_compilation_code('def main():\n    a = []\n    a.append(1)\n    print(a)\n')
+        self.assertEqual([1, 0], rewrites["PrintToFmtPrintln"])
+        self.assertEqual([1, 0], rewrites["ReplacePythonStyleAppends"])
+        # Not repeatable, so only ever run in the first round
+        self.assertEqual([0], rewrites["InsertUniqueInitializers"])
+
+    def test_rewrites_in_place_recorded(self):
+        tree = ExprStmt(X=BinaryExpr(X=Ident("y"), Op=token.ADD, Y=Ident("y")))
+        with recording_rewrites() as rewrites:
+            _apply_round(tree, [RenameY], 0)
+            _apply_round(tree, [RenameY], 1)
+        # Nothing returned a different node, but both names changed in the first round only
+        self.assertEqual([2, 0], rewrites["RenameY"])
@@ -0,0 +1,121 @@
+import asyncio
+import io
+import logging
+import sys
+import threading
+import time
+import warnings
+from unittest import TestCase, mock
+
+from pytago import build_source_tree, python_to_go, python_to_go_debug
+from pytago.fuzz import _without_main_guard
+from pytago.go_ast import CallExpr, File, Ident, clean_go_tree, dump, dump_to, parallel
+from pytago.go_ast.parallel import partition_decls, worth_forking
+from pytago.go_ast.parsing import _communicate_async
+from pytago.synthetic import generate
+
+
+class Test(TestCase):
+    def test_dump_to_matches_dump(self):
+        tree = Ident("fmt").sel("Println").call(Ident("x"))
+        for indent in (None, 3):
+            out = io.StringIO()
+            dump_to(tree, out, indent=indent)
+            self.assertEqual(dump(tree, indent=indent), out.getvalue())
+
+    def test_dump_does_not_mutate(self):
+        tree = CallExpr(Fun=Ident("f"))
+        fields = tree._fields
+        self.assertEqual('&ast.CallExpr { Fun: &ast.Ident { Name: "f" } }', dump(tree))
+        self.assertEqual(fields, tree._fields)
+
+    def test_parallel_matches_serial(self):
+        source = "\n".join(f"def f{i}(a{i}):\n    b = [x * {i} for x in range(a{i})]\n    return len(b)\n" for i in range(3))
+        source += "\ndef main():\n    print(f0(1))\n"
+        trees = [File.from_Module(build_source_tree(source)) for _ in range(2)]
+        self.assertEqual([[0, 3], [1], [2]], partition_decls(trees[0]))
+        clean_go_tree(trees[0])
+        with mock.patch("pytago.go_ast.parallel.MAX_UNIT_SHARE", 1.0):
+            clean_go_tree(trees[1], jobs=2)
+        self.assertEqual(dump(trees[0]), dump(trees[1]))
+
+    def test_parallel_matches_serial_on_many_units(self):
+        for seed in range(4):
+            with self.subTest(seed=seed):
+                source = _without_main_guard(generate(functions=4, depth=2, call_density=0.0, seed=seed,
+                                                      main_calls=1))
+                trees = [File.from_Module(build_source_tree(source)) for _ in range(2)]
+                units = partition_decls(trees[0])
+                self.assertGreater(len(units), 4)
+                self.assertTrue(worth_forking(trees[0], units))
+                with warnings.catch_warnings(), mock.patch("pytago.go_ast.parallel.transform_units",
+                                                           wraps=parallel.transform_units) as transform_units:
+                    warnings.simplefilter("ignore")
+                    clean_go_tree(trees[0])
+                    clean_go_tree(trees[1], jobs=2)
+                transform_units.assert_called_once()
+                self.assertEqual(dump(trees[0]), dump(trees[1]))
+
+    def test_partition_keeps_file_wide_passes_exact(self):
+        source = "def NewC():\n    return 1\n\ndef f():\n    return C()\n\ndef g():\n    return 2\n"
+        tree = File.from_Module(build_source_tree(source))
+        # f calls C, which UseConstructorIfAvailable turns into a call to NewC
+        self.assertEqual([[0, 1], [2]], partition_decls(tree))
+        # MergeAdjacentInits works on neighbours in the whole file, so an init keeps it all together
+        tree = File.from_Module(build_source_tree(source + "\nif __name__ == '__main__':\n    g()\n"))
+        units = partition_decls(tree)
+        self.assertEqual(1, len(units))
+        self.assertFalse(worth_forking(tree, units))
+
+    def test_new_nodes_belong_to_this_threads_module(self):
+        File.from_Module(build_source_tree('def main():\n    print(1)\n'))
+        tree = File.from_Module(build_source_tree('def main():\n    print(2)\n'))
+        thread = threading.Thread(target=lambda: File.from_Module(build_source_tree('def main():\n    print(3)\n')))
+        thread.start()
+        thread.join()
+        self.assertIs(tree, Ident("x").go_module)
+
+    def test_communicate_async_kills_on_timeout(self):
+        sleeper = [sys.executable, "-c", "import time; time.sleep(30)"]
+
+        async def run():
+            start = time.monotonic()
+            with self.assertRaises(asyncio.TimeoutError):
+                await _communicate_async(sleeper, timeout=0.2)
+            task = asyncio.create_task(_communicate_async(sleeper))
+            await asyncio.sleep(0.2)
+            task.cancel()
+            with self.assertRaises(asyncio.CancelledError):
+                await task
+            return time.monotonic() - start
+
+        self.assertLess(asyncio.run(run()), 10)
+
+    def test_debug_work_only_when_asked(self):
+        logger = logging.getLogger("pytago")
+        self.addCleanup(logger.setLevel, logger.level)
+        logger.setLevel(logging.INFO)
+        calls = []
+
+        def tool(name):
+            def run(code):
+                calls.append(name)
+                return code if name != "gorun" else "package main\n"
+            return run
+
+        with mock.patch.multiple("pytago.go_ast.parsing", _gorun=tool("gorun"), _gofumpt=tool("gofumpt"),
+                                 _goimport=tool("goimports"), _golines=tool("golines")):
+            for debug in (False, True):
+                calls.clear()
+                self.assertEqual("package main\n", python_to_go("print(1)", debug=debug))
+                self.assertEqual(["gorun", "goimports", "gofumpt", "golines"], calls)
+
+            calls.clear()
+            with self.assertLogs("pytago", "DEBUG") as logs:
+                python_to_go("print(1)", debug=True)
+            self.assertEqual(["gofumpt", "gorun", "goimports", "gofumpt", "golines"], calls)
+            self.assertEqual(3, len(logs.records))
+
+            artifacts = python_to_go_debug("print(1)")
+            self.assertIn("go/printer", artifacts.compilation_code)
+            self.assertEqual(("package main\n", "package main\n"), (artifacts.code, artifacts.go))
@@ -0,0 +1,77 @@
+"""
+Fails when transpiling an example takes more work than examples/perf_baselines.json says it
+took, by more than PYTAGO_PERF_MARGIN (a fraction, 0.1 by default). Work is measured with
+the deterministic counters of pytago.metrics.count rather than time, so it's the same on
+any machine. The go toolchain and its formatters are stubbed out with processes that
+echo their input back, so they aren't needed, but every time one would be spawned still
+counts towards subprocess_spawns. Each example is a test of its own, so they can be spread
+over processes with pytest-xdist.
+
+After making pytago do more (or less) work on purpose, update the baselines with
+
+    py ./scripts/update_perf_baselines.py
+"""
+import glob
+import json
+import os
+import warnings
+from unittest import TestCase, mock
+
+from pytago import python_to_go
+from pytago.metrics import recording_counts
+
+EXAMPLES_PATH = os.path.join(os.path.dirname(__file__), "..", "..", "examples")
+BASELINES_PATH = os.path.join(EXAMPLES_PATH, "perf_baselines.json")
+MARGIN = float(os.environ.get("PYTAGO_PERF_MARGIN", 0.1))
+
+
+class _EchoProcess:
+    """Stands in for go and the formatters, answering with whatever it's sent"""
+    def __init__(self, args, **kwargs):
+        self.args = args
+
+    def communicate(self, input=None):
+        return input or b"", b""
+
+
+def measure(python: str) -> dict[str, int]:
+    """The counters of transpiling python to Go, with the go toolchain stubbed out"""
+    with recording_counts() as counts, warnings.catch_warnings(), \
+            mock.patch("pytago.go_ast.parsing.Popen", _EchoProcess):
+        warnings.simplefilter("ignore")
+        python_to_go(python)
+    return counts
+
+
+def examples() -> dict[str, str]:
+    found = {}
+    for path in sorted(glob.glob(os.path.join(EXAMPLES_PATH, "*.py"))):
+        with open(path, encoding="utf_8") as f:
+            found[os.path.basename(path)[:-3]] = f.read()
+    return found
+
+
+def baselines() -> dict[str, dict[str, int]]:
+    with open(BASELINES_PATH, encoding="utf_8") as f:
+        return json.load(f)
+
+
+class Test(TestCase):
+    def assert_within_baseline(self, name: str, baseline: dict[str, int]):
+        path = os.path.join(EXAMPLES_PATH, f"{name}.py")
+        self.assertTrue(os.path.exists(path), "example has gone, update the baselines")
+        with open(path, encoding="utf_8") as f:
+            counts = measure(f.read())
+        for counter in baseline.keys() & counts.keys():
+            self.assertLessEqual(counts[counter], baseline[counter] * (1 + MARGIN),
+                                 f"{counter} is over its baseline of {baseline[counter]} by more than {MARGIN:.0%}")
+
+
+def _add_tests():
+    for name, baseline in baselines().items():
+        def test(self, name=name, baseline=baseline):
+            self.assert_within_baseline(name, baseline)
+        setattr(Test, f"test_{name}", test)
+
+
+_add_tests()
@@ -0,0 +1,51 @@
+import os
+import sys
+import tempfile
+import time
+from unittest import TestCase
+
+from pytago import go_ast
+from pytago.go_ast.transformers import BaseTransformer
+from pytago.metrics import stage
+from pytago.sampleprofile import sampling_profile
+
+
+class SampleHere(BaseTransformer):
+    def __init__(self, profile):
+        super().__init__()
+        self.profile = profile
+
+    def visit_Ident(self, node: go_ast.Ident):
+        self.profile.sample(sys._getframe())
+        return node
+
+
+class Test(TestCase):
+    def test_frames_labelled_with_transformer_and_node(self):
+        with sampling_profile(interval=60) as profile:
+            with stage("sampling"):
+                SampleHere(profile).visit(go_ast.ExprStmt(X=go_ast.Ident("x")))
+        [(stack, count)] = profile.samples.items()
+        self.assertEqual(1, count)
+        self.assertEqual("stage:sampling", stack[0])
+        self.assertEqual("SampleHere.visit_Ident[Ident]", stack[-1])
+        # Only visit_ methods' frames are looked into
+        self.assertEqual([stack[-1]], [label for label in stack if "[" in label])
+        self.assertTrue(any(label.endswith(f" (transformers.py:{BaseTransformer._dispatch.__code__.co_firstlineno})")
+                            for label in stack))
+
+    def test_folded_output(self):
+        with sampling_profile(interval=0.001) as profile:
+            with stage("busy"):
+                deadline = time.perf_counter() + 0.1
+                while time.perf_counter() < deadline:
+                    pass
+        self.assertGreater(sum(profile.samples.values()), 0)
+        with tempfile.TemporaryDirectory() as directory:
+            path = os.path.join(directory, "out.folded")
+            profile.write(path)
+            with open(path, encoding="utf_8") as f:
+                lines = f.read().splitlines()
+        stacks = [line.rsplit(" ", 1) for line in lines]
+        self.assertTrue(all(int(count) > 0 for _, count in stacks))
+        self.assertTrue(any(stack.startswith("stage:busy;") for stack, _ in stacks))
@@ -0,0 +1,51 @@
+import io
+import json
+from unittest import TestCase
+
+from pytago.cache import source_key
+from pytago.server import Server, INVALID_PARAMS, METHOD_NOT_FOUND, PARSE_ERROR, PYTHON_SYNTAX_ERROR, \
+    TIMEOUT_ERROR
+
+
+def request(method, request_id=1, **params):
+    return json.dumps({"jsonrpc": "2.0", "id": request_id, "method": method, "params": params})
+
+
+class Test(TestCase):
+    @classmethod
+    def setUpClass(cls):
+        cls.server = Server(workers=1)
+
+    @classmethod
+    def tearDownClass(cls):
+        cls.server.close()
+
+    def call(self, method, **params):
+        return json.loads(self.server.handle_line(request(method, **params)))
+
+    def test_errors(self):
+        self.assertEqual(PARSE_ERROR, json.loads(self.server.handle_line("{"))["error"]["code"])
+        self.assertEqual(METHOD_NOT_FOUND, self.call("nope")["error"]["code"])
+        self.assertEqual(INVALID_PARAMS, self.call("transpile", python="print(1)")["error"]["code"])
+        self.assertEqual(PYTHON_SYNTAX_ERROR, self.call("transpile", py="print(1")["error"]["code"])
+
+    def test_cache_hit(self):
+        self.server.cache.put(source_key("cached = 1"), "// cached")
+        self.assertEqual({"go": "// cached"}, self.call("transpile", py="cached = 1")["result"])
+        results = self.call("transpile_many", sources=["cached = 1", "("])["result"]["results"]
+        self.assertEqual({"go": "// cached"}, results[0])
+        self.assertEqual(PYTHON_SYNTAX_ERROR, results[1]["error"]["code"])
+
+    def test_timeout(self):
+        source = "\n".join(f"def f{i}(a):\n    return [x * {i} for x in range(a)]\n" for i in range(50))
+        response = self.call("transpile", py=source, timeout=0.01)
+        self.assertEqual(TIMEOUT_ERROR, response["error"]["code"])
+        self.assertEqual(PYTHON_SYNTAX_ERROR, self.call("transpile", py="print(1")["error"]["code"])
+        self.assertGreaterEqual(self.call("stats")["result"]["timeouts"], 1)
+
+    def test_serve_stream(self):
+        lines = [request("stats", 1), "", request("shutdown", 2), request("stats", 3)]
+        out = io.StringIO()
+        self.server.serve_stream(io.StringIO("\n".join(lines) + "\n"), out)
+        self.assertEqual([1, 2], [json.loads(line)["id"] for line in out.getvalue().splitlines()])
+
@@ -0,0 +1,69 @@
+import ast
+import os
+import shutil
+import subprocess
+import sys
+import tempfile
+import warnings
+from unittest import TestCase
+
+from pytago.core import python_to_compilation_code, python_to_go
+from pytago.synthetic import CONSTRUCTS, generate, generate_lines
+
+# Everything python_to_go needs, so that the Go can be run too
+HAVE_GO = all(shutil.which(tool) for tool in ("go", "goimports", "gofumpt", "golines"))
+
+
+def max_depth(node: ast.AST, depth: int = 0) -> int:
+    blocks = (ast.For, ast.While, ast.If, ast.Try, ast.With)
+    return max([max_depth(child, depth + isinstance(child, blocks)) for child in ast.iter_child_nodes(node)],
+               default=depth)
+
+
+class Test(TestCase):
+    def test_deterministic(self):
+        self.assertEqual(generate(seed=3), generate(seed=3))
+        self.assertNotEqual(generate(seed=3), generate(seed=4))
+
+    def test_shape(self):
+        tree = ast.parse(generate(functions=7, depth=3, locals_per_function=5, constructs=("loop",)))
+        functions = [x for x in tree.body if isinstance(x, ast.FunctionDef) and x.name.startswith("f")]
+        self.assertEqual(7, len(functions))
+        self.assertEqual({f"v{i}" for i in range(5)},
+                         {x.id for x in ast.walk(functions[0]) if isinstance(x, ast.Name) and x.id.startswith("v")})
+        self.assertEqual(3, max(max_depth(f) for f in functions))
+        calls = generate(functions=7, call_density=1.0, constructs=("loop",))
+        self.assertIn("f5(n - 1)", calls)
+        self.assertNotIn("(n - 1)", generate(functions=7, call_density=0.0))
+        self.assertEqual(["print(f0(2))", "print(f1(2))"],
+                         [line.strip() for line in generate(functions=7, constructs=("loop",), main_calls=2).splitlines()
+                          if line.strip().startswith("print(f")])
+
+    def test_generate_lines(self):
+        for lines in (200, 800):
+            self.assertAlmostEqual(lines, generate_lines(lines).count("\n"), delta=lines * 0.2)
+
+    def test_every_construct_runs_and_transpiles(self):
+        """Each construct runs, and if the go toolchain is installed, its Go prints the same thing"""
+        for construct in CONSTRUCTS + ("all",):
+            with self.subTest(construct), tempfile.TemporaryDirectory() as directory:
+                python = generate(functions=3, depth=2, call_density=0.5, seed=1,
+                                  constructs=None if construct == "all" else (construct,))
+                path = os.path.join(directory, "synthetic.py")
+                with open(path, "w") as f:
+                    f.write(python)
+                result = subprocess.run([sys.executable, path], cwd=directory, capture_output=True, text=True,
+                                        timeout=60)
+                self.assertEqual(0, result.returncode, result.stderr)
+                with warnings.catch_warnings():
+                    warnings.simplefilter("ignore")
+                    if not HAVE_GO:
+                        self.assertIn('"f2"', python_to_compilation_code(python))
+                        continue
+                    go = python_to_go(python)
+                with open(os.path.join(directory, "main.go"), "w") as f:
+                    f.write(go)
+                go_result = subprocess.run(["go", "run", "main.go"], cwd=directory, capture_output=True, text=True,
+                                           timeout=120)
+                self.assertEqual(0, go_result.returncode, go_result.stderr)
+                self.assertEqual(result.stdout, go_result.stdout)
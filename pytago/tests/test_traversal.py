@@ -0,0 +1,99 @@
+import sys
+import warnings
+from unittest import TestCase
+
+from pytago.core import python_to_compilation_code
+from pytago.go_ast import BinaryExpr, BlockStmt, ExprStmt, Ident, token, dump
+from pytago.go_ast.core import _find_nodes
+from pytago.go_ast.transformers import BaseTransformer, InterfaceTypeCounter
+
+# Comfortably past the default recursion limit
+DEPTH = sys.getrecursionlimit() * 5
+
+
+def deep_expr(depth: int) -> BinaryExpr:
+    expr = Ident("x")
+    for _ in range(depth):
+        expr = BinaryExpr(X=expr, Op=token.ADD, Y=Ident("y"))
+    return expr
+
+
+class RenameY(BaseTransformer):
+    def visit_Ident(self, node: Ident):
+        if node.Name == "y":
+            node.Name = "z"
+        return node
+
+
+class CountAdditions(BaseTransformer):
+    """A visit_BinaryExpr that runs on the stack of whatever visits it, as the real ones do"""
+    additions = 0
+
+    def visit_BinaryExpr(self, node: BinaryExpr):
+        yield from self._generic_visit_steps(node)
+        self.additions += node.Op == token.ADD
+        return node
+
+
+class RewriteY(BaseTransformer):
+    """Replaces y, removes statements of just y and splices in two statements for each z"""
+    def visit_ExprStmt(self, node: ExprStmt):
+        match node.X:
+            case Ident(Name="y"):
+                return None
+            case Ident(Name="z"):
+                return [node, ExprStmt(X=Ident("zz"))]
+        return self.generic_visit(node)
+
+    def visit_Ident(self, node: Ident):
+        return Ident("w") if node.Name == "y" else node
+
+
+class Test(TestCase):
+    def test_dump_deep_tree(self):
+        dumped = dump(deep_expr(DEPTH))
+        self.assertEqual(DEPTH, dumped.count("&ast.BinaryExpr"))
+
+    def test_find_nodes_deep_tree(self):
+        found = _find_nodes(deep_expr(DEPTH), lambda x: x if isinstance(x, Ident) else None)
+        self.assertEqual(DEPTH + 1, len(found))
+
+    def test_transform_deep_tree(self):
+        tree = RenameY().visit(deep_expr(DEPTH))
+        names = _find_nodes(tree, lambda x: getattr(x, "Name", None))
+        self.assertEqual(DEPTH, names.count("z"))
+        self.assertNotIn("y", names)
+
+    def test_generator_visits_deep_tree(self):
+        transformer = CountAdditions()
+        transformer.visit(deep_expr(DEPTH))
+        self.assertEqual(DEPTH, transformer.additions)
+
+    def test_transpile_deep_expression(self):
+        # Goes through every transformer with a visit_BinaryExpr
+        python = "def main():\n    x = " + " + ".join(["1"] * 250) + "\n    print(x)\n"
+        with warnings.catch_warnings():
+            warnings.simplefilter("ignore")
+            code = python_to_compilation_code(python)
+        self.assertEqual(249, code.count("&ast.BinaryExpr"))
+
+    def test_contains_deep_tree(self):
+        tree = deep_expr(DEPTH)
+        self.assertIn(Ident("x"), tree)
+        self.assertEqual(0, InterfaceTypeCounter.get_interface_count(tree))
+
+    def test_rewrites_counted(self):
+        transformer = RenameY()
+        transformer.visit(deep_expr(10))
+        # Renamed in place, which only recording_rewrites tells apart from doing nothing
+        self.assertEqual(0, transformer.rewrites)
+
+        block = BlockStmt(List=[ExprStmt(X=Ident(name)) for name in ("x", "y", "z")] + [ExprStmt(X=deep_expr(3))])
+        transformer = RewriteY()
+        transformer.visit(block)
+        self.assertEqual(["x", "z", "zz"], [stmt.X.Name for stmt in block.List[:3]])
+        self.assertEqual(2 + 3, transformer.rewrites)
+
+        transformer = RewriteY()
+        transformer.visit(block)
+        self.assertEqual(1, transformer.rewrites)  # Only the z
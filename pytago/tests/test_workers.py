@@ -0,0 +1,67 @@
+import os
+import threading
+import time
+from unittest import TestCase, mock
+
+from pytago.workers import PoolSaturated, TranspileCancelled, TranspileTimeout, WorkerPool, WorkerStartupFailed
+
+# Takes a few seconds to transform, well before the go toolchain gets involved
+SLOW = "\n".join(f"def f{i}(a):\n    return [x * {i} for x in range(a)]\n" for i in range(300))
+
+
+def _crash(conn, warmup):
+    os._exit(1)
+
+
+class Test(TestCase):
+    def test_admission_control(self):
+        with WorkerPool(1, max_queue=1) as pool:
+            self.assertTrue(pool.ready.wait(30))
+            outcomes = []
+
+            def slow():
+                try:
+                    pool.transpile(SLOW, timeout=3)
+                except Exception as e:
+                    outcomes.append(type(e))
+
+            busy = [threading.Thread(target=slow) for _ in range(2)]
+            for thread in busy:
+                thread.start()
+                time.sleep(0.2)
+            self.assertEqual(1, pool.queue_depth)
+            with self.assertRaises(PoolSaturated):
+                pool.transpile("print(1)")
+            self.assertEqual(1, pool.rejections)
+            for thread in busy:
+                thread.join()
+            # The first one timed out, and so did the one queued behind it
+            self.assertEqual([TranspileTimeout, TranspileTimeout], outcomes)
+            with self.assertRaises(SyntaxError):
+                pool.transpile("print(1", timeout=10)
+
+    def test_warmup(self):
+        with self.assertLogs("pytago", "WARNING") as logs, WorkerPool(1, warmup=["print(1"]) as pool:
+            self.assertTrue(pool.ready.wait(30))
+        self.assertIn("SyntaxError", logs.output[0])
+
+    def test_cancel(self):
+        with WorkerPool(1) as pool:
+            cancel = threading.Event()
+            threading.Timer(0.5, cancel.set).start()
+            start = time.monotonic()
+            with self.assertRaises(TranspileCancelled):
+                pool.transpile(SLOW, cancel=cancel)
+            self.assertLess(time.monotonic() - start, 2)
+            self.assertEqual(1, pool.counters()["cancellations"])
+            with self.assertRaises(SyntaxError):
+                pool.transpile("print(1", timeout=10)
+
+    def test_startup_crashes(self):
+        with self.assertLogs("pytago", "ERROR"), mock.patch("pytago.workers._worker_main", _crash), \
+                WorkerPool(1) as pool:
+            with self.assertRaises(WorkerStartupFailed):
+                pool.wait_ready(30)
+            self.assertEqual(3, pool.counters()["crashes"])
+            with self.assertRaises(WorkerStartupFailed):
+                pool.transpile("print(1)", timeout=10)
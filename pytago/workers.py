@@ -0,0 +1,290 @@
+"""
+A pool of long-lived transpiler processes.
+
+Each worker imports pytago once and then transpiles one program at a time. A
+transpilation that runs past its timeout has its worker killed, along with any
+Go toolchain processes it started, and a fresh worker takes its place. Time
+spent waiting for a free worker counts toward the timeout, and if max_queue
+callers are already waiting, new ones are turned away right away.
+
+A transpilation can also be cancelled, e.g. because its result is no longer
+wanted, which kills its worker the same way.
+
+Workers transpile a warm-up corpus before taking any work, so that imports,
+snippet registration and go's build cache are all warm by the first request. If
+they keep dying before they get through it, the pool gives up with
+WorkerStartupFailed rather than replacing them forever.
+"""
+import logging
+import multiprocessing
+import os
+import queue
+import signal
+import threading
+import time
+from typing import Callable, Optional, Sequence
+
+from pytago.core import python_to_go
+from pytago.metrics import recording_stages
+
+logger = logging.getLogger("pytago")
+
+
+class TranspileTimeout(Exception):
+    pass
+
+
+class WorkerCrashed(Exception):
+    pass
+
+
+class PoolSaturated(Exception):
+    pass
+
+
+class TranspileCancelled(Exception):
+    pass
+
+
+class WorkerStartupFailed(Exception):
+    pass
+
+
+# Seconds between checks of a cancellable transpilation's cancel event
+_CANCEL_POLL_INTERVAL = 0.05
+# How many times over each of a pool's workers may die in a row before finishing its warm-up
+# before the pool stops replacing them
+_STARTUP_ATTEMPTS = 3
+
+
+def _worker_main(conn, warmup: tuple[str, ...]):
+    if hasattr(os, "setpgrp"):
+        # Lead our own process group so that a timeout can take the go toolchain down with us
+        os.setpgrp()
+    warmup_errors = []
+    for python in warmup:
+        try:
+            python_to_go(python)
+        except Exception as e:
+            warmup_errors.append(f"{type(e).__name__}: {e}")
+    conn.send(warmup_errors)
+    while True:
+        try:
+            python, debug = conn.recv()
+        except EOFError:
+            return
+        with recording_stages() as stages:
+            try:
+                ok, result = True, python_to_go(python, debug=debug)
+            except Exception as e:
+                ok, result = False, e if _picklable(e) else RuntimeError(f"{type(e).__name__}: {e}")
+        conn.send((ok, result, stages))
+
+
+def _picklable(e: Exception) -> bool:
+    try:
+        multiprocessing.reduction.ForkingPickler.dumps(e)
+    except Exception:
+        return False
+    return True
+
+
+class _Worker:
+    def __init__(self, ctx, warmup: tuple[str, ...]):
+        self.conn, child_conn = ctx.Pipe()
+        self.process = ctx.Process(target=_worker_main, args=(child_conn, warmup), daemon=True)
+        self.process.start()
+        child_conn.close()
+
+    def kill(self):
+        self.conn.close()
+        if hasattr(os, "killpg"):
+            try:
+                os.killpg(self.process.pid, signal.SIGKILL)
+            except (ProcessLookupError, PermissionError):
+                pass
+        self.process.kill()
+        self.process.join()
+
+
+class WorkerPool:
+    def __init__(self, size: Optional[int] = None, max_queue: Optional[int] = None,
+                 on_stages: Optional[Callable[[dict[str, float]], None]] = None, warmup: Sequence[str] = ()):
+        self.size = size or os.cpu_count() or 1
+        self.warmup = tuple(warmup)
+        # Set once the first size workers have finished warming up
+        self.ready = threading.Event()
+        self.max_queue = max_queue
+        # Called with the seconds each stage took after every transpilation, failed or not
+        self.on_stages = on_stages
+        self.timeouts = 0
+        self.crashes = 0
+        self.rejections = 0
+        self.cancellations = 0
+        # Set if workers kept dying during their warm-up, after which there are none
+        self.startup_error: Optional[WorkerStartupFailed] = None
+        self._startup_crashes = 0
+        self._waiting = 0
+        self._ctx = multiprocessing.get_context("spawn")
+        self._idle = queue.Queue()
+        self._workers = set()
+        self._lock = threading.Lock()
+        self._closed = False
+        self._warming = self.size
+        for _ in range(self.size):
+            self._spawn()
+
+    def _spawn(self):
+        worker = _Worker(self._ctx, self.warmup)
+        with self._lock:
+            self._workers.add(worker)
+        threading.Thread(target=self._await_warmup, args=(worker,), daemon=True).start()
+
+    def _await_warmup(self, worker: _Worker):
+        try:
+            warmup_errors = worker.conn.recv()
+        except (EOFError, OSError):
+            with self._lock:
+                self.crashes += 1
+                self._startup_crashes += 1
+                give_up = self._startup_crashes >= self.size * _STARTUP_ATTEMPTS
+            if give_up:
+                self._give_up(worker)
+            else:
+                self._replace(worker)
+            return
+        for error in warmup_errors:
+            logger.warning("Warm-up transpilation failed: %s", error)
+        self._idle.put(worker)
+        with self._lock:
+            self._startup_crashes = 0
+            if self._warming:
+                self._warming -= 1
+                if not self._warming:
+                    self.ready.set()
+
+    def _give_up(self, worker: _Worker):
+        worker.kill()
+        with self._lock:
+            self._workers.discard(worker)
+            if self.startup_error is not None:
+                return
+            self.startup_error = WorkerStartupFailed(
+                f"transpiler workers died before finishing their warm-up {self._startup_crashes} times in a row")
+        logger.error("%s; not starting any more", self.startup_error)
+        # Wakes up everything waiting for a worker, which will find there won't be one
+        self._idle.put(None)
+
+    def wait_ready(self, timeout: Optional[float] = None) -> bool:
+        """Wait for ready, raising startup_error if the pool gives up first"""
+        deadline = None if timeout is None else time.monotonic() + timeout
+        while not self.ready.wait(_CANCEL_POLL_INTERVAL):
+            if self.startup_error is not None:
+                raise self.startup_error
+            if deadline is not None and time.monotonic() >= deadline:
+                return False
+        return True
+
+    def _replace(self, worker: _Worker):
+        worker.kill()
+        with self._lock:
+            self._workers.discard(worker)
+            closed = self._closed
+        if not closed:
+            self._spawn()
+
+    def transpile(self, python: str, debug=False, timeout: Optional[float] = None,
+                  cancel: Optional[threading.Event] = None) -> str:
+        """
+        Transpile python in the next free worker, waiting for one if they're all busy.
+        Exceptions raised by python_to_go are raised here. Raises PoolSaturated if the
+        queue is full, TranspileTimeout if the deadline passes and TranspileCancelled if
+        cancel gets set first.
+        """
+        deadline = None if timeout is None else time.monotonic() + timeout
+        with self._lock:
+            if self.max_queue is not None and self._waiting - self._idle.qsize() >= self.max_queue:
+                self.rejections += 1
+                raise PoolSaturated(f"{self.queue_depth} transpilations are already waiting for a worker")
+            self._waiting += 1
+        try:
+            while True:
+                self._check(deadline, cancel, f"no worker became free within {timeout} seconds")
+                try:
+                    worker = self._idle.get(timeout=self._wait_slice(deadline, cancel))
+                except queue.Empty:
+                    continue
+                if worker is None:
+                    self._idle.put(None)
+                    raise self.startup_error
+                break
+        finally:
+            with self._lock:
+                self._waiting -= 1
+        try:
+            worker.conn.send((python, debug))
+            while not worker.conn.poll(self._wait_slice(deadline, cancel)):
+                try:
+                    self._check(deadline, cancel, f"transpilation took longer than {timeout} seconds")
+                except (TranspileTimeout, TranspileCancelled):
+                    self._replace(worker)
+                    raise
+            ok, result, stages = worker.conn.recv()
+        except (EOFError, OSError) as e:
+            with self._lock:
+                self.crashes += 1
+            self._replace(worker)
+            raise WorkerCrashed(f"worker exited unexpectedly: {e!r}")
+        self._idle.put(worker)
+        if self.on_stages is not None:
+            self.on_stages(stages)
+        if not ok:
+            raise result
+        return result
+
+    def _check(self, deadline: Optional[float], cancel: Optional[threading.Event], timeout_message: str):
+        if cancel is not None and cancel.is_set():
+            with self._lock:
+                self.cancellations += 1
+            raise TranspileCancelled("transpilation was cancelled")
+        if deadline is not None and time.monotonic() >= deadline:
+            with self._lock:
+                self.timeouts += 1
+            raise TranspileTimeout(timeout_message)
+
+    @staticmethod
+    def _wait_slice(deadline: Optional[float], cancel: Optional[threading.Event]) -> Optional[float]:
+        """How long to block for before checking the deadline and cancel again"""
+        remaining = None if deadline is None else max(0.0, deadline - time.monotonic())
+        if cancel is None:
+            return remaining
+        return _CANCEL_POLL_INTERVAL if remaining is None else min(remaining, _CANCEL_POLL_INTERVAL)
+
+    def counters(self) -> dict[str, int]:
+        """The rejections, timeouts, crashes and cancellations so far, read together"""
+        with self._lock:
+            return {"rejections": self.rejections, "timeouts": self.timeouts, "crashes": self.crashes,
+                    "cancellations": self.cancellations}
+
+    @property
+    def idle(self) -> int:
+        return self._idle.qsize()
+
+    @property
+    def queue_depth(self) -> int:
+        """The number of callers waiting for a worker"""
+        return max(0, self._waiting - self._idle.qsize())
+
+    def close(self):
+        with self._lock:
+            self._closed = True
+            workers = list(self._workers)
+            self._workers.clear()
+        for worker in workers:
+            worker.kill()
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, *exc_info):
+        self.close()
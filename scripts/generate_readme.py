@@ -38,7 +38,7 @@ def main():
             return -1, 0 if ext == "py" else 1
 
 
-    examples = glob.glob(EXAMPLES_PATH + "/*")
+    examples = [path for path in glob.glob(EXAMPLES_PATH + "/*") if path.endswith((".py", ".go"))]
     examples.sort(key=example_sort_key)
 
     # It's assumed that Python examples appear then Go examples
@@ -0,0 +1,176 @@
+"""
+Load test the web app, comparing how many transpilations per second each server answers.
+
+Against servers that are already running:
+
+    py ./scripts/load_test.py http://127.0.0.1:8080 http://127.0.0.1:8081
+
+Or let it start the gunicorn setup from the Dockerfile and the uvicorn one side by side:
+
+    py ./scripts/load_test.py --start
+
+Each client keeps POSTing examples/*.py for --duration seconds. Every request gets a
+comment with a fresh number appended so that the result cache can't answer it,
+unless --cached is given.
+"""
+import argparse
+import glob
+import http.client
+import itertools
+import json
+import os
+import socket
+import statistics
+import subprocess
+import sys
+import threading
+import time
+import urllib.parse
+import urllib.request
+
+rel = "" if os.getcwd().endswith("scripts") else "./scripts/"
+EXAMPLES_PATH = rel + "../examples"
+ROOT = os.path.abspath(rel + "..")
+
+
+def load_corpus() -> list[str]:
+    corpus = []
+    for path in sorted(glob.glob(os.path.join(EXAMPLES_PATH, "*.py"))):
+        with open(path, encoding="utf_8") as f:
+            corpus.append(f.read())
+    return corpus
+
+
+def run(url: str, corpus: list[str], concurrency: int, duration: float, cached: bool) -> dict:
+    parts = urllib.parse.urlsplit(url)
+    counter = itertools.count()
+    latencies = []
+    statuses = {}
+    lock = threading.Lock()
+    deadline = time.monotonic() + duration
+
+    def client():
+        conn = http.client.HTTPConnection(parts.hostname, parts.port or 80, timeout=120)
+        while time.monotonic() < deadline:
+            n = next(counter)
+            py = corpus[n % len(corpus)]
+            if not cached:
+                py += f"\n# {n}\n"
+            start = time.perf_counter()
+            try:
+                conn.request("POST", parts.path or "/", json.dumps({"py": py}),
+                             {"Content-Type": "application/json"})
+                response = conn.getresponse()
+                response.read()
+                status = response.status
+            except (OSError, http.client.HTTPException) as e:
+                conn.close()
+                conn = http.client.HTTPConnection(parts.hostname, parts.port or 80, timeout=120)
+                status = type(e).__name__
+            with lock:
+                latencies.append(time.perf_counter() - start)
+                statuses[status] = statuses.get(status, 0) + 1
+        conn.close()
+
+    clients = [threading.Thread(target=client) for _ in range(concurrency)]
+    started = time.perf_counter()
+    for thread in clients:
+        thread.start()
+    for thread in clients:
+        thread.join()
+    elapsed = time.perf_counter() - started
+
+    latencies.sort()
+    return {
+        "url": url,
+        "requests": len(latencies),
+        "ok": statuses.get(200, 0),
+        "statuses": statuses,
+        "throughput": statuses.get(200, 0) / elapsed,
+        "p50": statistics.median(latencies) if latencies else None,
+        "p99": latencies[int(len(latencies) * 0.99)] if latencies else None,
+    }
+
+
+def free_port() -> int:
+    with socket.socket() as s:
+        s.bind(("127.0.0.1", 0))
+        return s.getsockname()[1]
+
+
+def start_servers(workers: int) -> list[tuple[str, subprocess.Popen]]:
+    env = {**os.environ, "PYTAGO_WARMUP": os.path.join(ROOT, "examples", "helloworld.py")}
+    if workers:
+        env["PYTAGO_WORKERS"] = str(workers)
+    gunicorn_port, uvicorn_port = free_port(), free_port()
+    commands = {
+        f"http://127.0.0.1:{gunicorn_port}/": [
+            sys.executable, "-m", "gunicorn", "--config", "python:pytago.gunicorn_conf", "--bind",
+            f"127.0.0.1:{gunicorn_port}", "--workers", "1", "--threads", "8", "--timeout", "0", "pytago.app:app"],
+        f"http://127.0.0.1:{uvicorn_port}/": [
+            sys.executable, "-m", "uvicorn", "--host", "127.0.0.1", "--port", str(uvicorn_port), "--workers", "1",
+            "--log-level", "warning", "pytago.asgi:app"],
+    }
+    servers = [(url, subprocess.Popen(command, cwd=ROOT, env=env)) for url, command in commands.items()]
+    try:
+        for url, process in servers:
+            wait_until_healthy(url, process)
+    except BaseException:
+        stop_servers(servers)
+        raise
+    return servers
+
+
+def stop_servers(servers: list[tuple[str, subprocess.Popen]]):
+    for _, process in servers:
+        process.terminate()
+        process.wait()
+
+
+def wait_until_healthy(url: str, process: subprocess.Popen, timeout: float = 120):
+    deadline = time.monotonic() + timeout
+    while time.monotonic() < deadline:
+        if process.poll() is not None:
+            raise RuntimeError(f"the server for {url} exited with {process.returncode}")
+        try:
+            with urllib.request.urlopen(url + "healthz", timeout=5):
+                return
+        except OSError:
+            time.sleep(0.5)
+    raise RuntimeError(f"{url} wasn't healthy after {timeout} seconds")
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Compare the throughput of pytago web servers")
+    parser.add_argument("urls", nargs="*", help="servers to load test, one after another")
+    parser.add_argument("--start", action="store_true", help="start gunicorn and uvicorn servers to compare")
+    parser.add_argument("-c", "--concurrency", type=int, default=64, help="clients sending requests at once")
+    parser.add_argument("-d", "--duration", type=float, default=30, help="seconds to load each server for")
+    parser.add_argument("-w", "--workers", type=int, default=0, help="PYTAGO_WORKERS for started servers")
+    parser.add_argument("--cached", action="store_true", help="resend the same sources, so the cache answers")
+    parser.add_argument("--json", action="store_true", help="print the results as JSON")
+    args = parser.parse_args()
+    if not args.urls and not args.start:
+        parser.error("give some URLs or --start")
+
+    corpus = load_corpus()
+    servers = start_servers(args.workers) if args.start else []
+    try:
+        results = [run(url, corpus, args.concurrency, args.duration, args.cached)
+                   for url in args.urls or [url for url, _ in servers]]
+    finally:
+        stop_servers(servers)
+
+    if args.json:
+        print(json.dumps(results, indent=2))
+        return
+    print(f"{'server':<32} {'requests':>9} {'ok':>7} {'req/s':>8} {'p50 (s)':>8} {'p99 (s)':>8}")
+    for result in results:
+        print(f"{result['url']:<32} {result['requests']:>9} {result['ok']:>7} {result['throughput']:>8.2f} "
+              f"{result['p50'] or 0:>8.3f} {result['p99'] or 0:>8.3f}")
+        if set(result["statuses"]) != {200}:
+            print(f"{'':<32} statuses: {result['statuses']}")
+
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,30 @@
+"""
+Record how much work transpiling each example takes, for pytago/tests/test_perf.py.
+
+Examples that fail to transpile are left out.
+"""
+import json
+import os
+import sys
+
+rel = "" if os.getcwd().endswith("scripts") else "./scripts/"
+sys.path.insert(0, os.path.abspath(rel + ".."))
+
+from pytago.tests.test_perf import BASELINES_PATH, examples, measure
+
+
+def main():
+    baselines = {}
+    for name, python in examples().items():
+        try:
+            baselines[name] = dict(sorted(measure(python).items()))
+        except Exception as e:
+            print(f"{name}: left out, {type(e).__name__}: {e}")
+    with open(BASELINES_PATH, "w", encoding="utf_8") as f:
+        json.dump(baselines, f, indent=2)
+        f.write("\n")
+    print(f"wrote {os.path.normpath(BASELINES_PATH)}")
+
+
+if __name__ == '__main__':
+    main()
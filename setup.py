@@ -1,11 +1,15 @@
+import re
 from distutils.core import setup
 
 with open('README.md', encoding='utf-8') as f:
     long_description = f.read()
 
+with open('pytago/__init__.py', encoding='utf-8') as f:
+    version = re.search(r"__version__ = '([^']+)'", f.read()).group(1)
+
 setup(
     name='pytago',
-    version='0.0.12',
+    version=version,
     packages=['pytago', 'pytago.go_ast'],
     url='https://github.com/nottheswimmer/pytago',
     license='',